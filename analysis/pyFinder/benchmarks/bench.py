@@ -0,0 +1,174 @@
+"""Throughput benchmark of the crawler and the scanner against local fake services (see fakes.py).
+
+Usage:
+  bench.py [--images=<500>] [--scan-images=<200>] [--known=<0.5>] [--concurrency=<4>] [--batch] [--latency=<0.002>] [--pull-seconds=<1.0>] [--probe-seconds=<0.005>] [--hub-rate=<1000>] [--baseline=<PATH>] [--save-baseline] [--tolerance=<0.2>]
+  bench.py (-h | --help)
+
+Options:
+  -h --help              Show this screen.
+  --images=N             Images of the fake Docker Hub crawled by the crawler [default: 500]
+  --scan-images=N        Images processed by the scanner [default: 200]
+  --known=FRACTION       Fraction of the images already scanned with the same digest (skipped) [default: 0.5]
+  --concurrency=N        Images scanned in parallel [default: 4]
+  --batch                Run all the probes of an image in a single container.
+  --latency=SEC          Latency of every request to the fake services [default: 0.002]
+  --pull-seconds=SEC     Seconds to pull 1 GB in the fake daemon [default: 1.0]
+  --probe-seconds=SEC    Seconds of a command in the fake daemon [default: 0.005]
+  --hub-rate=RATE        Max requests per second to the fake Docker Hub of the crawler and of the scanner [default: 1000]
+  --baseline=PATH        Results to compare with [default: benchmarks/baseline.json]
+  --save-baseline        Save the results as the new baseline.
+  --tolerance=FRACTION   Max worsening with respect to the baseline, then the exit code is 1 [default: 0.2]
+"""
+import collections
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from docopt import docopt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pyfinder import Crawler, Scanner, metrics
+from benchmarks.fakes import Dataset, FakeServices, FakeDaemon, image_name
+
+
+class Samples:
+    """The values observed by a histogram of the metrics, by label (the histogram keeps only the buckets)."""
+
+    def __init__(self, histogram, label):
+        self.values = collections.defaultdict(list)
+        observe = histogram.observe
+
+        def record(value, **labels):
+            self.values[labels[label]].append(value)
+            observe(value, **labels)
+        histogram.observe = record
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of the values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100.0 * len(ordered) + 0.5)) - 1))]
+
+
+def summary(values):
+    return {'count': len(values), 'p50': percentile(values, 50), 'p90': percentile(values, 90),
+            'p99': percentile(values, 99), 'total': sum(values)}
+
+
+def bench_crawler(services, num_images, hub_rate):
+    crawler = Crawler(hub_url=services.hub_url, hub_rate=hub_rate, max_priority=10)
+    start = time.monotonic()
+    sent = sum(1 for _ in crawler.crawl(from_page=1, page_size=100, max_images=num_images))
+    elapsed = time.monotonic() - start
+    return {'images': sent, 'seconds': elapsed, 'images_per_second': sent / elapsed}
+
+
+def bench_scanner(services, dataset, args):
+    num_images = int(args['--scan-images'])
+    known = int(num_images * float(args['--known']))
+    for index in range(known):
+        services.services.add_scanned(image_name(index))
+    scanner = Scanner(exchange="dofinder", queue="images", route_key="images.scan",
+                      software_url=services.software_url, images_url=services.images_url,
+                      hub_url=services.hub_url, registry_url=services.registry_url,
+                      rmi=True, batch=args['--batch'], concurrency=int(args['--concurrency']))
+    scanner.client_hub.throttle.limiter.rate = scanner.client_hub.throttle.max_rate = float(args['--hub-rate'])
+    scanner.client_daemon = FakeDaemon(dataset, pull_seconds=float(args['--pull-seconds']),
+                                       probe_seconds=float(args['--probe-seconds']))
+    phases = Samples(metrics.SCAN_PHASE_SECONDS, "phase")
+    probes = Samples(metrics.PROBE_SECONDS, "software")
+    latencies = []
+
+    def process(repo_name):
+        start = time.monotonic()
+        scanner.process_repo_name(repo_name)
+        latencies.append(time.monotonic() - start)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=int(args['--concurrency'])) as executor:
+        list(executor.map(process, [image_name(index) for index in range(num_images)]))
+    scanner.client_images.close()
+    elapsed = time.monotonic() - start
+    scanned = len([name for name in services.services.images if services.services.images[name].get('softwares')
+                   is not None])
+    return {'images': num_images, 'scanned': scanned, 'seconds': elapsed,
+            'images_per_minute': num_images * 60.0 / elapsed,
+            'image_latency': summary(latencies),
+            'phases': {phase: summary(values) for phase, values in sorted(phases.values.items())},
+            'probes': {software: summary(values) for software, values in sorted(probes.values.items())}}
+
+
+def report(results):
+    crawler, scanner = results['crawler'], results['scanner']
+    print("crawler: {0} images in {1:.2f}s, {2:.0f} images/s".format(crawler['images'], crawler['seconds'],
+                                                                     crawler['images_per_second']))
+    print("scanner: {0} images ({1} scanned) in {2:.2f}s, {3:.0f} images/min".format(
+        scanner['images'], scanner['scanned'], scanner['seconds'], scanner['images_per_minute']))
+    print("{0:<24}{1:>8}{2:>10}{3:>10}{4:>10}{5:>10}".format("seconds", "count", "p50", "p90", "p99", "total"))
+    rows = [("image", scanner['image_latency'])] + \
+           [("phase " + phase, values) for phase, values in scanner['phases'].items()] + \
+           [("probe " + software, values) for software, values in scanner['probes'].items()]
+    for name, values in rows:
+        print("{0:<24}{1:>8}{2:>10.4f}{3:>10.4f}{4:>10.4f}{5:>10.2f}".format(name, values['count'], values['p50'],
+                                                                             values['p90'], values['p99'],
+                                                                             values['total']))
+
+
+def compare(results, baseline, tolerance):
+    """:return: the list of the regressions with respect to the baseline"""
+    if baseline['params'] != results['params']:
+        print("The baseline has been measured with different parameters: " + json.dumps(baseline['params']))
+        return []
+    checks = [("crawler images/s", results['crawler']['images_per_second'],
+               baseline['crawler']['images_per_second'], True),
+              ("scanner images/min", results['scanner']['images_per_minute'],
+               baseline['scanner']['images_per_minute'], True),
+              ("scanner image p90", results['scanner']['image_latency']['p90'],
+               baseline['scanner']['image_latency']['p90'], False)]
+    regressions = []
+    for name, value, reference, higher_is_better in checks:
+        change = (value - reference) / reference if reference else 0.0
+        worse = -change if higher_is_better else change
+        print("{0:<24}{1:>12.4f}{2:>12.4f}{3:>+9.1%}{4}".format(name, value, reference, change,
+                                                              "  REGRESSION" if worse > tolerance else ""))
+        if worse > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    args = docopt(__doc__)
+    logging.disable(logging.INFO)   # the log lines of every image are not part of the benchmark
+    params = {name.lstrip("-"): args[name] for name in ('--images', '--scan-images', '--known', '--concurrency',
+                                                       '--batch', '--latency', '--pull-seconds', '--probe-seconds',
+                                                       '--hub-rate')}
+    dataset = Dataset(max(int(args['--images']), int(args['--scan-images'])))
+    services = FakeServices(dataset, latency=float(args['--latency']))
+    try:
+        results = {'params': params,
+                   'crawler': bench_crawler(services, int(args['--images']), float(args['--hub-rate'])),
+                   'scanner': bench_scanner(services, dataset, args)}
+    finally:
+        services.close()
+    report(results)
+    status = 0
+    if os.path.exists(args['--baseline']):
+        with open(args['--baseline']) as f:
+            regressions = compare(results, json.load(f), float(args['--tolerance']))
+        if regressions:
+            print("Regressions: " + ", ".join(regressions))
+            status = 1
+    else:
+        print("No baseline in " + args['--baseline'] + " (run with --save-baseline)")
+    if args['--save-baseline']:
+        with open(args['--baseline'], "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print("Baseline saved in " + args['--baseline'])
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
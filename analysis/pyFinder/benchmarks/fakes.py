@@ -0,0 +1,295 @@
+"""
+Local stand-ins of the services used by the crawler and the scanner: a single HTTP server that answers as the
+Docker Hub (/hub), the registry API v2 (/registry), the images service (/api/images) and the software service
+(/api/software), and a docker daemon that runs no container.
+The responses have the same shape of the ones recorded from the real services, the latencies are simulated.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from pyfinder import ClientDaemon
+
+SOFTWARE = [
+    {'name': "python", 'cmd': "--version", 'regex': "[0-9]+[.][0-9]*[0-9a-zA-Z_.-]*"},
+    {'name': "java", 'cmd': "-version", 'regex': "[0-9]+[.][0-9]*[0-9a-zA-Z_.-]*"},
+    {'name': "curl", 'cmd': "--version", 'regex': "[0-9]+[.][0-9]*[0-9a-zA-Z_.-]*"},
+    {'name': "nano", 'cmd': "--version", 'regex': "[0-9]+[.][0-9]*[0-9a-zA-Z_.-]*"},
+    {'name': "node", 'cmd': "--version", 'regex': "[0-9]+[.][0-9]*[0-9a-zA-Z_.-]*"},
+    {'name': "ruby", 'cmd': "--version", 'regex': "[0-9]+[.][0-9]*[0-9a-zA-Z_.-]*"},
+    {'name': "perl", 'cmd': "-v", 'regex': "[0-9]+[.][0-9]*[0-9a-zA-Z_.-]*"},
+    {'name': "wget", 'cmd': "--version", 'regex': "[0-9]+[.][0-9]*[0-9a-zA-Z_.-]*"},
+]
+
+
+def image_name(index):
+    return "bench/image-{0}".format(index)
+
+
+def image_digest(repo_name):
+    return "sha256:" + hashlib.sha256(repo_name.encode()).hexdigest()
+
+
+class Dataset:
+    """The images of the fake Docker Hub: the same seed gives the same images."""
+
+    def __init__(self, num_images, seed=0):
+        rnd = random.Random(seed)
+        self.images = []
+        for index in range(num_images):
+            self.images.append({
+                'repo_name': image_name(index),
+                'pull_count': int(10 ** rnd.uniform(0, 7)),
+                'star_count': int(10 ** rnd.uniform(0, 3)),
+                'full_size': int(10 ** rnd.uniform(6, 9)),
+                # the software installed in the image
+                'software': {sw['name']: "{0}.{1}.{2}".format(rnd.randint(0, 9), rnd.randint(0, 20), rnd.randint(0, 9))
+                             for sw in SOFTWARE if rnd.random() < 0.4},
+            })
+        self.by_name = {image['repo_name']: image for image in self.images}
+
+
+class Services:
+    """The state of the fake images service and the counters of the requests."""
+
+    def __init__(self, dataset, latency=0.0):
+        self.dataset = dataset
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.images = {}    # repo_name -> description stored by the images service
+        self.requests = 0
+
+    def add_scanned(self, repo_name):
+        """Store the image as already scanned (with the current digest): the scanner skips it."""
+        with self.lock:
+            self.images[repo_name] = {'_id': "%024x" % len(self.images), 'repo_name': repo_name,
+                                      'digest': image_digest(repo_name), 'last_scan': "2030-01-01T00:00:00.000Z",
+                                      'last_updated': "2016-06-12T15:46:18.292Z"}
+
+    def store(self, dict_image, _id=None):
+        with self.lock:
+            stored = self.images.get(dict_image['repo_name'], {})
+            stored.update(dict_image)
+            stored['_id'] = stored.get('_id') or _id or "%024x" % len(self.images)
+            self.images[stored['repo_name']] = stored
+            return dict(stored)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True   # the headers and the body are written separately
+    services = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    def body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length).decode()) if length else None
+
+    def dispatch(self):
+        services = self.services
+        with services.lock:
+            services.requests += 1
+        if services.latency:
+            time.sleep(services.latency)
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        path = re.sub("/+", "/", url.path)   # the clients join "https://hub.docker.com/" and "/v2/..."
+        for pattern, method in ROUTES:
+            match = re.match(pattern, path)
+            if match and hasattr(self, method + "_" + self.command.lower()):
+                return getattr(self, method + "_" + self.command.lower())(query, *match.groups())
+        self.reply(404, {'detail': "Not found"})
+
+    do_GET = do_HEAD = do_POST = do_PUT = dispatch
+
+    # Docker Hub
+    def search_get(self, query):
+        page, page_size = int(query.get('page', 1)), int(query.get('page_size', 10))
+        images = self.services.dataset.images
+        results = [{'repo_name': image['repo_name'], 'pull_count': image['pull_count'],
+                    'star_count': image['star_count'], 'is_official': False, 'is_automated': False,
+                    'short_description': ""} for image in images[(page - 1) * page_size:page * page_size]]
+        next_page = None
+        if page * page_size < len(images):
+            next_page = "http://{0}:{1}/hub/v2/search/repositories/?".format(*self.server.server_address) + \
+                        urllib.parse.urlencode((('query', '*'), ('page', page + 1), ('page_size', page_size)))
+        self.reply(200, {'count': len(images), 'next': next_page, 'previous': None, 'results': results})
+
+    def repo_get(self, query, repo_name):
+        image = self.services.dataset.by_name.get(repo_name)
+        if image is None:
+            return self.reply(404, {'detail': "Not found"})
+        namespace, name = repo_name.split("/")
+        self.reply(200, {'user': namespace, 'name': name, 'namespace': namespace, 'status': 1,
+                         'description': "Benchmark image " + name, 'is_private': False, 'is_automated': False,
+                         'can_edit': False, 'star_count': image['star_count'], 'pull_count': image['pull_count'],
+                         'last_updated': "2016-06-12T15:46:21.454420Z", 'has_starred': False,
+                         'full_description': "", 'permissions': {'read': True, 'write': False, 'admin': False}})
+
+    def tags_get(self, query, repo_name):
+        if repo_name not in self.services.dataset.by_name:
+            return self.reply(404, {'detail': "Not found"})
+        self.reply(200, {'count': 1, 'next': None, 'previous': None, 'results': [{'name': "latest"}]})
+
+    def tag_get(self, query, repo_name, tag):
+        image = self.services.dataset.by_name.get(repo_name)
+        if image is None or tag != "latest":
+            return self.reply(404, {'detail': "Not found"})
+        self.reply(200, {'name': "latest", 'full_size': image['full_size'], 'id': 1720126, 'repository': 479046,
+                         'creator': 534858, 'last_updater': 534858, 'last_updated': "2016-06-12T15:46:18.292828Z",
+                         'image_id': None, 'v2': True, 'platforms': [5]})
+
+    # registry API v2
+    def manifest_head(self, query, repo_name, tag):
+        if repo_name not in self.services.dataset.by_name:
+            return self.reply(404)
+        self.reply(200, headers={'Docker-Content-Digest': image_digest(repo_name)})
+
+    # images service
+    def images_get(self, query):
+        with self.services.lock:
+            if 'repo_name' in query:
+                images = [dict(self.services.images[query['repo_name']])] \
+                    if query['repo_name'] in self.services.images else []
+            else:
+                skip, limit = int(query.get('skip', 0)), int(query.get('limit', 100))
+                images = [dict(image) for image in list(self.services.images.values())[skip:skip + limit]]
+        self.reply(200, {'count': len(images), 'images': images})
+
+    def images_post(self, query):
+        self.reply(201, self.services.store(self.body()))
+
+    def image_put(self, query, _id):
+        self.reply(200, self.services.store(self.body(), _id=_id))
+
+    def bulk_post(self, query):
+        images = self.body()['images']
+        for dict_image in images:
+            self.services.store(dict_image)
+        self.reply(200, {'upserted': len(images)})
+
+    # software service
+    def software_get(self, query):
+        if self.headers.get('If-None-Match') == '"catalog-1"':
+            return self.reply(304)
+        self.reply(200, {'count': len(SOFTWARE), 'software': SOFTWARE}, headers={'ETag': '"catalog-1"'})
+
+
+ROUTES = [
+    (r"^/hub/v2/search/repositories/?$", "search"),
+    (r"^/hub/v2/repositories/(.+)/tags/?$", "tags"),
+    (r"^/hub/v2/repositories/(.+)/tags/([^/]+)/?$", "tag"),
+    (r"^/hub/v2/repositories/([^/]+/[^/]+)/?$", "repo"),
+    (r"^/registry/v2/(.+)/manifests/([^/]+)$", "manifest"),
+    (r"^/api/images/?$", "images"),
+    (r"^/api/images/bulk$", "bulk"),
+    (r"^/api/images/([0-9a-f]{24})$", "image"),
+    (r"^/api/software/?$", "software"),
+]
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class FakeServices:
+    """The HTTP server of the fake services, running in a daemon thread."""
+
+    def __init__(self, dataset, latency=0.0):
+        self.services = Services(dataset, latency)
+        handler = type("BoundHandler", (Handler,), {'services': self.services})
+        self.server = _Server(("127.0.0.1", 0), handler)
+        self.url = "http://127.0.0.1:{0}".format(self.server.server_address[1])
+        self.hub_url = self.url + "/hub/"
+        self.registry_url = self.url + "/registry"
+        self.images_url = self.url + "/api/images/"
+        self.software_url = self.url + "/api/software"
+        threading.Thread(target=self.server.serve_forever, name="fake-services", daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeDaemon(ClientDaemon):
+    """
+    Docker daemon that pulls and runs nothing: a pull takes pull_seconds per GB of the image, a command takes
+    probe_seconds and prints the version of the software installed in the dataset. The streaming of the output,
+    the timeouts and the removal of the containers are the ones of ClientDaemon.run_capture.
+    """
+
+    def __init__(self, dataset, pull_seconds=1.0, probe_seconds=0.005):
+        super(FakeDaemon, self).__init__(base_url='unix://var/run/docker.sock')
+        self.dataset = dataset
+        self.pull_seconds = pull_seconds
+        self.probe_seconds = probe_seconds
+        self._lock = threading.Lock()
+        self._containers = {}
+        self._next = 0
+
+    def _image(self, image):
+        return self.dataset.by_name[image.rsplit(":", 1)[0] if ":" in image.split("/")[-1] else image]
+
+    def pull_image(self, repo_name, tag="latest", cancel_event=None):
+        time.sleep(self.pull_seconds * self._image(repo_name)['full_size'] / 2 ** 30)
+        return True
+
+    def inspect_image(self, image):
+        image = self._image(image)
+        return {'Id': image_digest(image['repo_name']), 'Size': image['full_size'],
+                'RootFS': {'Type': "layers", 'Layers': [image_digest("base"), image_digest(image['repo_name'])]}}
+
+    def remove_image(self, image, force=False, noprune=False):
+        pass
+
+    def create_container(self, image, entrypoint=None, tty=False, stdin_open=False, **kwargs):
+        with self._lock:
+            self._next += 1
+            container_id = "%064x" % self._next
+            self._containers[container_id] = (self._image(image), entrypoint)
+        return {'Id': container_id}
+
+    def start(self, container, **kwargs):
+        pass
+
+    def logs(self, container, stream=False, follow=False, **kwargs):
+        image, entrypoint = self._containers[container]
+        commands = entrypoint[2].splitlines() if isinstance(entrypoint, list) else [entrypoint]
+        for command in commands:
+            if command.startswith("echo "):
+                yield (command[6:-1] + "\r\n").encode()   # the marker of a batch script
+                continue
+            time.sleep(self.probe_seconds)
+            name = command.split()[0]
+            if name == "bash" and "release" in command:
+                yield b'PRETTY_NAME="Debian GNU/Linux 8 (jessie)"\r\n'
+            elif name in image['software']:
+                yield "{0} version {1}\r\n".format(name, image['software'][name]).encode()
+            else:
+                yield "/bin/sh: {0}: not found\r\n".format(name).encode()
+
+    def kill(self, container, **kwargs):
+        pass
+
+    def remove_container(self, container, **kwargs):
+        with self._lock:
+            self._containers.pop(container, None)
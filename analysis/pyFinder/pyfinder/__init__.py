@@ -3,9 +3,11 @@ from .crawler import Crawler
 from .client_images_service import ClientImages
 from .client_daemon import ClientDaemon
 from .client_dockerhub import ClientHub
+from .client_dockerhub_async import ClientHubAsync
 from .container import Container
 from .client_software import ClientSoftware
+from .client_registry import ClientRegistry
 from .tester import Tester
 from .client_software import ClientSoftware
 
-__all__ = [Scanner, Crawler, ClientImages, ClientDaemon, ClientHub, Tester]
+__all__ = [Scanner, Crawler, ClientImages, ClientDaemon, ClientHub, ClientHubAsync, ClientRegistry, Tester]
@@ -0,0 +1,104 @@
+import hashlib
+import math
+import os
+import pickle
+import time
+import logging
+from .utils import get_logger
+
+
+class BloomFilter:
+    """
+    Set of strings in a fixed array of bits: a string added is always found, a string never added is found with
+    probability error_rate (when no more than capacity strings are added).
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # double hashing: the k positions are h1 + i*h2 of the two halves of a single digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RotatingBloomFilter:
+    """
+    The strings added in the last ttl seconds, in two Bloom filters: the current generation receives the new
+    strings and the previous one is still searched. Every ttl seconds (or when the current generation is full)
+    the previous generation is dropped, so a string is remembered for at least ttl and at most 2*ttl seconds.
+
+    The filters are saved in a file with save() and loaded in the constructor.
+    """
+
+    def __init__(self, path_file=None, ttl=24 * 3600, capacity=1000000, error_rate=0.001, clock=time.time):
+        """
+        :param path_file: the file where the filters are saved, None: not persistent
+        :param capacity: the max number of strings of a generation
+        """
+        self.logger = get_logger(__name__, logging.INFO)
+        self.path_file = path_file
+        self.ttl = ttl
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._clock = clock
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous = BloomFilter(capacity, error_rate)
+        self.started = clock()   # when the current generation started
+        if path_file and os.path.exists(path_file):
+            self.load()
+
+    def __contains__(self, key):
+        self._rotate()
+        return key in self.current or key in self.previous
+
+    def add(self, key):
+        self._rotate()
+        self.current.add(key)
+
+    def _rotate(self):
+        now = self._clock()
+        if now - self.started >= 2 * self.ttl:
+            self.previous = BloomFilter(self.capacity, self.error_rate)
+            self.current = BloomFilter(self.capacity, self.error_rate)
+            self.started = now
+        elif now - self.started >= self.ttl or self.current.count >= self.capacity:
+            self.previous = self.current
+            self.current = BloomFilter(self.capacity, self.error_rate)
+            self.started = now
+
+    def load(self):
+        with open(self.path_file, "rb") as f:
+            state = pickle.load(f)
+        if (state['capacity'], state['error_rate']) != (self.capacity, self.error_rate):
+            self.logger.warning("{0}: saved with different capacity or error rate, ignored".format(self.path_file))
+            return
+        self.current, self.previous, self.started = state['current'], state['previous'], state['started']
+        self.logger.info("Loaded {0}: {1} recent names".format(self.path_file,
+                                                               self.current.count + self.previous.count))
+
+    def save(self):
+        """Write the filters in the file (atomically: a crash does not leave a truncated file)."""
+        if not self.path_file:
+            return
+        state = {'capacity': self.capacity, 'error_rate': self.error_rate, 'started': self.started,
+                 'current': self.current, 'previous': self.previous}
+        path_tmp = self.path_file + ".tmp"
+        with open(path_tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path_tmp, self.path_file)
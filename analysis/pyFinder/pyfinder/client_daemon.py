@@ -1,7 +1,9 @@
 import docker
 import docker.errors
+import codecs
 import json
 import sys
+import threading
 from .utils import get_logger
 import logging
 
@@ -13,7 +15,12 @@ class ClientDaemon(docker.Client):
         super(ClientDaemon, self).__init__(base_url=base_url, version=version, timeout=timeout, tls=tls)
         self.logger = get_logger(__name__, logging.INFO)
 
-    def pull_image(self, repo_name, tag="latest"):
+    def pull_image(self, repo_name, tag="latest", cancel_event=None):
+        """
+        Pull the image from the Docker Hub.
+        :param cancel_event: threading.Event, if it is set the pull is aborted.
+        :return: False if the pull has been aborted, True otherwise.
+        """
         # # try to set image
         # if not repo_name:
         #     ims = self.images()
@@ -30,6 +37,9 @@ class ClientDaemon(docker.Client):
         try:
             self.logger.info("[" + repo_name + "] pulling ...")
             for line in self.pull(repo_name, tag, stream=True):
+                if cancel_event is not None and cancel_event.is_set():
+                    self.logger.info("[" + repo_name + "] pull aborted")
+                    return False
                 json_image = json.loads(line.decode())
                 # print(json_image)
                 if 'progress' in json_image.keys():
@@ -37,11 +47,63 @@ class ClientDaemon(docker.Client):
                     # self.logger.debug('\r' + json_image['id'] + ":" + json_image['progress'], end="")
                 if 'status' in json_image.keys() and "Downloaded" in json_image['status']:
                     self.logger.info("[" + repo_name + "] " + json_image['status'])
-        except docker.errors as e:
+        except docker.errors.APIError as e:
                 self.logger.exception(e)
+        return True
         # else:
         #     self.logger.info("[" + repo_name + "] already exists or not found int the Docker Hub")
 
+    def run_capture(self, image, entrypoint, timeout=None, max_output=None, until=None):
+        """
+        Run a command in a new container and return its output, read as a stream while the command runs.
+        The container is killed (and always removed) when the command runs for more than timeout seconds,
+        when it prints more than max_output bytes or when until() says that the output is enough.
+        :param until: function(output) called with the complete lines read so far, True: stop the command
+        :return: (output, status), status: "exited", "timeout", "truncated" or "matched"
+        :raise docker.errors.APIError: the container cannot be created or started
+        """
+        container_id = self.create_container(image=image, entrypoint=entrypoint, tty=True, stdin_open=True)['Id']
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            try:
+                self.kill(container_id)
+            except docker.errors.APIError as e:
+                self.logger.debug(e)
+
+        watchdog = threading.Timer(timeout, kill) if timeout else None
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        output = ""
+        size = 0
+        status = "exited"
+        try:
+            self.start(container=container_id)
+            if watchdog:
+                watchdog.daemon = True
+                watchdog.start()
+            for chunk in self.logs(container=container_id, stream=True, follow=True):
+                if max_output is not None and size + len(chunk) > max_output:
+                    output += decoder.decode(chunk[:max_output - size])
+                    status = "truncated"
+                    break
+                size += len(chunk)
+                output += decoder.decode(chunk)
+                if until is not None and b"\n" in chunk and until(output[:output.rfind("\n") + 1]):
+                    status = "matched"
+                    break
+            output += decoder.decode(b"", final=True)
+        finally:
+            if watchdog:
+                watchdog.cancel()
+            if timed_out.is_set() and status == "exited":
+                status = "timeout"
+            try:
+                self.remove_container(container_id, force=True)
+            except docker.errors.APIError as e:
+                self.logger.error(e)
+        return output, status
+
     # def remove_image(self, image, force=False):
     #
     #     try:
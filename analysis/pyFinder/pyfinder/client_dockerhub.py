@@ -3,13 +3,19 @@ import sys
 import urllib.parse
 import logging
 from .utils import get_logger
+from .transport import ThrottledSession
 
 
 class ClientHub:
 
-    def __init__(self, docker_hub_endpoint="https://hub.docker.com/"):
+    def __init__(self, docker_hub_endpoint="https://hub.docker.com/", throttle=None, cache=None):
+        """
+        :param throttle: the Throttle (rate limit, retries) of the requests, it can be shared with other clients
+        :param cache: the HttpCache of the responses (conditional requests), None: no cache
+        """
         self.docker_hub = docker_hub_endpoint
-        self.session = requests.session()
+        self.session = ThrottledSession(throttle, cache=cache)
+        self.throttle = self.session.throttle
         self.logger = get_logger(__name__, logging.INFO)
 
     def get_num_tags(self, repo_name):
@@ -69,7 +75,7 @@ class ClientHub:
         try:
             while url_next_page and crawled_images < max_images: # max_images > 0
                 self.logger.debug("GET to "+url_next_page)
-                res = requests.get(url_next_page)
+                res = self.session.get(url_next_page)
                 if res.status_code == requests.codes.ok:
                     json_response = res.json()
                     list_json_image = self._apply_filter(json_response['results'], filter_function=filter_images)
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import math
+import time
+import urllib.parse
+import logging
+import aiohttp
+from .utils import get_logger
+from .transport import Throttle
+
+
+class HubPageError(Exception):
+    """A page of the search of the Docker Hub is not available (the retries are exhausted)."""
+
+
+class ClientHubAsync:
+    """
+    Asyncio version of ClientHub. The operations are coroutines (crawl_images is an async generator) that share
+    a pool of keep-alive connections, so many requests to the Docker Hub can be in flight at the same time.
+
+        async with ClientHubAsync() as client_hub:
+            tags = await client_hub.get_all_tags("library/nginx")
+    """
+
+    def __init__(self, docker_hub_endpoint="https://hub.docker.com/", max_connections=50, max_concurrency=20,
+                 throttle=None, cache=None):
+        """
+        :param max_connections: size of the pool of keep-alive connections to the Docker Hub
+        :param max_concurrency: max number of requests in flight at the same time
+        :param throttle: the Throttle (rate limit, retries) of the requests, it can be shared with other clients.
+                         The number of requests in flight is throttle.concurrency.
+        :param cache: the HttpCache of the responses (conditional requests), None: no cache
+        """
+        self.docker_hub = docker_hub_endpoint
+        self.max_connections = max_connections
+        self.throttle = throttle if throttle else Throttle(max_concurrency=max_concurrency)
+        self.cache = cache
+        self.session = None
+        self._slots = None
+        self._in_flight = 0
+        self.logger = get_logger(__name__, logging.INFO)
+
+    async def open(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=30)
+            self.session = aiohttp.ClientSession(connector=connector)
+            self._slots = asyncio.Condition()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def get_hub(self, url):
+        """
+        GET of a Docker Hub url. The throttled responses (429, 5xx) and the connection errors are retried.
+        With the cache the GET is a conditional request, a cached 404 is not sent.
+        :return: (status code, json response). The json response is None if the status is not 200.
+        """
+        await self.open()
+        entry = self.cache.get(url) if self.cache else None
+        if self.cache and self.cache.is_negative(entry):
+            self.logger.debug("404 (cached) " + url)
+            return 404, None
+        headers = self.cache.validators(entry) if self.cache else {}
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.throttle.delay())
+            async with self._slots:
+                await self._slots.wait_for(lambda: self._in_flight < self.throttle.concurrency)
+                self._in_flight += 1
+            start = time.monotonic()
+            try:
+                async with self.session.get(url, headers=headers) as res:
+                    wait = self.throttle.on_response(res.status, res.headers.get('Retry-After'), attempt,
+                                                     elapsed=time.monotonic() - start)
+                    if wait is None:
+                        if res.status == 304 and entry is not None:
+                            return 200, json.loads(self.cache.not_modified_body(entry).decode('utf-8'))
+                        if self.cache:
+                            body = await res.read() if res.status == 200 else None
+                            self.cache.update(url, res.status, res.headers, body)
+                            if body is not None:
+                                return res.status, json.loads(body.decode('utf-8'))
+                        if res.status == 200:
+                            return res.status, await res.json()
+                        self.logger.error(str(res.status) + " error response: " + await res.text())
+                        return res.status, None
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                # aiohttp raises a bare asyncio.TimeoutError when the response is not read in time
+                wait = self.throttle.on_error(attempt, elapsed=time.monotonic() - start)
+                if wait is None:
+                    self.logger.exception("GET " + url + ": ")
+                    return None, None
+            finally:
+                async with self._slots:
+                    self._in_flight -= 1
+                    self._slots.notify_all()
+            attempt += 1
+            self.logger.warning("GET {0}: retry {1} in {2:.1f}s".format(url, attempt, wait))
+            await asyncio.sleep(wait)
+
+    async def get_num_tags(self, repo_name):
+        status, json_response = await self.get_hub(self.docker_hub + "/v2/repositories/" + repo_name + "/tags/")
+        if json_response:
+            return json_response['count']
+
+    async def get_all_tags(self, repo_name, page_size=100):
+        """
+        Return a list of all the tags associated with the repository name.
+        The first page gives the number of tags, the other pages are downloaded concurrently.
+        """
+        self.logger.debug("[" + repo_name + "] Getting all the tags")
+        url_tags = self.docker_hub + "/v2/repositories/" + repo_name + "/tags/?"
+        pages = await self._get_all_pages(url_tags, page_size)
+        return [tag['name'] for json_response in pages for tag in json_response['results']]
+
+    async def get_json_repo(self, repo_name):
+        status, json_response = await self.get_hub(self.docker_hub + "/v2/repositories/" + repo_name)
+        return json_response if json_response else {}
+
+    async def get_json_tag(self, repo_name, tag="latest"):
+        status, json_response = await self.get_hub(self.docker_hub + "/v2/repositories/" + repo_name + "/tags/" + tag)
+        return json_response if json_response else {}
+
+    async def count_all_images(self):
+        status, json_response = await self.get_hub(self.build_search_url(page=1, page_size=10))
+        if json_response:
+            return json_response['count']
+
+    async def crawl_official_images(self):
+        url_repositories = self.docker_hub + "/v2/repositories/library?"
+        pages = await self._get_all_pages(url_repositories, page_size=100)
+        return [repo['name'] for json_response in pages for repo in json_response['results']]
+
+    async def crawl_images(self, page=1, page_size=10, max_images=None, filter_images=None, page_step=1):
+        """
+        Async generator of the pages of the images in the Docker Hub.
+        The filter runs concurrently on all the images of a page, while the next page is downloaded.
+        :param filter_images: coroutine function(json image) -> True if the image must be taken. The filter can add
+         fields to the json image.
+        :param max_images: (int) the maximun number of images crawled from the docker hub.
+         If None all the images will be crawled [default: None]
+        :param page_step: crawl one page every page_step pages (page, page + page_step, ...): page_step crawlers
+         starting from consecutive pages crawl disjoint pages.
+        :raise HubPageError: a page is not available before the last page (or max_images): the crawl is not
+         completed
+        """
+        max_images = max_images if max_images else await self.count_all_images()
+        if max_images is None:
+            raise HubPageError("the number of images of the Docker Hub is not available")
+        crawled_images = 0
+        self.logger.info("Total images to crawl: " + str(max_images))
+        url_page = self.build_search_url(page=page, page_size=page_size)
+        self.logger.debug("GET to " + url_page)
+        status, json_response = await self.get_hub(url_page)
+        while crawled_images < max_images:
+            if json_response is None:
+                raise HubPageError("page {0} of the Docker Hub not available ({1})".format(page, status))
+            url_next_page = json_response['next']
+            if url_next_page:
+                page += page_step
+            if url_next_page and page_step > 1:
+                num_pages = int(math.ceil(json_response['count'] / float(page_size)))
+                url_next_page = self.build_search_url(page=page, page_size=page_size) if page <= num_pages else None
+            next_page = asyncio.ensure_future(self.get_hub(url_next_page)) if url_next_page else None
+            try:
+                list_json_image = json_response['results']
+                if filter_images:
+                    taken = await asyncio.gather(*[filter_images(image) for image in list_json_image])
+                    list_json_image = [image for image, take in zip(list_json_image, taken) if take]
+                if len(list_json_image) + crawled_images > max_images:
+                    list_json_image = list_json_image[:max_images - crawled_images]
+                crawled_images += len(list_json_image)
+                yield list_json_image
+            except BaseException:
+                if next_page:
+                    next_page.cancel()
+                raise
+            if next_page is None:
+                return
+            self.logger.debug("GET to " + url_next_page)
+            status, json_response = await next_page
+
+    def build_search_url(self, page, page_size=10):
+        # https://hub.docker.com/v2/search/repositories/?query=*&page_size=100&page=1
+        params = (('query', '*'), ('page', page), ('page_size', page_size))
+        return self.docker_hub + "/v2/search/repositories/?" + urllib.parse.urlencode(params)
+
+    async def _get_all_pages(self, url, page_size):
+        """Download the first page, then all the other pages concurrently."""
+        status, first_page = await self.get_hub(url + urllib.parse.urlencode((('page', 1), ('page_size', page_size))))
+        if first_page is None:
+            return []
+        num_pages = int(math.ceil(first_page['count'] / float(page_size)))
+        other_pages = await asyncio.gather(*[
+            self.get_hub(url + urllib.parse.urlencode((('page', page), ('page_size', page_size))))
+            for page in range(2, num_pages + 1)])
+        return [first_page] + [json_response for status, json_response in other_pages if json_response]
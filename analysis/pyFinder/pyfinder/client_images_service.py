@@ -1,24 +1,63 @@
 import requests
 import json
 import sys
+import threading
+import time
+from collections import OrderedDict
 from .utils import *
 import logging
 
 
 class ClientImages:
 
-    def __init__(self, images_url="http://127.0.0.1:3000/api/images", host_service="127.0.0.1", port_service=3000, url_path="/api/images/"):
+    # the fields of an image needed to decide if it must be scanned (the _id is always returned)
+    SCAN_STATE_FIELDS = 'repo_name last_scan last_updated digest'
+
+    # the fields of an image needed by the incremental scan (see Scanner.layer_rescan)
+    SCAN_RESULT_FIELDS = 'repo_name layers catalog distro softwares'
+
+    def __init__(self, images_url="http://127.0.0.1:3000/api/images", host_service="127.0.0.1", port_service=3000, url_path="/api/images/",
+                 hub_url="https://hub.docker.com/", batch_size=0, flush_interval=5.0, max_states=100000,
+                 max_buffered=1000):
+        """
+        :param max_states: max number of scan states (see get_scan_state) kept in the LRU cache
+        :param batch_size: if > 0 the descriptions posted and updated are buffered and sent together to the bulk
+                           endpoint of the images service when batch_size images are buffered
+        :param flush_interval: max seconds that a description stays in the buffer
+        :param max_buffered: max number of descriptions kept in the buffer while the images service does not
+                             accept them, the oldest ones are dropped
+        """
         self.logger = get_logger(__name__, logging.INFO)
         self.session = requests.Session()
         #self.url_api = "http://" + host_service + ":" + str(port_service)+url_path
         self.url_api = images_url
+        self.hub_url = hub_url
         self.logger.info("URL images service: "+self.url_api)
 
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self._buffer = OrderedDict()   # repo_name -> last description of the image not yet sent
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+
+        self.max_states = max_states
+        self._states = OrderedDict()   # repo_name -> scan state, the most recently used at the end
+        self._states_lock = threading.Lock()
+        self.state_hits = 0
+        self.state_misses = 0
+        if batch_size > 0:
+            threading.Thread(target=self._flush_periodically, name="images-flush", daemon=True).start()
+
     def post_image(self, dict_image):
+        if self.batch_size > 0:
+            return self.buffer_image(dict_image)
         try:
             res = self.session.post(self.url_api, headers={'Content-type': 'application/json'}, json=dict_image)
             if res.status_code == requests.codes.created or res.status_code == requests.codes.ok:
                 self.logger.info("POST ["+dict_image['repo_name']+"]  into  "+res.url)
+                self.remember_scan_state(res.json())
             else:
                 self.logger.error(str(res.status_code)+" response: "+res.text)
         except requests.exceptions.ConnectionError as e:
@@ -29,11 +68,14 @@ class ClientImages:
         #     return res.json()
 
     def put_image(self, dict_image):
+        if self.batch_size > 0:
+            return self.buffer_image(dict_image)
         try:
             id_image = self.get_id_image(dict_image['repo_name'])
             res = self.session.put(self.url_api+id_image, headers={'Content-type': 'application/json'}, json=dict_image)
             if res.status_code == requests.codes.ok:
                 self.logger.info("UPDATED [" + dict_image['repo_name'] + "] into "+res.url)
+                self.remember_scan_state(res.json())
             else:
                 self.logger.error(str(res.status_code) + " Error code " + res.text)
         except requests.exceptions.ConnectionError as e:
@@ -44,6 +86,80 @@ class ClientImages:
         # else:
         #     return res.json()
 
+    def buffer_image(self, dict_image):
+        """
+        Add the description of the image to the write-behind buffer: a newer description of the same repo_name
+        replaces the buffered one. The buffer is sent when it holds batch_size images.
+        """
+        with self._buffer_lock:
+            self._buffer.pop(dict_image['repo_name'], None)
+            self._buffer[dict_image['repo_name']] = dict_image
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def buffered_image(self, repo_name):
+        """:return: the description of the image waiting in the buffer, None if it is not buffered"""
+        with self._buffer_lock:
+            return self._buffer.get(repo_name)
+
+    def flush(self):
+        """
+        Send the buffered descriptions to POST <images_url>/bulk (the images service inserts or updates them by
+        repo_name). If the service does not accept them the images are put back in the buffer, at most
+        max_buffered images are kept.
+        """
+        with self._flush_lock:
+            with self._buffer_lock:
+                images = list(self._buffer.values())
+                self._buffer.clear()
+            if not images:
+                return
+            sent = False
+            try:
+                res = self.session.post(self.url_api.rstrip("/") + "/bulk", json={'images': images})
+                if res.status_code == requests.codes.ok:
+                    sent = True
+                    self.logger.info("BULK {0} images into {1}: {2}".format(len(images), res.url, res.text))
+                    for dict_image in images:
+                        self.remember_scan_state(dict_image)
+                    return
+                self.logger.error(str(res.status_code) + " Error code " + res.text)
+            except requests.exceptions.RequestException:
+                self.logger.exception("BULK {0} images: ".format(len(images)))
+            finally:
+                if not sent:
+                    self._restore(images)
+
+    def _restore(self, images):
+        """Put back in the buffer the images not sent, dropping the oldest ones beyond max_buffered."""
+        with self._buffer_lock:
+            newer = list(self._buffer.items())   # a newer description received during the flush is kept
+            self._buffer.clear()
+            for dict_image in images:
+                self._buffer[dict_image['repo_name']] = dict_image
+            for repo_name, dict_image in newer:
+                self._buffer.pop(repo_name, None)
+                self._buffer[repo_name] = dict_image
+            dropped = []
+            while len(self._buffer) > self.max_buffered:
+                dropped.append(self._buffer.popitem(last=False)[0])
+        if dropped:
+            self.logger.error("Buffer full, {0} descriptions dropped: {1}".format(len(dropped), ", ".join(dropped)))
+
+    def close(self):
+        """Send the buffered descriptions and stop the periodic flush."""
+        self._closed.set()
+        self.flush()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                # the thread must keep flushing the buffer
+                self.logger.exception("Periodic flush: ")
+
     def get_images(self):
         try:
             res = self.session.get(self.url_api)
@@ -58,12 +174,14 @@ class ClientImages:
             raise
 
     def get_id_image(self, repo_name):
-        json_image_list = self.get_image(repo_name)
-        if json_image_list:
-            if "_id" in json_image_list[0].keys():
-                return json_image_list[0]['_id']
-            else:
-                raise Exception(" _id not found in "+repo_name)
+        state = self.get_scan_state(repo_name)
+        if state is None:
+            raise Exception(repo_name + " not found in the images service")
+        if "_id" not in state:
+            # the state has been cached after a bulk write: the _id is not known
+            self.forget_scan_state(repo_name)
+            state = self.get_scan_state(repo_name)
+        return state['_id']
 
     def get_image(self, repo_name):
         url = self.url_api + "?repo_name=" + repo_name
@@ -74,38 +192,128 @@ class ClientImages:
             self.logger.exception("ConnectionError: ")
 
     def get_scan_updated(self, repo_name):
-        payload = {'repo_name': repo_name, 'select': 'last_scan last_updated'}
+        payload = {'repo_name': repo_name, 'select': 'last_scan last_updated digest'}
         try:
-            res = requests.get(self.url_api, params=payload)
+            res = self.session.get(self.url_api, params=payload)
             return res.json()
         except requests.exceptions.ConnectionError as e:
             self.logger.exception("ConnectionError: " )
 
+    def get_scan_state(self, repo_name):
+        """
+        The fields of the image needed by the scanner, in at most one request to the images service:
+        the states are kept in a LRU cache (see warm_scan_states), updated by the posts and the updates.
+        :return: {'_id', 'repo_name', 'last_scan', 'last_updated', 'digest'}, None if the image is not present.
+        """
+        dict_image = self.buffered_image(repo_name)
+        if dict_image is not None:
+            return self._scan_state(dict_image)
+        with self._states_lock:
+            state = self._states.get(repo_name)
+            if state is not None:
+                self._states.move_to_end(repo_name)
+                self.state_hits += 1
+                return state
+            self.state_misses += 1
+        res = self.session.get(self.url_api, params={'repo_name': repo_name, 'select': self.SCAN_STATE_FIELDS})
+        res.raise_for_status()
+        images = res.json()['images']
+        if not images:
+            return None
+        return self.remember_scan_state(images[0])
+
+    def get_scan_result(self, repo_name):
+        """
+        The results of the last scan of the image, used by the incremental scan (not cached: it is requested
+        only when the image is scanned again).
+        :return: {'repo_name', 'layers', 'catalog', 'distro', 'softwares'}, None if the image is not present.
+        """
+        dict_image = self.buffered_image(repo_name)
+        if dict_image is not None:
+            return dict_image
+        try:
+            res = self.session.get(self.url_api, params={'repo_name': repo_name, 'select': self.SCAN_RESULT_FIELDS})
+            res.raise_for_status()
+        except requests.exceptions.RequestException:
+            self.logger.exception("Last scan of " + repo_name + ": ")
+            return None
+        images = res.json()['images']
+        return images[0] if images else None
+
+    def warm_scan_states(self, page_size=1000):
+        """
+        Load the scan states of the images already in the images service (at most max_states), in pages of
+        page_size images.
+        """
+        skip = 0
+        while skip < self.max_states:
+            params = {'select': self.SCAN_STATE_FIELDS, 'limit': page_size, 'skip': skip}
+            try:
+                res = self.session.get(self.url_api, params=params)
+                res.raise_for_status()
+            except requests.exceptions.RequestException:
+                self.logger.exception("Warming the scan states: ")
+                break
+            images = res.json()['images']
+            for image in images:
+                self.remember_scan_state(image)
+            skip += len(images)
+            if len(images) < page_size:
+                break
+        self.logger.info("Loaded the scan states of {0} images".format(len(self._states)))
+
+    def remember_scan_state(self, dict_image):
+        state = self._scan_state(dict_image)
+        with self._states_lock:
+            self._states.pop(state['repo_name'], None)
+            self._states[state['repo_name']] = state
+            while len(self._states) > self.max_states:
+                self._states.popitem(last=False)
+        return state
+
+    def forget_scan_state(self, repo_name):
+        with self._states_lock:
+            self._states.pop(repo_name, None)
+
+    def _scan_state(self, dict_image):
+        state = {field: dict_image.get(field) for field in self.SCAN_STATE_FIELDS.split()}
+        if dict_image.get('_id'):
+            state['_id'] = dict_image['_id']
+        return state
+
     def is_new(self, repo_name):
-        res_json = self.get_image(repo_name)
-        if res_json['count'] is 0:
+        if self.get_scan_state(repo_name) is None:
             self.logger.info("["+repo_name+"] is new into IMAGES SERVER")
             return True
         else:
             self.logger.info("[" + repo_name + "] is present")
             return False
-        # self.logger.debug("["+repo_name+"] verifing if is new ")
-        # return False if self.get_image(repo_name) else True
 
-    def must_scanned(self, repo_name, tag="latest"):
+    def must_scanned(self, repo_name, tag="latest", digest=None, state=None):
         """
         Check if the repo_name has been scanned recently and it is not require the scan.
-         if(local.last_updated > remote.last_scan ) then {scan}
+        If the digest of the manifest is known, the image must be scanned only if the digest is changed:
+        a tag can be updated in the docker hub without changing its content.
+        Otherwise, if(local.last_updated > remote.last_scan ) then {scan}
         :param repo_name:
+        :param digest: the current digest of the manifest of the tag (see ClientRegistry.get_digest)
+        :param state: the scan state of the image (see get_scan_state), if None it is requested
         :return:
         """
         # last update and last scan from images service
-        #{'images': [{'_id': '57aef6efba60732000d3cf0d', 'last_updated': '2015-11-13T01:39:51.929Z',
-        #             'last_scan': '2016-08-13T10:31:11.270Z'}], 'count': 1}
-        res_image_json = self.get_scan_updated(repo_name)  # {"images:[
-        if res_image_json is not None:   # if not empty list, the result is there
-            self.logger.debug("Received from Images service" + str(res_image_json))
-            image_json = res_image_json['images'][0]
+        #{'_id': '57aef6efba60732000d3cf0d', 'last_updated': '2015-11-13T01:39:51.929Z',
+        # 'last_scan': '2016-08-13T10:31:11.270Z', 'digest': 'sha256:...'}
+        image_json = state if state is not None else self.get_scan_state(repo_name)
+        if image_json is not None:
+            self.logger.debug("Received from Images service" + str(image_json))
+            if digest and image_json.get('digest'):
+                if digest != image_json['digest']:
+                    self.logger.debug("[" + repo_name + "] need to update, the digest is changed")
+                    return True
+                else:
+                    self.logger.debug("[" + repo_name + "] NOT need to scan, same digest " + digest)
+                    return False
+
             self.logger.info("[" + repo_name + "] Images Service last scan: " + str(image_json['last_scan']) + " last update: " + str(image_json[
                 'last_updated']))
             dofinder_last_scan = string_to_date(image_json['last_scan'])
@@ -115,7 +323,7 @@ class ClientImages:
                 dofinder_last_update = dofinder_last_scan   # if is None tha image is not scan again becuse is  equal to last scan
 
             # latest_updated from docker hub
-            url_tag_latest = "https://hub.docker.com/v2/repositories/" + repo_name + "/tags/" + tag
+            url_tag_latest = self.hub_url.rstrip("/") + "/v2/repositories/" + repo_name + "/tags/" + tag
             json_response = self.session.get(url_tag_latest).json()
             hub_last_update_string = json_response['last_updated']
             if(json_response['last_updated']):
@@ -130,5 +338,3 @@ class ClientImages:
             else:
                 self.logger.debug("["+repo_name+"] NOT need to scan, last update into docker Hub is less or equal")
                 return False
-
-
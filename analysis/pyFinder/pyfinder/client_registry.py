@@ -0,0 +1,101 @@
+import re
+import requests
+import logging
+from .utils import get_logger
+
+
+class ClientRegistry(requests.Session):
+    """
+    Client of the Docker registry API v2. It downloads the manifests and the blobs of the images
+    without using the docker daemon.
+    """
+
+    MANIFEST_V2 = 'application/vnd.docker.distribution.manifest.v2+json'
+    MANIFEST_LIST = 'application/vnd.docker.distribution.manifest.list.v2+json'
+
+    def __init__(self, registry_url="https://registry-1.docker.io", auth_url="https://auth.docker.io/token"):
+        super(ClientRegistry, self).__init__()
+        self._url = registry_url.rstrip("/")
+        self._auth_url = auth_url
+        self._tokens = {}  # repository -> bearer token
+        self.logger = get_logger(__name__, logging.INFO)
+        self.logger.info("URL registry: " + self._url)
+
+    def repository(self, repo_name):
+        """The official images of the Docker Hub are in the 'library' namespace of the registry."""
+        if "/" not in repo_name and "docker.io" in self._url:
+            return "library/" + repo_name
+        return repo_name
+
+    def get_manifest(self, repo_name, tag="latest"):
+        """
+        Return the digest and the manifest (schema 2) of the image.
+        If the tag is a multi-platform image, the manifest of linux/amd64 is returned with the digest of the
+        manifest list: the digest is always the digest of the tag, the same of get_digest.
+        :return: (digest, json manifest), (None, None) if the manifest is not found
+        """
+        res = self._request("GET", repo_name, "/manifests/" + tag,
+                            headers={'Accept': self.MANIFEST_V2 + ", " + self.MANIFEST_LIST})
+        if res.status_code != requests.codes.ok:
+            self.logger.error("[" + repo_name + "] " + str(res.status_code) + " manifest error: " + res.text)
+            return None, None
+        manifest = res.json()
+        if manifest.get('mediaType') == self.MANIFEST_LIST:
+            for platform_manifest in manifest['manifests']:
+                platform = platform_manifest.get('platform', {})
+                if platform.get('os') == 'linux' and platform.get('architecture') == 'amd64':
+                    manifest = self.get_manifest(repo_name, platform_manifest['digest'])[1]
+                    return (res.headers.get('Docker-Content-Digest') if manifest else None), manifest
+            self.logger.error("[" + repo_name + "] linux/amd64 manifest not found")
+            return None, None
+        return res.headers.get('Docker-Content-Digest'), manifest
+
+    def get_digest(self, repo_name, tag="latest"):
+        """
+        Return the digest of the manifest of the tag with a HEAD request, without downloading the manifest.
+        The digest changes only if the content of the image changes.
+        :return: the digest (sha256:...), None if the tag is not found
+        """
+        res = self._request("HEAD", repo_name, "/manifests/" + tag,
+                            headers={'Accept': self.MANIFEST_V2 + ", " + self.MANIFEST_LIST})
+        if res.status_code != requests.codes.ok:
+            self.logger.debug("[" + repo_name + "] " + str(res.status_code) + " manifest HEAD " + tag)
+            return None
+        return res.headers.get('Docker-Content-Digest')
+
+    def get_config(self, repo_name, manifest):
+        """The configuration of the image (Env, Cmd, ...) described by the manifest."""
+        res = self.get_blob(repo_name, manifest['config']['digest'])
+        return res.json()
+
+    def get_blob(self, repo_name, digest, stream=False):
+        """
+        Return the response of the blob. With stream=True the content is not downloaded
+        until res.raw is read.
+        """
+        res = self._request("GET", repo_name, "/blobs/" + digest, stream=stream)
+        res.raise_for_status()
+        return res
+
+    def _request(self, method, repo_name, path, headers=None, stream=False):
+        repository = self.repository(repo_name)
+        url = self._url + "/v2/" + repository + path
+        headers = dict(headers or {})
+        if repository in self._tokens:
+            headers['Authorization'] = "Bearer " + self._tokens[repository]
+        res = self.request(method, url, headers=headers, stream=stream)
+        if res.status_code == requests.codes.unauthorized and 'Bearer' in res.headers.get('WWW-Authenticate', ''):
+            # the token is expired or never requested
+            self._tokens[repository] = self._get_token(repository, res.headers['WWW-Authenticate'])
+            headers['Authorization'] = "Bearer " + self._tokens[repository]
+            res = self.request(method, url, headers=headers, stream=stream)
+        return res
+
+    def _get_token(self, repository, authenticate):
+        # Bearer realm="https://auth.docker.io/token",service="registry.docker.io",scope="repository:library/nginx:pull"
+        challenge = dict(re.findall(r'(\w+)="([^"]*)"', authenticate))
+        params = {'service': challenge.get('service'), 'scope': "repository:" + repository + ":pull"}
+        res = self.get(challenge.get('realm', self._auth_url), params=params)
+        res.raise_for_status()
+        json_response = res.json()
+        return json_response.get('token', json_response.get('access_token'))
@@ -1,16 +1,58 @@
 import requests
 import logging
+import threading
+import time
+from .probe import ProbePlan, COMMAND_TIMEOUT
 from .utils import get_logger
 
 
 class ClientSoftware(requests.Session):
 
-    def __init__(self, api_url="http://127.0.0.1:3001/api/software"): #,host_service="sw_server", port_service="3001", path_api="/api/software"):
+    def __init__(self, api_url="http://127.0.0.1:3001/api/software", plan_ttl=60, probe_timeout=COMMAND_TIMEOUT): #,host_service="sw_server", port_service="3001", path_api="/api/software"):
         super(ClientSoftware, self).__init__()
         self._url = api_url
         self.logger = get_logger(__name__, logging.INFO)
         self.logger.info("URL SOFTWARE service: " + self._url)
 
+        # the probe plan is revalidated against the software service at most every plan_ttl seconds
+        self.plan_ttl = plan_ttl
+        # the commands of the batch script of the plan are killed after probe_timeout seconds
+        self.probe_timeout = probe_timeout
+        self._plan = None
+        self._plan_checked = 0
+        self._plan_lock = threading.Lock()
+
+    def get_probe_plan(self):
+        """
+        Return the probe plan of the current software catalog.
+        The plan is built only when the catalog changes: it is revalidated with a conditional GET (ETag)
+        and if the software service is not reachable the last plan is used.
+        """
+        with self._plan_lock:
+            if self._plan and time.time() - self._plan_checked < self.plan_ttl:
+                return self._plan
+            headers = {'If-None-Match': self._plan.version} if self._plan and self._plan.version else {}
+            try:
+                res = self.get(self._url, headers=headers)
+            except requests.exceptions.ConnectionError:
+                if self._plan is None:
+                    self.logger.exception("ConnectionError: ")
+                    raise
+                self.logger.warning("Software service not reachable, using the catalog " + str(self._plan.version))
+                return self._plan
+            self._plan_checked = time.time()
+            if res.status_code == requests.codes.not_modified:
+                return self._plan
+            if res.status_code == requests.codes.ok:
+                json_response = res.json()
+                version = res.headers.get('ETag', json_response.get('version'))
+                self._plan = ProbePlan(list(self.get_system()), json_response['software'], version=version,
+                                       timeout=self.probe_timeout)
+                self.logger.info(str(json_response['count']) + " softwares received, catalog version " + str(version))
+            else:
+                self.logger.error(str(res.status_code) + " response: " + res.text)
+            return self._plan
+
     def get_software(self):
         try:
             res = self.get(self._url)
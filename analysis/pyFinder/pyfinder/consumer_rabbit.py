@@ -2,6 +2,9 @@
 import logging
 import pika
 import json
+import functools
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
 from pyfinder import utils
 
 class ConsumerRabbit(object):
@@ -16,13 +19,31 @@ class ConsumerRabbit(object):
     If the channel is closed, it will indicate a problem with one of the
     commands that were issued and that should surface in the output as well.
 
+    If more than one worker is required (or the messages must be seen as
+    soon as they are received), the messages are processed by a pool of
+    threads and they are acknowledged by the IOLoop once the processing is
+    finished.
+
     """
+    # seconds between two checks of the messages processed by the workers
+    ACK_INTERVAL = 0.5
 
-    def __init__(self, amqp_url, exchange=None, queue=None,  route_key=None, on_msg_callback=lambda x: x ):
+    def __init__(self, amqp_url, exchange=None, queue=None,  route_key=None, on_msg_callback=lambda x: x,
+                 prefetch_count=1, workers=1, on_receive_callback=None, on_cancel_callback=None, max_priority=0,
+                 max_redeliveries=3):
         """Create a new instance of the consumer class, passing in the AMQP
         URL used to connect to RabbitMQ.
 
         :param str amqp_url: The AMQP url to connect with
+        :param int prefetch_count: The number of unacknowledged messages delivered by RabbitMQ
+        :param int workers: The number of messages processed concurrently
+        :param on_receive_callback: Invoked in the IOLoop as soon as a message is received,
+                                    before it waits for a free worker
+        :param on_cancel_callback: Invoked when the messages not yet processed are given back to RabbitMQ
+        :param int max_priority: if > 0 the queue is a priority queue (x-max-priority), it must be the same
+                                 of the publisher
+        :param int max_redeliveries: A message whose processing raised is given back to RabbitMQ (nack) at most
+                                     max_redeliveries times, then it is dropped
 
         """
         self.logger = utils.get_logger(__name__, logging.INFO)
@@ -36,8 +57,24 @@ class ConsumerRabbit(object):
         self.exchange_type = "direct"
         self.queue = queue
         self.routing_key = route_key
+        self.max_priority = max_priority
 
         self.on_message_callback = on_msg_callback
+        self.on_receive_callback = on_receive_callback
+        self.on_cancel_callback = on_cancel_callback
+
+        self.prefetch_count = prefetch_count
+        # the IOLoop must be free to receive the next messages while the workers process the current ones
+        if workers > 1 or on_receive_callback:
+            self._executor = ThreadPoolExecutor(max_workers=workers)
+        else:
+            self._executor = None
+        # (channel, delivery_tag, body, failed) of the messages processed by the workers, waiting for the ack
+        self._processed = Queue()
+        self._futures = set()
+        # body -> number of times the processing of the message raised
+        self.max_redeliveries = max_redeliveries
+        self._failures = {}
 
     def connect(self):
         """This method connects to RabbitMQ, returning the connection handle.
@@ -127,7 +164,7 @@ class ConsumerRabbit(object):
         """
         self.logger.info('Channel opened')
         self._channel = channel
-        self._channel.basic_qos(prefetch_count=1)
+        self._channel.basic_qos(prefetch_count=self.prefetch_count)
         self.add_on_channel_close_callback()
         self.setup_exchange(self.exchange)
 
@@ -153,6 +190,7 @@ class ConsumerRabbit(object):
         """
         self.logger.warning('Channel %i was closed: (%s) %s',
                        channel, reply_code, reply_text)
+        self.cancel_pending()
         self._connection.close()
 
     def setup_exchange(self, exchange_name):
@@ -189,7 +227,8 @@ class ConsumerRabbit(object):
 
         """
         self.logger.info('Declaring queue %s', queue_name)
-        self._channel.queue_declare(self.on_queue_declareok, queue_name, durable=True)
+        arguments = {'x-max-priority': self.max_priority} if self.max_priority else None
+        self._channel.queue_declare(self.on_queue_declareok, queue_name, durable=True, arguments=arguments)
 
     def on_queue_declareok(self, method_frame):
         """Method invoked by pika when the Queue.Declare RPC call made in
@@ -230,6 +269,8 @@ class ConsumerRabbit(object):
         self.add_on_cancel_callback()
         self._consumer_tag = self._channel.basic_consume(self.on_message,
                                                          self.queue)
+        if self._executor:
+            self._connection.add_timeout(self.ACK_INTERVAL, self.acknowledge_processed)
 
     def add_on_cancel_callback(self):
         """Add a callback that will be invoked if RabbitMQ cancels the consumer
@@ -249,6 +290,7 @@ class ConsumerRabbit(object):
         """
         self.logger.info('Consumer was cancelled remotely, shutting down: %r',
                     method_frame)
+        self.cancel_pending()
         if self._channel:
             self._channel.close()
 
@@ -270,9 +312,69 @@ class ConsumerRabbit(object):
                     basic_deliver.delivery_tag, properties.app_id, body)
 
 
-        self.on_message_callback(json.loads(body.decode()))  #.decode("utf-8")))
+        json_message = json.loads(body.decode())  #.decode("utf-8")))
+        if self.on_receive_callback:
+            self.on_receive_callback(json_message)
+
+        if self._executor:
+            future = self._executor.submit(self.on_message_callback, json_message)
+            self._futures.add(future)
+            future.add_done_callback(functools.partial(self.on_message_processed,
+                                                       self._channel, basic_deliver.delivery_tag, body))
+        else:
+            self.on_message_callback(json_message)
+
+            self.acknowledge_message(basic_deliver.delivery_tag)
+
+    def on_message_processed(self, channel, delivery_tag, body, future):
+        """Invoked in the worker thread when the processing of a message is
+        finished. The ack cannot be sent from this thread because pika is not
+        thread safe, the delivery tag is queued and acknowledged (or rejected
+        if the processing raised) by the IOLoop in acknowledge_processed.
+
+        :param pika.channel.Channel channel: The channel that delivered the message
+        :param int delivery_tag: The delivery tag from the Basic.Deliver frame
+        :param bytes body: The message body
+        :param concurrent.futures.Future future: The processing of the message
+
+        """
+        self._futures.discard(future)
+        if future.cancelled():
+            return
+        failed = future.exception() is not None
+        if failed:
+            self.logger.error('Error processing message %s: %s', delivery_tag, future.exception())
+        self._processed.put((channel, delivery_tag, body, failed))
+
+    def cancel_pending(self):
+        """Cancel the messages that are waiting for a worker. They are not
+        acknowledged, so RabbitMQ will redeliver them.
+
+        """
+        cancelled = len([future for future in list(self._futures) if future.cancel()])
+        if cancelled:
+            self.logger.info('Cancelled %i messages not yet processed', cancelled)
+        if self.on_cancel_callback:
+            self.on_cancel_callback()
+
+    def acknowledge_processed(self):
+        """Invoked periodically by the IOLoop timer. Acknowledge all the
+        messages processed by the workers, the messages whose processing
+        raised are rejected (see reject_message). The messages delivered by a
+        channel that has been closed in the meantime are redelivered by
+        RabbitMQ, so they are not acknowledged.
 
-        self.acknowledge_message(basic_deliver.delivery_tag)
+        """
+        while not self._processed.empty():
+            channel, delivery_tag, body, failed = self._processed.get()
+            if channel is self._channel and self._channel.is_open:
+                if failed:
+                    self.reject_message(delivery_tag, body)
+                else:
+                    self._failures.pop(body, None)
+                    self.acknowledge_message(delivery_tag)
+        if not self._closing:
+            self._connection.add_timeout(self.ACK_INTERVAL, self.acknowledge_processed)
 
     def acknowledge_message(self, delivery_tag):
         """Acknowledge the message delivery from RabbitMQ by sending a
@@ -284,6 +386,26 @@ class ConsumerRabbit(object):
         self.logger.info('Acknowledging message %s', delivery_tag)
         self._channel.basic_ack(delivery_tag)
 
+    def reject_message(self, delivery_tag, body):
+        """Give back to RabbitMQ a message whose processing raised (e.g. the
+        docker daemon or the images service not reachable) by sending a
+        Basic.Nack with requeue, so it is processed again. After
+        max_redeliveries failures the message is dropped (requeue=False).
+
+        :param int delivery_tag: The delivery tag from the Basic.Deliver frame
+        :param bytes body: The message body
+
+        """
+        failures = self._failures.get(body, 0) + 1
+        if failures > self.max_redeliveries:
+            self._failures.pop(body, None)
+            self.logger.error('Dropping message %s after %i failures: %s', delivery_tag, failures, body)
+            self._channel.basic_nack(delivery_tag, requeue=False)
+        else:
+            self._failures[body] = failures
+            self.logger.warning('Requeueing message %s (failure %i)', delivery_tag, failures)
+            self._channel.basic_nack(delivery_tag, requeue=True)
+
     def stop_consuming(self):
         """Tell RabbitMQ that you would like to stop consuming by sending the
         Basic.Cancel RPC command.
@@ -336,9 +458,15 @@ class ConsumerRabbit(object):
         communicate with RabbitMQ. All of the commands issued prior to starting
         the IOLoop will be buffered but not processed.
 
+        The messages still processed by the workers are not acknowledged,
+        RabbitMQ will redeliver them.
+
         """
         self.logger.info('Stopping')
         self._closing = True
+        self.cancel_pending()
+        if self._executor:
+            self._executor.shutdown(wait=False)
         self.stop_consuming()
         self._connection.ioloop.start()
         self.logger.info('Stopped')
@@ -0,0 +1,64 @@
+import sqlite3
+import threading
+import time
+import logging
+from .utils import get_logger
+
+
+class CrawlCheckpoint:
+    """
+    Persistent position of a crawl of the Docker Hub: the next search page to crawl and the number of images
+    already sent. The position is saved only when the messages of the pages before it have been confirmed
+    by RabbitMQ, so a crawl resumed from the checkpoint does not lose any image (some images of the last page
+    can be sent twice).
+    """
+
+    def __init__(self, path_db="crawl_checkpoint.db", name="crawl"):
+        """
+        :param name: the name of the crawl, a db can keep the checkpoints of several crawls.
+        """
+        self.logger = get_logger(__name__, logging.INFO)
+        self.name = name
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path_db, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS checkpoints "
+                         "(name TEXT PRIMARY KEY, page INTEGER NOT NULL, page_size INTEGER NOT NULL, "
+                         "sent_images INTEGER NOT NULL, max_images INTEGER, done INTEGER NOT NULL, updated REAL NOT NULL)")
+        self._db.commit()
+
+    def load(self):
+        """
+        :return: the last checkpoint {'page', 'page_size', 'sent_images', 'max_images', 'done'},
+                 None if the crawl has never been checkpointed.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT page, page_size, sent_images, max_images, done FROM checkpoints "
+                                   "WHERE name = ?", (self.name,)).fetchone()
+        if row is None:
+            return None
+        page, page_size, sent_images, max_images, done = row
+        return {'page': page, 'page_size': page_size, 'sent_images': sent_images, 'max_images': max_images,
+                'done': bool(done)}
+
+    def save(self, page, page_size, sent_images, max_images=None, done=False):
+        """
+        :param page: the next search page to crawl
+        :param sent_images: the number of the images sent (and confirmed) before the page
+        :param done: True if the crawl is finished
+        """
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO checkpoints "
+                             "(name, page, page_size, sent_images, max_images, done, updated) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (self.name, page, page_size, sent_images, max_images, int(done), time.time()))
+            self._db.commit()
+        self.logger.debug("Checkpoint: page {0}, {1} images sent{2}".format(page, sent_images, ", done" if done else ""))
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM checkpoints WHERE name = ?", (self.name,))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
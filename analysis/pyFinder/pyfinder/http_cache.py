@@ -0,0 +1,122 @@
+import sqlite3
+import threading
+import time
+import logging
+from .utils import get_logger
+
+
+class HttpCache:
+    """
+    Persistent cache of the GET responses of the Docker Hub, keyed by url.
+    The bodies are stored with their ETag/Last-Modified: the next request of the same url is a conditional request
+    (If-None-Match/If-Modified-Since) and a 304 Not Modified is answered with the stored body.
+    The urls that returned 404 are remembered for negative_ttl seconds and not requested again.
+    """
+
+    def __init__(self, path_db="hub_cache.db", negative_ttl=24 * 3600, max_entries=1000000, commit_batch=100):
+        """
+        :param commit_batch: the responses are committed every commit_batch updates (and by flush and close),
+                             not at every response: a commit waits for the disk and update is called by the loop
+                             of the async client
+        """
+        self.logger = get_logger(__name__, logging.INFO)
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.commit_batch = commit_batch
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path_db, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses "
+                         "(url TEXT PRIMARY KEY, status INTEGER NOT NULL, etag TEXT, last_modified TEXT, body BLOB, "
+                         "stored REAL NOT NULL)")
+        self._db.commit()
+        self.not_modified = 0    # 304 answered with the stored body
+        self.negative_hits = 0   # 404 answered without a request
+        self._updates = 0
+        self._uncommitted = 0
+        self.logger.info("Docker Hub cache: " + path_db)
+
+    def get(self, url):
+        """
+        :return: the stored response {'status', 'etag', 'last_modified', 'body'}, None if the url is not cached
+                 or its 404 is expired.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT status, etag, last_modified, body, stored FROM responses WHERE url = ?",
+                                   (url,)).fetchone()
+        if row is None:
+            return None
+        status, etag, last_modified, body, stored = row
+        if status == 404 and time.time() - stored > self.negative_ttl:
+            return None
+        return {'status': status, 'etag': etag, 'last_modified': last_modified, 'body': body}
+
+    def is_negative(self, entry):
+        """True if the entry is a 404 still valid: the request must not be sent."""
+        if entry is not None and entry['status'] == 404:
+            self.negative_hits += 1
+            return True
+        return False
+
+    def validators(self, entry):
+        """The headers of the conditional request of a stored response."""
+        headers = {}
+        if entry is not None and entry['status'] == 200:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def not_modified_body(self, entry):
+        """The stored body of a response revalidated with a 304."""
+        self.not_modified += 1
+        return entry['body']
+
+    def update(self, url, status, headers, body=None):
+        """
+        Store the response of a GET. Only the 200 with a validator and the 404 are stored.
+        :param headers: the headers of the response (case insensitive mapping)
+        """
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        with self._lock:
+            if status == 200 and (etag or last_modified):
+                self._db.execute("INSERT OR REPLACE INTO responses (url, status, etag, last_modified, body, stored) "
+                                 "VALUES (?, ?, ?, ?, ?, ?)", (url, 200, etag, last_modified, body, time.time()))
+            elif status == 404:
+                self._db.execute("INSERT OR REPLACE INTO responses (url, status, stored) VALUES (?, ?, ?)",
+                                 (url, 404, time.time()))
+            else:
+                self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self._prune()
+            self._uncommitted += 1
+            if self._uncommitted >= self.commit_batch:
+                self._commit()
+
+    def flush(self):
+        """Commit the responses stored since the last commit."""
+        with self._lock:
+            self._commit()
+
+    def _commit(self):
+        if self._uncommitted:
+            self._db.commit()
+            self._uncommitted = 0
+
+    def stats(self):
+        return {'not_modified': self.not_modified, 'negative_hits': self.negative_hits}
+
+    def _prune(self):
+        """Remove the oldest responses when the cache is bigger than max_entries (checked every 1000 updates)."""
+        self._updates += 1
+        if self._updates % 1000:
+            return
+        count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self._db.execute("DELETE FROM responses WHERE url IN "
+                             "(SELECT url FROM responses ORDER BY stored, rowid LIMIT ?)", (count - self.max_entries,))
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._db.close()
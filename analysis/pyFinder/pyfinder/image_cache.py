@@ -0,0 +1,163 @@
+import hashlib
+import threading
+import time
+import logging
+import docker.errors
+from .utils import get_logger
+
+
+class ImageCache:
+    """
+    The images scanned are kept in the docker daemon until their bytes exceed budget: then the least recently
+    used ones are removed. The images sharing the layers of the cached ones (e.g. the same base image) are pulled
+    downloading only their own layers.
+
+    The bytes on disk are estimated from the layers of the images (RootFS of docker inspect): an image adds only
+    the bytes of its layers not yet cached, its size minus the bytes of its cached layers split among its new
+    layers. The images that are the base of other cached images are evicted after the others, the pinned images and
+    the images in use are never evicted. The images already in the daemon when the scanner starts are not managed.
+    """
+
+    def __init__(self, client_daemon, budget, pinned=(), clock=time.time):
+        """
+        :param client_daemon: the ClientDaemon that pulls and removes the images
+        :param budget: the max number of bytes of the cached images
+        :param pinned: the images ("name:tag") always kept, e.g. the most common base images
+        """
+        self.logger = get_logger(__name__, logging.INFO)
+        self.client_daemon = client_daemon
+        self.budget = budget
+        self.pinned = set(image if ":" in image else self._name(image) for image in pinned)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._images = {}   # "name:tag" -> {'layers', 'chain', 'size', 'used', 'in_use'}
+        self._layers = {}   # layer -> number of cached images that contain it
+        self._prefixes = {}   # chain id -> number of cached images whose layers extend it
+        self._layer_bytes = {}   # layer -> estimated bytes of the cached layer
+        self._bytes = 0   # the estimated bytes of all the cached layers
+        self.layer_hits = 0
+        self.layer_misses = 0
+        self.evicted = 0
+
+    @staticmethod
+    def _name(repo_name, tag="latest"):
+        return repo_name + ":" + tag
+
+    @staticmethod
+    def _chain(layers):
+        """The chain ids of the prefixes of the layers (as the ChainID of docker): equal ids, equal prefixes."""
+        chain = []
+        chain_id = ""
+        for layer in layers:
+            chain_id = hashlib.sha256((chain_id + " " + layer).encode()).hexdigest()
+            chain.append(chain_id)
+        return chain
+
+    def pull_pinned(self):
+        """Pull the pinned images (if they are not in the daemon) and add them to the cache."""
+        for image in sorted(self.pinned):
+            repo_name, tag = image.rsplit(":", 1)
+            self.client_daemon.pull_image(repo_name, tag)
+            self.acquire(repo_name, tag)
+            self.release(repo_name, tag)
+
+    def acquire(self, repo_name, tag="latest"):
+        """
+        Add the image just pulled to the cache, it cannot be evicted until release().
+        :return: False if the image is not in the daemon
+        """
+        name = self._name(repo_name, tag)
+        try:
+            inspect = self.client_daemon.inspect_image(name)
+        except docker.errors.NotFound:
+            return False
+        layers = tuple((inspect.get('RootFS') or {}).get('Layers') or [inspect['Id']])
+        with self._lock:
+            image = self._images.get(name)
+            if image is not None and image['layers'] != layers:
+                # the tag points to a new version of the image
+                self._remove_layers(image)
+                image = None
+            if image is None:
+                hits = sum(1 for layer in layers if layer in self._layers)
+                self.layer_hits += hits
+                self.layer_misses += len(layers) - hits
+                image = {'layers': layers, 'chain': self._chain(layers), 'size': inspect.get('Size', 0), 'in_use': 0}
+                self._images[name] = image
+                self._add_layers(image)
+            image['in_use'] += 1
+            image['used'] = self._clock()
+        return True
+
+    def release(self, repo_name, tag="latest"):
+        """The scan of the image is finished: it can be evicted. Evict the images above the budget."""
+        with self._lock:
+            image = self._images.get(self._name(repo_name, tag))
+            if image is not None:
+                image['in_use'] = max(0, image['in_use'] - 1)
+                image['used'] = self._clock()
+            victims = self._victims()
+        for name in victims:
+            self._evict(name)
+
+    def usage(self):
+        """The estimated bytes on disk of the cached images."""
+        with self._lock:
+            return self._bytes
+
+    def stats(self):
+        with self._lock:
+            return {'images': len(self._images), 'bytes': self._bytes, 'budget': self.budget,
+                    'layer_hits': self.layer_hits, 'layer_misses': self.layer_misses, 'evicted': self.evicted}
+
+    def _victims(self):
+        """The images to evict (least recently used first, the bases last) to go back below the budget."""
+        if self._bytes <= self.budget:
+            return []
+        # an image is the base of another one if its layers are a prefix of the layers of the other one
+        candidates = sorted((name for name, image in self._images.items()
+                             if not image['in_use'] and name not in self.pinned),
+                            key=lambda name: (self._images[name]['chain'][-1] in self._prefixes,
+                                              self._images[name]['used']))
+        victims = []
+        for name in candidates:
+            if self._bytes <= self.budget:
+                break
+            victims.append(name)
+            self._remove_layers(self._images.pop(name))
+        return victims
+
+    def _add_layers(self, image):
+        layers = set(image['layers'])   # an empty layer can be repeated
+        new_layers = sorted(layers.difference(self._layers))
+        if new_layers:
+            cached = sum(self._layer_bytes[layer] for layer in layers.intersection(self._layers))
+            new_bytes = max(0, image['size'] - cached)
+            for i, layer in enumerate(new_layers):
+                self._layer_bytes[layer] = new_bytes // len(new_layers) + (i < new_bytes % len(new_layers))
+            self._bytes += new_bytes
+        for layer in layers:
+            self._layers[layer] = self._layers.get(layer, 0) + 1
+        for chain_id in image['chain'][:-1]:
+            self._prefixes[chain_id] = self._prefixes.get(chain_id, 0) + 1
+
+    def _remove_layers(self, image):
+        """Remove the image from the layer counts, the bytes of the layers of no other image are freed."""
+        for layer in set(image['layers']):
+            self._layers[layer] -= 1
+            if not self._layers[layer]:
+                del self._layers[layer]
+                self._bytes -= self._layer_bytes.pop(layer)
+        for chain_id in image['chain'][:-1]:
+            self._prefixes[chain_id] -= 1
+            if not self._prefixes[chain_id]:
+                del self._prefixes[chain_id]
+
+    def _evict(self, name):
+        try:
+            self.client_daemon.remove_image(name)
+            self.evicted += 1
+            self.logger.info("[{0}] evicted from the image cache".format(name))
+        except docker.errors.APIError as e:
+            # e.g. used by a container: it is not managed by the cache anymore
+            self.logger.error(e)
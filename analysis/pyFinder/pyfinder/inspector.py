@@ -0,0 +1,153 @@
+import fnmatch
+import posixpath
+import tarfile
+
+# the files of a layer that are read by the inspector
+RELEASE_FILES = ['etc/*release', 'usr/lib/os-release']
+PACKAGE_DBS = {'var/lib/dpkg/status': 'dpkg', 'lib/apk/db/installed': 'apk'}
+BIN_DIRS = ['bin', 'sbin', 'usr/bin', 'usr/sbin', 'usr/local/bin', 'usr/local/sbin']
+# the links of update-alternatives (e.g. usr/bin/java -> etc/alternatives/java -> usr/lib/jvm/.../bin/java)
+ALTERNATIVES_DIR = 'etc/alternatives'
+
+# a file bigger than this size is not read (a package database is some MB)
+MAX_FILE_SIZE = 32 * 1024 * 1024
+
+WHITEOUT_PREFIX = '.wh.'
+WHITEOUT_OPAQUE = '.wh..wh..opq'
+
+
+def normalize_path(name):
+    """Path of a tar member without the leading './' or '/'."""
+    name = posixpath.normpath(name)
+    return name.lstrip('/') if name != '.' else ''
+
+
+def is_release_file(path):
+    return any(fnmatch.fnmatchcase(path, pattern) for pattern in RELEASE_FILES)
+
+
+def is_binary(path):
+    return posixpath.dirname(path) in BIN_DIRS
+
+
+def is_alternative(path):
+    return posixpath.dirname(path) == ALTERNATIVES_DIR
+
+
+def parse_dpkg_status(text):
+    """
+    Parse the dpkg database (/var/lib/dpkg/status).
+    :return: dict {package name: version} of the installed packages
+    """
+    packages = {}
+    for paragraph in text.split("\n\n"):
+        fields = {}
+        for line in paragraph.splitlines():
+            if ':' in line and not line.startswith(' '):
+                key, value = line.split(':', 1)
+                fields[key] = value.strip()
+        if 'Package' in fields and 'Version' in fields and fields.get('Status', '').endswith(' installed'):
+            packages[fields['Package']] = fields['Version']
+    return packages
+
+
+def parse_apk_installed(text):
+    """
+    Parse the apk database of Alpine (/lib/apk/db/installed).
+    :return: dict {package name: version} of the installed packages
+    """
+    packages = {}
+    for paragraph in text.split("\n\n"):
+        fields = dict(line.split(':', 1) for line in paragraph.splitlines() if line[1:2] == ':')
+        if 'P' in fields and 'V' in fields:
+            packages[fields['P']] = fields['V']
+    return packages
+
+
+def inspect_layer(fileobj):
+    """
+    Read the tarball of a layer as a stream (it is never written to the disk) and take only the files
+    that are used to find the distribution and the software.
+
+    :param fileobj: file-like object of the (compressed) tarball of the layer
+    :return: the facts of the layer: {'files': {path: fact or None if the path is removed by the layer},
+                                      'opaque': [directories whose lower content is hidden by the layer],
+                                      'executables': [names of the executables written outside the bin
+                                                      directories, e.g. java of usr/lib/jvm/.../bin/java]}
+             A fact is {'release': text}, {'packages': {name: version}}, {'binary': True} or
+             {'alternative': True} (a link of etc/alternatives).
+    """
+    files = {}
+    opaque = []
+    executables = set()
+    with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+        for member in tar:
+            path = normalize_path(member.name)
+            directory, name = posixpath.split(path)
+            if name == WHITEOUT_OPAQUE:
+                opaque.append(directory)
+            elif name.startswith(WHITEOUT_PREFIX):
+                files[posixpath.join(directory, name[len(WHITEOUT_PREFIX):])] = None
+            elif is_binary(path) and (member.isfile() or member.issym() or member.islnk()):
+                files[path] = {'binary': True}
+            elif is_alternative(path) and member.issym():
+                files[path] = {'alternative': True}
+            elif member.isfile() and member.size <= MAX_FILE_SIZE and is_release_file(path):
+                files[path] = {'release': _read_text(tar, member)}
+            elif member.isfile() and member.size <= MAX_FILE_SIZE and path in PACKAGE_DBS:
+                text = _read_text(tar, member)
+                if PACKAGE_DBS[path] == 'dpkg':
+                    files[path] = {'packages': parse_dpkg_status(text)}
+                else:
+                    files[path] = {'packages': parse_apk_installed(text)}
+            elif (member.isfile() or member.islnk()) and member.mode & 0o111:
+                executables.add(name)
+    return {'files': files, 'opaque': opaque, 'executables': sorted(executables)}
+
+
+def _read_text(tar, member):
+    return tar.extractfile(member).read().decode(errors='replace')
+
+
+def compose_layers(list_layer_facts):
+    """
+    Compose the facts of the layers as the union file system does.
+    :param list_layer_facts: the facts of the layers, from the base layer to the top one.
+    :return: dict {path: fact} of the files visible in the image
+    """
+    image_files = {}
+    for facts in list_layer_facts:
+        for directory in facts['opaque']:
+            _remove_tree(image_files, directory)
+        # the whiteouts hide the files of the lower layers only
+        for path, fact in facts['files'].items():
+            if fact is None:
+                _remove_tree(image_files, path)
+        for path, fact in facts['files'].items():
+            if fact is not None:
+                image_files[path] = fact
+    return image_files
+
+
+def _remove_tree(image_files, path):
+    prefix = path + '/' if path else ''
+    for existing in [p for p in image_files if p == path or p.startswith(prefix)]:
+        del image_files[existing]
+
+
+def release_text(image_files):
+    """The content of all the release files of the image, like 'cat /etc/*release'."""
+    return "\n".join(fact['release'] for path, fact in sorted(image_files.items()) if 'release' in fact)
+
+
+def installed_packages(image_files):
+    packages = {}
+    for path, fact in image_files.items():
+        if 'packages' in fact:
+            packages.update(fact['packages'])
+    return packages
+
+
+def binaries(image_files):
+    """The names of the executables in the bin directories of the image."""
+    return set(posixpath.basename(path) for path, fact in image_files.items() if 'binary' in fact)
@@ -0,0 +1,46 @@
+"""
+Lanes of the scans by size of the images: the crawler publishes an image with the routing key of its lane
+(e.g. images.scan.small) into the queue of the lane (e.g. images.small), and a scanner consumes a single lane,
+so that the hosts of the big images do not delay the small ones.
+"""
+
+SIZE_LANES = "small:200M,medium:1G,large"
+
+UNITS = {'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30, 'T': 2 ** 40}
+
+
+def parse_size(size):
+    """ "200M" -> 209715200 (K, M, G, T are powers of 1024, a number without unit is in bytes)"""
+    size = size.strip().upper().rstrip('B')
+    if size and size[-1] in UNITS:
+        return int(float(size[:-1]) * UNITS[size[-1]])
+    return int(size)
+
+
+def parse_lanes(spec=SIZE_LANES):
+    """
+    "small:200M,medium:1G,large" -> [('small', 209715200), ('medium', 1073741824), ('large', None)]
+    An image goes in the first lane whose max size is greater than its size, the last lane has no max size.
+    """
+    lanes = []
+    for part in spec.split(","):
+        name, _, max_size = part.strip().partition(":")
+        lanes.append((name, parse_size(max_size) if max_size else None))
+    sizes = [max_size for _, max_size in lanes[:-1]]
+    if not lanes[0][0] or None in sizes or sizes != sorted(sizes) or lanes[-1][1] is not None:
+        raise ValueError("lanes must be NAME:SIZE,...,NAME with increasing sizes: " + spec)
+    return lanes
+
+
+def size_lane(full_size, lanes):
+    """The name of the lane of an image of full_size bytes (an unknown size goes in the last lane)."""
+    if full_size is not None:
+        for name, max_size in lanes:
+            if max_size is None or full_size < max_size:
+                return name
+    return lanes[-1][0]
+
+
+def lane_name(name, lane):
+    """The queue or the routing key of a lane: images -> images.small"""
+    return name + "." + lane if lane else name
@@ -0,0 +1,84 @@
+import json
+import sqlite3
+import threading
+import time
+import logging
+from .utils import get_logger
+
+
+class LayerCache:
+    """
+    Persistent cache of the facts found in a layer (see inspector.inspect_layer), keyed by the digest of the layer.
+    A layer is immutable, so its facts never change: the layers shared by many images (debian, alpine, ubuntu ...)
+    are downloaded and inspected only once.
+    """
+
+    def __init__(self, path_db="layers.db", max_layers=100000, touch_batch=100):
+        """
+        :param touch_batch: the last use of the layers read from the cache is kept in memory and written
+                            every touch_batch hits (and by put and close), not at every hit
+        """
+        self.logger = get_logger(__name__, logging.INFO)
+        self.max_layers = max_layers
+        self.touch_batch = touch_batch
+        self._lock = threading.Lock()   # the scanner can scan several images concurrently
+        self._db = sqlite3.connect(path_db, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS layers "
+                         "(digest TEXT PRIMARY KEY, facts TEXT NOT NULL, last_used REAL NOT NULL)")
+        self._db.commit()
+        self._count = self._db.execute("SELECT COUNT(*) FROM layers").fetchone()[0]
+        self._touched = {}   # digest -> last use not yet written
+        self.hits = 0
+        self.misses = 0
+        self.logger.info("Layer cache: " + path_db)
+
+    def get(self, digest):
+        """
+        :return: the facts of the layer, None if the layer has never been inspected.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT facts FROM layers WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[digest] = time.time()
+            if len(self._touched) >= self.touch_batch:
+                self._write_touched()
+                self._db.commit()
+        return json.loads(row[0])
+
+    def put(self, digest, facts):
+        with self._lock:
+            self._touched.pop(digest, None)
+            cursor = self._db.execute("INSERT OR IGNORE INTO layers (digest, facts, last_used) VALUES (?, ?, ?)",
+                                      (digest, json.dumps(facts), time.time()))
+            if cursor.rowcount:
+                self._count += 1
+            else:
+                self._db.execute("UPDATE layers SET facts = ?, last_used = ? WHERE digest = ?",
+                                 (json.dumps(facts), time.time(), digest))
+            self._write_touched()
+            self._prune()
+            self._db.commit()
+
+    def _write_touched(self):
+        if self._touched:
+            self._db.executemany("UPDATE layers SET last_used = ? WHERE digest = ?",
+                                 [(used, digest) for digest, used in self._touched.items()])
+            self._touched.clear()
+
+    def _prune(self):
+        """Remove the least recently used layers when the cache is bigger than max_layers."""
+        if self._count > self.max_layers:
+            removed = self._count - self.max_layers
+            self._db.execute("DELETE FROM layers WHERE digest IN "
+                             "(SELECT digest FROM layers ORDER BY last_used, rowid LIMIT ?)", (removed,))
+            self._count = self.max_layers
+            self.logger.info("Removed {0} layers from the cache".format(removed))
+
+    def close(self):
+        with self._lock:
+            self._write_touched()
+            self._db.commit()
+            self._db.close()
@@ -0,0 +1,113 @@
+import posixpath
+import re
+from .inspector import BIN_DIRS, RELEASE_FILES, ALTERNATIVES_DIR, is_binary, is_alternative, is_release_file
+
+
+def diff_layers(old_layers, new_layers):
+    """
+    The layers changed since the last scan of an image. The layers of the common base (the longest common prefix
+    of the two lists) are identical and so are the files they contain: only the layers above it can change
+    the image.
+
+    :param old_layers: the digests of the layers at the last scan, from the base layer to the top one
+    :param new_layers: the digests of the current layers
+    :return: (the layers removed from the image, the layers added to the image)
+    """
+    common = 0
+    while common < min(len(old_layers), len(new_layers)) and old_layers[common] == new_layers[common]:
+        common += 1
+    return list(old_layers[common:]), list(new_layers[common:])
+
+
+def _covers(tree, path):
+    """True if removing the tree (a whiteout or an opaque directory) removes the path."""
+    return tree == '' or path == tree or path.startswith(tree + '/')
+
+
+def changed_software(removed_facts, added_facts):
+    """
+    What the changed layers (see diff_layers) can change in the results of the probes: the release files
+    change the distribution, the executables (in the bin directories or elsewhere, e.g. usr/lib/jvm/.../bin/java),
+    the alternatives and the files removed change the probes of their names (see probe_executable). The links of
+    the common base are unknown: a changed python2.7 can be the target of python, so the versioned names match
+    too (see Rescan). A package database is not compared: the executables upgraded by a package are in the layer.
+
+    :param removed_facts: the facts (see inspector.inspect_layer) of the layers removed from the image
+    :param added_facts: the facts of the layers added to the image
+    :return: (True if the distribution can be changed, the names of the executables changed),
+             the names are None if every software can be changed: a bin directory or the alternatives are
+             removed as a whole, or the facts of a layer are inspected before the executables were recorded.
+    """
+    distro = False
+    names = set()
+    for facts in removed_facts + added_facts:
+        if 'executables' not in facts:
+            names = None
+        elif names is not None:
+            names.update(facts['executables'])
+        trees = list(facts['opaque']) + [path for path, fact in facts['files'].items() if fact is None]
+        for tree in trees:
+            if any(_covers(tree, directory) for directory in BIN_DIRS + [ALTERNATIVES_DIR]):
+                names = None
+            if is_release_file(tree) or any(_covers(tree, posixpath.dirname(pattern)) for pattern in RELEASE_FILES):
+                distro = True
+        for path, fact in facts['files'].items():
+            if is_release_file(path):
+                distro = True
+            elif (fact is None or is_binary(path) or is_alternative(path)) and names is not None:
+                names.add(posixpath.basename(path))
+    return distro, names
+
+
+def probe_executable(probe):
+    """The name of the executable run by a software probe, e.g. python for "python --version"."""
+    return posixpath.basename(probe.command.split()[0])
+
+
+def runs_changed(executable, names):
+    """True if the executable is one of the names changed or its versioned name (python: python2.7, python3)."""
+    versioned = re.compile(re.escape(executable) + r'[-.]?[0-9][0-9.]*$')
+    return any(name == executable or versioned.match(name) for name in names)
+
+
+class Rescan:
+    """
+    The incremental scan of an image whose layers are changed: only the probes of the software (and of the
+    distribution) whose files are in the changed layers are run again, the other results are taken from the
+    last scan.
+    """
+
+    def __init__(self, plan, previous, digest, layers, distro, software):
+        """
+        :param plan: the probe plan of the catalog, the same catalog of the last scan
+        :param previous: the description of the image at the last scan ('distro', 'softwares')
+        :param digest: the current digest of the manifest
+        :param layers: the current digests of the layers
+        :param distro: True if the distribution probes must be run again
+        :param software: the names of the executables changed by the changed layers (see changed_software)
+        """
+        self.plan = plan
+        self.previous = previous
+        self.digest = digest
+        self.layers = layers
+        self.distro = distro
+        self.software = set(probe.name for probe in plan.software if runs_changed(probe_executable(probe), software))
+
+    @property
+    def probes(self):
+        """True if at least a probe must be run (the image is needed in the daemon)."""
+        return self.distro or bool(self.software)
+
+    def probe_plan(self):
+        """The plan with only the probes to run again."""
+        return self.plan.subset(system=self.distro, names=self.software)
+
+    def merge(self, dict_image):
+        """Add to dict_image (the results of the probes run again) the results of the last scan not changed."""
+        if not self.distro and self.previous.get('distro'):
+            dict_image['distro'] = self.previous['distro']
+        found = {sw['software']: sw for sw in dict_image.get('softwares', [])}
+        for sw in self.previous.get('softwares') or []:
+            if sw['software'] not in self.software:
+                found[sw['software']] = sw
+        dict_image['softwares'] = [found[probe.name] for probe in self.plan.software if probe.name in found]
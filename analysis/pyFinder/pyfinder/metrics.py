@@ -0,0 +1,197 @@
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from .utils import get_logger
+
+logger = get_logger(__name__, logging.INFO)
+
+# seconds, from a request to the Docker Hub to the scan of a big image
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class Registry:
+    """The metrics of the process, written in the Prometheus text format by render()."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append("# HELP {0} {1}".format(metric.name, metric.help))
+            lines.append("# TYPE {0} {1}".format(metric.name, metric.type))
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = ('{0}="{1}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+               for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if value not in (float("inf"), float("-inf")) else ("+Inf" if value > 0 else "-Inf")
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}   # label values -> value
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError("{0}: labels {1} expected, {2} given".format(self.name, self.label_names, sorted(labels)))
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Counter(Metric):
+    """A value that only increases (e.g. the number of requests)."""
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return ["{0}{1} {2}".format(self.name, _labels(self.label_names, key), _number(value))
+                    for key, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    """A value that goes up and down (e.g. the rate of the requests)."""
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """The distribution of the observed values (e.g. latencies) in cumulative buckets, with their sum and count."""
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        super(Histogram, self).__init__(name, help, labels, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the with block (also when it raises)."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+            return sum(counts)
+
+    def samples(self):
+        lines = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append("{0}_bucket{1} {2}".format(self.name, _labels(self.label_names, key,
+                                                                               [("le", _number(bound))]), cumulative))
+                lines.append("{0}_sum{1} {2}".format(self.name, _labels(self.label_names, key), _number(total)))
+                lines.append("{0}_count{1} {2}".format(self.name, _labels(self.label_names, key), cumulative))
+        return lines
+
+
+# the metrics of the scanner
+SCAN_PHASE_SECONDS = Histogram("dofinder_scan_phase_seconds", "Seconds spent in each phase of the scan of an image",
+                               ["phase"])
+PROBE_SECONDS = Histogram("dofinder_probe_seconds", "Seconds spent running a probe in a container",
+                          ["software", "status"])
+IMAGES_PROCESSED = Counter("dofinder_images_processed_total", "Images received by the scanner, by action",
+                           ["action"])
+
+# the metrics of the crawler
+IMAGES_PUBLISHED = Counter("dofinder_images_published_total", "Images sent to RabbitMQ by the crawler")
+IMAGES_DUPLICATED = Counter("dofinder_images_duplicated_total", "Images not sent because recently published")
+PAGES_CRAWLED = Counter("dofinder_pages_crawled_total", "Search pages of the Docker Hub crawled")
+
+# the requests to the Docker Hub (ClientHub, ClientHubAsync)
+HUB_REQUESTS = Counter("dofinder_hub_requests_total", "Requests to the Docker Hub by status code (error: no response)",
+                       ["status"])
+HUB_REQUEST_SECONDS = Histogram("dofinder_hub_request_seconds", "Seconds of the requests to the Docker Hub")
+HUB_RATE = Gauge("dofinder_hub_rate", "Current max rate of the requests to the Docker Hub (requests per second)")
+HUB_CONCURRENCY = Gauge("dofinder_hub_concurrency", "Current max number of requests in flight to the Docker Hub")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_server(port, host="", registry=REGISTRY):
+    """Serve the metrics on http://host:port/metrics from a daemon thread. :return: the server"""
+    handler = type("Handler", (_Handler,), {'registry': registry})
+    server = _Server((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    logger.info("Metrics on http://{0}:{1}/metrics".format(host or "0.0.0.0", server.server_address[1]))
+    return server
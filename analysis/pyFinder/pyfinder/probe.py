@@ -0,0 +1,124 @@
+import copy
+import re
+import uuid
+
+# prefix of the line printed before the output of every probe of a batch script
+MARKER_PREFIX = "==DOFINDER-PROBE-"
+
+# seconds after which a command of a batch script is killed (the default --probe-timeout of the scanner)
+COMMAND_TIMEOUT = 30
+
+
+def new_marker():
+    """
+    Return a random marker used to delimit the output of the probes in a batch script.
+    The random part avoids that the output of a command can be confused with a delimiter.
+    """
+    return MARKER_PREFIX + uuid.uuid4().hex
+
+
+def build_probe_script(commands, marker, timeout=COMMAND_TIMEOUT):
+    """
+    Build a single shell script that runs all the commands one after the other.
+    The output of each command is preceded by a line "<marker> <index>". The commands read /dev/null (an
+    interactive binary exits) and a command still running after timeout seconds is killed, the next one is run.
+
+    :param commands: list of command strings (e.g. ['python --version', 'bash -c "cat /etc/*release"'])
+    :param marker: the delimiter returned by new_marker()
+    :param timeout: seconds of every command, None or 0: no limit
+    :return: the script to be passed to "/bin/sh -c"
+    """
+    lines = []
+    for index, command in enumerate(commands):
+        lines.append("echo '{0} {1}'".format(marker, index))
+        if timeout:
+            lines.append("{0} 2>&1 </dev/null &".format(command))
+            lines.append("probe_pid=$!")
+            lines.append("(sleep {0}; kill -9 $probe_pid) >/dev/null 2>&1 &".format(timeout))
+            lines.append("watchdog_pid=$!")
+            lines.append("wait $probe_pid 2>/dev/null")
+            lines.append("kill $watchdog_pid >/dev/null 2>&1")
+        else:
+            lines.append("{0} 2>&1 </dev/null".format(command))
+    return "\n".join(lines) + "\n"
+
+
+def split_probe_output(output, marker, num_commands):
+    """
+    Split the output of a batch script in the output of every single command.
+
+    :param output: the (decoded) output of the container that run the script
+    :param marker: the delimiter used in build_probe_script()
+    :param num_commands: the number of commands in the script
+    :return: list with the output of each command. A command that did not print its marker gets None.
+    """
+    sections = [None] * num_commands
+    current = None
+    for line in output.splitlines():
+        line = line.rstrip("\r")   # with tty=True docker returns \r\n line endings
+        if line.startswith(marker):
+            index = line[len(marker):].strip()
+            if index.isdigit() and int(index) < num_commands:
+                current = int(index)
+                sections[current] = ""
+                continue
+        if current is not None:
+            sections[current] += line + "\n"
+    return sections
+
+
+class Probe:
+    """A command to run in the image and the compiled regex that extracts the version from its output."""
+
+    def __init__(self, name, command, regex):
+        self.name = name
+        self.command = command
+        self.regex = re.compile(regex)
+
+    def search(self, output):
+        """
+        :return: the matched string, None if the regex does not match (or the output is None)
+        """
+        match = self.regex.search(output) if output is not None else None
+        return match.group(0) if match else None
+
+
+class ProbePlan:
+    """
+    The probes of a version of the software catalog: the system probes (distribution) and the software probes,
+    with the regexes already compiled and the batch script already built.
+    """
+
+    def __init__(self, system, software, version=None, timeout=COMMAND_TIMEOUT):
+        """
+        :param system: list of (command, regex) of the distribution
+        :param software: list of the software of the catalog [{'name':.., 'cmd':.., 'regex':..}]
+        :param version: the version of the catalog (ETag of the software service)
+        :param timeout: seconds after which a command of the batch script is killed, None or 0: no limit
+        """
+        self.version = version
+        self.timeout = timeout
+        self.system = [Probe(None, cmd, regex) for cmd, regex in system]
+        self.software = [Probe(sw['name'], sw['name'] + " " + sw['cmd'], sw['regex']) for sw in software]
+        self.commands = [probe.command for probe in self.system + self.software]
+        self.marker = new_marker()
+        self.script = build_probe_script(self.commands, self.marker, self.timeout)
+
+    def subset(self, system=True, names=None):
+        """
+        The plan with only some probes (e.g. the probes to run again in an incremental scan).
+        :param system: if False the system probes are not in the plan
+        :param names: the names of the software probes in the plan, None: all
+        """
+        plan = copy.copy(self)
+        plan.system = self.system if system else []
+        plan.software = [probe for probe in self.software if names is None or probe.name in names]
+        plan.commands = [probe.command for probe in plan.system + plan.software]
+        plan.marker = new_marker()
+        plan.script = build_probe_script(plan.commands, plan.marker, plan.timeout)
+        return plan
+
+    def split_output(self, output):
+        """Split the output of the batch script in (system outputs, software outputs)."""
+        sections = split_probe_output(output, self.marker, len(self.commands))
+        return sections[:len(self.system)], sections[len(self.system):]
@@ -0,0 +1,101 @@
+import cProfile
+import glob
+import os
+import re
+import signal
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from .utils import get_logger
+
+
+class Profiler:
+    """
+    CPU profiles (cProfile) of the units of work: an image scanned, a page crawled. Every unit is written in
+    directory as <kind>-<name>-<time>-<pid>-<n>.prof (readable with pstats, snakeviz, flameprof), only the last
+    keep files are kept.
+
+    The profiles are taken always (enabled=True) or for window seconds after the process receives SIGUSR1
+    (see install_signal), e.g. kill -USR1 <pid> on a scanner that is slow in production.
+    """
+
+    def __init__(self, directory="profiles", keep=100, enabled=False, window=60, clock=time.time):
+        self.logger = get_logger(__name__, logging.INFO)
+        self.directory = directory
+        self.keep = keep
+        self.always = enabled
+        self.window = window
+        self._clock = clock
+        self._until = 0
+        self._lock = threading.Lock()
+        self._count = 0
+        self._active = threading.local()   # a unit inside another unit of the same thread is not profiled again
+
+    def __getstate__(self):
+        # the profiler of a crawler is given to the worker processes of a sharded crawl
+        state = dict(self.__dict__)
+        del state['_lock'], state['_active'], state['logger']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.logger = get_logger(__name__, logging.INFO)
+        self._lock = threading.Lock()
+        self._active = threading.local()
+
+    @property
+    def enabled(self):
+        return self.always or self._clock() < self._until
+
+    def enable_for(self, seconds):
+        self._until = self._clock() + seconds
+        self.logger.info("Profiling the next {0} seconds in {1}".format(seconds, self.directory))
+
+    def install_signal(self, signum=signal.SIGUSR1):
+        """On signum the profiles are taken for window seconds (it must be called in the main thread)."""
+        signal.signal(signum, lambda signum, frame: self.enable_for(self.window))
+
+    @contextmanager
+    def profile(self, kind, name):
+        """Profile the with block (in the current thread) if the profiler is enabled."""
+        if not self.enabled or getattr(self._active, 'profiling', False):
+            yield
+            return
+        profile = cProfile.Profile()
+        self._active.profiling = True
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._active.profiling = False
+            self._dump(profile, kind, name)
+
+    def _dump(self, profile, kind, name):
+        with self._lock:
+            self._count += 1
+            count = self._count
+        file_name = "{0}-{1}-{2}-{3}-{4}.prof".format(kind, re.sub(r"[^A-Za-z0-9_.-]+", "_", str(name)),
+                                                       time.strftime("%Y%m%d-%H%M%S"), os.getpid(), count)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            profile.dump_stats(os.path.join(self.directory, file_name))
+            self._rotate()
+        except OSError as e:
+            self.logger.error("Profile not saved: {0}".format(e))
+
+    def _rotate(self):
+        with self._lock:
+            files = []
+            for path in glob.glob(os.path.join(self.directory, "*.prof")):
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass   # removed by another process
+            files.sort()
+            for _, path in files[:max(0, len(files) - self.keep)]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass   # removed by another process
@@ -1,5 +1,7 @@
 import pika
+from collections import OrderedDict
 from pyfinder import utils
+from .lanes import lane_name
 import logging
 
 
@@ -23,28 +25,51 @@ class PublisherRabbit(object):
     # QUEUE = 'images'
     # ROUTING_KEY = 'images.scan'
 
-    def __init__(self, amqp_url, exchange="dofinder", queue="images", route_key="images.scan"):
+    # messages published before giving back the control to the IOLoop (that receives the confirmations)
+    PUBLISH_BATCH = 100
+
+    def __init__(self, amqp_url, exchange="dofinder", queue="images", route_key="images.scan",
+                 max_unconfirmed=1000, max_priority=0, lanes=None):
         """Setup the example publisher object, passing in the URL we will use
         to connect to RabbitMQ.
 
         :param str amqp_url: The URL for connecting to RabbitMQ
+        :param int max_unconfirmed: max number of messages published and not
+            yet confirmed, the publisher waits the confirmations when the
+            window is full
+        :param int max_priority: if > 0 the queue is a priority queue
+            (x-max-priority) and the messages can have a priority
+        :param list lanes: the names of the lanes (see lanes.py): a queue
+            queue.lane bound with route_key.lane is declared for every lane
+            and the messages are published in the queue of their lane
 
         """
         self._connection = None
         self._channel = None
-        self._deliveries = []
+        self._deliveries = OrderedDict()   # delivery tag -> (message number, message, priority, lane) not yet confirmed
+        self._republish = []               # (message number, message, priority, lane) nacked, to be published again
+        self._delivery_tag = 0
         self._acked = 0
         self._nacked = 0
-        self._message_number = 0
+        self._message_number = 0           # messages taken from the generator
         self._stopping = False
         self._url = amqp_url
         self._closing = False
+        self._barriers = []            # (message number, callback) see add_barrier()
+        self._published_all = False
+        self._batch_scheduled = False
+        self.max_unconfirmed = max_unconfirmed
+        self.max_priority = max_priority
 
         self.exchange = exchange
         self.exchange_type = "direct"
         self.queue = queue
         self.routing_key = route_key
-
+        self.lanes = lanes
+        # (queue, routing key) to declare and bind, the next one is _bindings[_bound]
+        self._bindings = [(lane_name(queue, lane), lane_name(route_key, lane)) for lane in lanes] if lanes \
+            else [(queue, route_key)]
+        self._bound = 0
 
         self.logger = utils.get_logger(__name__, logging.DEBUG)
 
@@ -108,10 +133,16 @@ class PublisherRabbit(object):
         closed. See the on_connection_closed method.
 
         """
-        self._deliveries = []
+        if self._deliveries:
+            # the messages not confirmed may be lost: they are published again on the new channel
+            self.logger.warning('%i messages not confirmed before the reconnection are published again',
+                                len(self._deliveries))
+        self._republish = list(self._deliveries.values()) + self._republish
+        self._deliveries = OrderedDict()
+        self._delivery_tag = 0
+        self._batch_scheduled = False
         self._acked = 0
         self._nacked = 0
-        self._message_number = 0
 
         # This is the old connection IOLoop instance, stop its ioloop
         self._connection.ioloop.stop()
@@ -193,7 +224,8 @@ class PublisherRabbit(object):
 
         """
         self.logger.info('Exchange declared')
-        self.setup_queue(self.queue)
+        self._bound = 0
+        self.setup_queue(self._bindings[0][0])
 
     def setup_queue(self, queue_name):
         """Setup the queue on RabbitMQ by invoking the Queue.Declare RPC
@@ -204,7 +236,8 @@ class PublisherRabbit(object):
 
         """
         self.logger.info('Declaring queue %s', queue_name)
-        self._channel.queue_declare(self.on_queue_declareok, queue_name, durable=True)
+        arguments = {'x-max-priority': self.max_priority} if self.max_priority else None
+        self._channel.queue_declare(self.on_queue_declareok, queue_name, durable=True, arguments=arguments)
 
     def on_queue_declareok(self, method_frame):
         """Method invoked by pika when the Queue.Declare RPC call made in
@@ -216,17 +249,22 @@ class PublisherRabbit(object):
         :param pika.frame.Method method_frame: The Queue.DeclareOk frame
 
         """
+        queue, routing_key = self._bindings[self._bound]
         self.logger.info('Binding %s to %s with %s',
-                    self.exchange, self.queue, self.routing_key)
-        self._channel.queue_bind(self.on_bindok, self.queue,
-                                 self.exchange, self.routing_key)
+                    self.exchange, queue, routing_key)
+        self._channel.queue_bind(self.on_bindok, queue,
+                                 self.exchange, routing_key)
 
     def on_bindok(self, unused_frame):
         """This method is invoked by pika when it receives the Queue.BindOk
         response from RabbitMQ. Since we know we're now setup and bound, it's
-        time to start publishing."""
+        time to start publishing (when all the queues of the lanes are bound)."""
         self.logger.info('Queue bound')
-        #self.enable_delivery_confirmations()
+        self._bound += 1
+        if self._bound < len(self._bindings):
+            self.setup_queue(self._bindings[self._bound][0])
+            return
+        self.enable_delivery_confirmations()
         self.start_publishing()
 
     def start_publishing(self):
@@ -235,10 +273,75 @@ class PublisherRabbit(object):
 
         """
         self.logger.info('Issuing consumer related RPC commands')
+        self.publish_batch()
+
+    def publish_batch(self):
+        """Publish the next PUBLISH_BATCH messages (the nacked ones first,
+        then the ones of the generator), then schedule the next batch.
+        The generator yields the messages or (message, priority, lane) tuples.
+        Between two batches the IOLoop processes the delivery confirmations.
+        When max_unconfirmed messages wait for a confirmation the publishing
+        stops: it is resumed by on_delivery_confirmation. When the generator
+        is exhausted and all the messages are confirmed the connection is
+        closed.
+
+        """
+        self._batch_scheduled = False
+        if self._stopping or self._channel is None:
+            return
+        for _ in range(self.PUBLISH_BATCH):
+            if len(self._deliveries) >= self.max_unconfirmed:
+                self.logger.debug('%i messages waiting for confirmation', len(self._deliveries))
+                return
+            if self._republish:
+                message_number, json_message, priority, lane = self._republish.pop(0)
+            elif self._published_all:
+                return
+            else:
+                try:
+                    json_message = next(self.images_generator)
+                    priority, lane = None, None
+                    if isinstance(json_message, tuple):
+                        json_message, priority, lane = json_message
+                except StopIteration:
+                    self.logger.info('All the %i messages have been published', self._message_number)
+                    self._published_all = True
+                    self.on_confirmed()
+                    return
+                self._message_number += 1
+                message_number = self._message_number
+            self.publish_message(json_message, message_number, priority=priority, lane=lane)
+        self.schedule_batch()
+
+    def schedule_batch(self):
+        if not self._batch_scheduled and not self._stopping and self._connection:
+            self._batch_scheduled = True
+            self._connection.add_timeout(0, self.publish_batch)
+
+    def add_barrier(self, callback):
+        """The callback() is invoked when all the messages published until
+        now have been confirmed by RabbitMQ (e.g. to save the position of the
+        crawler). The barriers are invoked in order.
 
-        for json_image in self.images_generator:
-            self.publish_message(json_image)
+        """
+        self._barriers.append((self._message_number, callback))
+        self.on_confirmed()
+
+    def on_confirmed(self):
+        """Invoke the barriers whose messages have all been confirmed and
+        close the connection when the generator is exhausted and nothing is
+        waiting for a confirmation.
 
+        """
+        pending = [delivery[0] for delivery in self._deliveries.values()] + [delivery[0] for delivery in self._republish]
+        oldest_pending = min(pending) if pending else self._message_number + 1
+        while self._barriers and self._barriers[0][0] < oldest_pending:
+            message_number, callback = self._barriers.pop(0)
+            callback()
+        if self._published_all and not pending and not self._closing:
+            self.logger.info('All the messages have been confirmed')
+            self._stopping = True
+            self.close_connection()
 
     def enable_delivery_confirmations(self):
         """Send the Confirm.Select RPC method to RabbitMQ to enable delivery
@@ -264,26 +367,44 @@ class PublisherRabbit(object):
         a delivery confirmation of from the list used to keep track of messages
         that are pending confirmation.
 
+        With multiple=True the frame confirms all the delivery tags up to
+        delivery_tag. The nacked messages are published again.
+
         :param pika.frame.Method method_frame: Basic.Ack or Basic.Nack frame
 
         """
-        confirmation_type = method_frame.method.NAME.split('.')[1].lower()
-        self.logger.info('Received %s for delivery tag: %i',
-                    confirmation_type,
-                    method_frame.method.delivery_tag)
-        if confirmation_type == 'ack':
-            self._acked += 1
-        elif confirmation_type == 'nack':
-            self._nacked += 1
-        self._deliveries.remove(method_frame.method.delivery_tag)
+        method = method_frame.method
+        confirmation_type = method.NAME.split('.')[1].lower()
+        self.logger.debug('Received %s for delivery tag: %i (multiple: %s)',
+                          confirmation_type, method.delivery_tag, method.multiple)
+        if method.multiple:
+            tags = []
+            for tag in self._deliveries:
+                if tag > method.delivery_tag:
+                    break
+                tags.append(tag)
+        else:
+            tags = [method.delivery_tag] if method.delivery_tag in self._deliveries else []
+        for tag in tags:
+            delivery = self._deliveries.pop(tag)
+            if confirmation_type == 'ack':
+                self._acked += 1
+            else:
+                self._nacked += 1
+                self._republish.append(delivery)
+        if confirmation_type == 'nack':
+            self.logger.warning('%i messages nacked, they will be published again', len(tags))
         self.logger.info('Published %i messages, %i have yet to be confirmed, '
                     '%i were acked and %i were nacked',
                     self._message_number, len(self._deliveries),
                     self._acked, self._nacked)
+        self.on_confirmed()
+        if self._republish or (len(self._deliveries) < self.max_unconfirmed and not self._published_all):
+            self.schedule_batch()
 
 
 
-    def publish_message(self, json_message):
+    def publish_message(self, json_message, message_number=None, priority=None, lane=None):
         """If the class is not stopping, publish a message to RabbitMQ,
         appending a list of deliveries with the message number that was sent.
         This list will be used to check for delivery confirmations in the
@@ -295,22 +416,32 @@ class PublisherRabbit(object):
         delivery intervals by changing the PUBLISH_INTERVAL constant in the
         class.
 
+        :param message_number: the number of the message (for the barriers),
+            a new number if None
+        :param priority: the priority of the message (0..max_priority)
+        :param lane: the lane of the message, it is published with the
+            routing key of the lane
+
         """
         if self._stopping:
             return
+        if message_number is None:
+            self._message_number += 1
+            message_number = self._message_number
 
         properties = pika.BasicProperties(app_id='example-publisher',
                                           content_type='application/json',
                                           #headers=message,
+                                          priority=priority if self.max_priority else None,
                                           delivery_mode=2) # DIDO make store to the disk
 
-        self._channel.basic_publish(self.exchange, self.routing_key,
+        self._channel.basic_publish(self.exchange, lane_name(self.routing_key, lane if self.lanes else None),
                                     #json.dumps(message, ensure_ascii=False),
                                     json_message,
                                     properties)
-        self._message_number += 1
-        self._deliveries.append(self._message_number)
-        self.logger.info('Published message # %i', self._message_number)
+        self._delivery_tag += 1
+        self._deliveries[self._delivery_tag] = (message_number, json_message, priority, lane)
+        self.logger.debug('Published message # %i (delivery tag %i)', message_number, self._delivery_tag)
 
 
     def close_channel(self):
@@ -326,7 +457,7 @@ class PublisherRabbit(object):
         """Run the example code by connecting and then starting the IOLoop.
 
         """
-        self.images_generator = images_generator_function
+        self.images_generator = iter(images_generator_function)
         while True:
             try:
                 self._connection = self.connect()
@@ -0,0 +1,124 @@
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import docker.errors
+from .utils import get_logger
+
+
+class PullAhead:
+    """
+    Pulls the images of the queued messages while the current images are scanned, so that the download
+    of the next images overlaps the execution of the probes.
+
+    The bytes of the images pulled ahead and not yet scanned are kept below disk_budget: a pull waits until
+    enough images have been scanned (see release()). The budget is reserved with the size reported by the
+    Docker Hub and corrected with the size of the image in the daemon once the pull is finished.
+    """
+
+    def __init__(self, client_daemon, client_hub, workers=1, disk_budget=None, should_pull=lambda repo_name, tag: True):
+        """
+        :param client_daemon: the ClientDaemon that pulls the images
+        :param client_hub: the ClientHub used to know the size of the images before the pull
+        :param workers: the number of images pulled in parallel
+        :param disk_budget: the max number of bytes of the images pulled and not yet released (None: no limit)
+        :param should_pull: function(repo_name, tag) called before the pull. If it returns a false value the image
+                            is not pulled. The returned value is given back by wait().
+        """
+        self.logger = get_logger(__name__, logging.INFO)
+        self.client_daemon = client_daemon
+        self.client_hub = client_hub
+        self.disk_budget = disk_budget
+        self.should_pull = should_pull
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._condition = threading.Condition()
+        self._pulls = {}        # (repo_name, tag) -> pull
+        self._reserved = 0      # bytes reserved by the images pulled and not released
+
+    def schedule(self, repo_name, tag="latest"):
+        """Start the pull of the image in background. It does not block."""
+        key = (repo_name, tag)
+        with self._condition:
+            if key in self._pulls:
+                self._pulls[key]['messages'] += 1
+                return
+            pull = {'messages': 1, 'size': 0, 'urgent': False, 'cancel': threading.Event()}
+            self._pulls[key] = pull
+            pull['future'] = self._executor.submit(self._pull, repo_name, tag, pull)
+
+    def wait(self, repo_name, tag="latest"):
+        """
+        Wait the end of the pull of the image.
+        :return: the value returned by should_pull(), None if the pull has been cancelled.
+                 If the image has not been scheduled, should_pull() is called and the image is pulled now.
+        """
+        with self._condition:
+            pull = self._pulls.get((repo_name, tag))
+            if pull is not None:
+                # a scanner is idle waiting this image: it does not wait for the budget
+                pull['urgent'] = True
+                self._condition.notify_all()
+        if pull is None:
+            result = self.should_pull(repo_name, tag)
+            if result:
+                self.client_daemon.pull_image(repo_name, tag)
+            return result
+        return pull['future'].result()
+
+    def release(self, repo_name, tag="latest"):
+        """Called when the scan of the image is finished: its bytes are not counted in the budget anymore."""
+        with self._condition:
+            pull = self._pulls.get((repo_name, tag))
+            if pull is None:
+                return
+            pull['messages'] -= 1
+            if pull['messages'] == 0:
+                del self._pulls[(repo_name, tag)]
+                self._reserved -= pull['size']
+                self._condition.notify_all()
+
+    def cancel_all(self):
+        """Abort the pulls in progress and the pulls not yet started (e.g. the consumer has been cancelled)."""
+        with self._condition:
+            self.logger.info("Cancelling {0} pulls".format(len(self._pulls)))
+            for pull in self._pulls.values():
+                pull['cancel'].set()
+                self._reserved -= pull['size']
+                pull['size'] = 0
+            self._pulls.clear()
+            self._condition.notify_all()
+
+    def _pull(self, repo_name, tag, pull):
+        if pull['cancel'].is_set():
+            return None
+        result = self.should_pull(repo_name, tag)
+        if not result:
+            return result
+        json_tag = self.client_hub.get_json_tag(repo_name, tag) or {}
+        if not self._reserve(pull, json_tag.get('full_size') or 0):
+            return None
+        self.logger.info("[{0}] pulling ahead".format(repo_name))
+        if not self.client_daemon.pull_image(repo_name, tag, cancel_event=pull['cancel']):
+            return None
+        try:
+            size = self.client_daemon.inspect_image(repo_name + ":" + tag)['Size']
+            self._reserve(pull, size - pull['size'], wait=False)
+        except docker.errors.APIError as e:
+            self.logger.error(e)
+        return result
+
+    def _reserve(self, pull, size, wait=True):
+        """
+        Add size bytes to the budget used by the pull, waiting until they are available.
+        :return: False if the pull has been cancelled.
+        """
+        with self._condition:
+            # an image bigger than the budget is pulled alone
+            while wait and self.disk_budget and self._reserved > 0 and \
+                    self._reserved + size > self.disk_budget and \
+                    not pull['urgent'] and not pull['cancel'].is_set():
+                self._condition.wait()
+            if pull['cancel'].is_set():
+                return False
+            self._reserved += size
+            pull['size'] += size
+            return True
@@ -1,14 +1,27 @@
 import docker
 import docker.errors
+import requests
+import tarfile
 from subprocess import Popen, PIPE, STDOUT
 import re
+import time
 from .container import Container
 from .utils import *
 from .client_images_service import ClientImages
 from .client_daemon import ClientDaemon
 from .client_dockerhub import ClientHub
 from .client_software import ClientSoftware
+from .client_registry import ClientRegistry
+from .layer_cache import LayerCache
+from .pull_ahead import PullAhead
+from .image_cache import ImageCache
+from .profiler import Profiler
+from .lanes import lane_name
+from .layer_diff import diff_layers, changed_software, Rescan
+from .inspector import inspect_layer, compose_layers, release_text, installed_packages, binaries
 from .consumer_rabbit import ConsumerRabbit
+from .probe import Probe
+from .metrics import SCAN_PHASE_SECONDS, PROBE_SECONDS, IMAGES_PROCESSED
 from .utils import get_logger
 import logging
 
@@ -18,31 +31,105 @@ class Scanner:
                  software_url="http://127.0.0.1:3001/api/software",
                  images_url="http://127.0.0.1:3000/api/images",
                  hub_url="https://hub.docker.com/",
-                 rmi=True):
+                 rmi=True,
+                 batch=False,
+                 concurrency=1,
+                 backend="daemon",
+                 registry_url="https://registry-1.docker.io",
+                 layer_cache=None,
+                 pull_ahead=0,
+                 disk_budget=None,
+                 write_batch=0,
+                 warm_cache=False,
+                 max_priority=0,
+                 lane=None,
+                 cache_budget=None,
+                 pin=(),
+                 probe_timeout=30,
+                 image_timeout=600,
+                 max_output=64 * 1024,
+                 profiler=None,
+                 incremental=False):
 
         self.rmi = rmi  # remove an image ofter the scan
 
+        self.batch = batch  # run all the probes of an image in a single container
+
+        # a probe is killed after probe_timeout seconds, the probes of an image after image_timeout seconds,
+        # the output of a probe is read until max_output bytes (None: no limit)
+        self.probe_timeout = probe_timeout
+        self.image_timeout = image_timeout
+        self.max_output = max_output
+
+        # the layers and the catalog version of a scan are saved in the description: when the image is scanned
+        # again, only the probes of the software in the changed layers are run (only daemon backend)
+        self.incremental = incremental
+
+        # CPU profile of every image processed, when enabled (always or after SIGUSR1)
+        self.profiler = profiler if profiler else Profiler()
+
+        # "daemon": pull the image and run the probes in containers.
+        # "registry": read the layers from the registry, without pulling the image into the daemon.
+        self.backend = backend
+
+        # persistent cache of the facts of the layers already inspected by the registry backend and by the
+        # incremental scan (path of the db)
+        self.layer_cache = LayerCache(path_db=layer_cache) if layer_cache else None
+
         self.logger = get_logger(__name__, logging.DEBUG)
 
         # client of software service: the service that return the software to search in the images.
-        self.client_software = ClientSoftware(api_url=software_url)
+        # the commands of the batch script are killed after probe_timeout seconds (see ProbePlan)
+        self.client_software = ClientSoftware(api_url=software_url, probe_timeout=probe_timeout)
 
         # client for interacting with the docker daemon on the host
         self.client_daemon = ClientDaemon(base_url='unix://var/run/docker.sock')
 
-        # rabbit consumer for receiving the images, on_message_callback is called when a message is received
+        # keep the images scanned in the daemon until cache_budget bytes, then remove the least recently used
+        # (instead of rmi), the pinned images are never removed (only daemon backend)
+        self.image_cache = None
+        if cache_budget and backend == "daemon":
+            self.image_cache = ImageCache(self.client_daemon, cache_budget, pinned=pin)
+
+        # the client hub interacts with the docker Hub registry
+        self.client_hub = ClientHub(docker_hub_endpoint=hub_url)
+
+        # pull the next pull_ahead images of the queue while the current ones are scanned (only daemon backend)
+        self.puller = None
+        if pull_ahead > 0 and backend == "daemon":
+            self.puller = PullAhead(self.client_daemon, ClientHub(docker_hub_endpoint=hub_url,
+                                                                  throttle=self.client_hub.throttle),
+                                    workers=pull_ahead, disk_budget=disk_budget, should_pull=self.scan_action)
+
+        # the scanner consumes only the queue of a lane of the crawler (e.g. "small": queue images.small,
+        # routing key images.scan.small), the hosts of a lane have their own concurrency and disk budget
+        if lane:
+            queue, route_key = lane_name(queue, lane), lane_name(route_key, lane)
+
+        # rabbit consumer for receiving the images, on_message_callback is called when a message is received.
+        # With concurrency > 1 the images are scanned in parallel by a pool of workers.
+        # With max_priority > 0 the queue is a priority queue: the popular images are delivered first.
         self.consumer = ConsumerRabbit(amqp_url=amqp_url,
                                        exchange=exchange,
                                        queue=queue,
                                        route_key=route_key,
-                                       on_msg_callback=self.on_message)
-
-        # the clientApi interacts with the server api in order to post the image description
-        self.client_images = ClientImages(images_url=images_url)
+                                       on_msg_callback=self.on_message,
+                                       prefetch_count=concurrency + pull_ahead,
+                                       workers=concurrency,
+                                       on_receive_callback=self.on_message_received if self.puller else None,
+                                       on_cancel_callback=self.puller.cancel_all if self.puller else None,
+                                       max_priority=max_priority)
+
+        # the clientApi interacts with the server api in order to post the image description.
+        # With write_batch > 0 the descriptions are sent in bulk (write-behind buffer)
+        self.client_images = ClientImages(images_url=images_url, hub_url=hub_url, batch_size=write_batch)
+
+        # load the scan states of the images already scanned when the scanner starts (see run())
+        self.warm_cache = warm_cache
         # host_service=host_images, port_service=port_images, url_path=path_images)
 
-        # the client hub interacts with the docker Hub registry
-        self.client_hub = ClientHub(docker_hub_endpoint=hub_url)
+        # the client registry downloads the manifests and the layers of the images (registry API v2)
+        self.client_registry = ClientRegistry(registry_url=registry_url)
 
     def on_message(self, json_message):
         """
@@ -52,53 +139,199 @@ class Scanner:
         # first method called when an image name is received
         self.process_repo_name(json_message['name'])
 
+    def on_message_received(self, json_message):
+        """
+        Called in the IOLoop of the consumer as soon as a message is received: start pulling the image ahead.
+        """
+        self.puller.schedule(json_message['name'], "latest")
+
     def run(self):
         """
         Run the scanner starting the consumer client of the RabbitMQ server.
         :return:
         """
-
+        if self.warm_cache:
+            self.client_images.warm_scan_states()
+        if self.image_cache:
+            self.image_cache.pull_pinned()
         try:
             self.consumer.run()
         except KeyboardInterrupt:
             self.consumer.stop()
+        finally:
+            self.client_images.close()   # send the descriptions still buffered
+            if self.image_cache:
+                self.logger.info("Image cache: {0}".format(self.image_cache.stats()))
 
     def process_repo_name(self, repo_name):
+        with self.profiler.profile("image", repo_name):
+            self._process_repo_name(repo_name)
+
+    def _process_repo_name(self, repo_name):
         self.logger.info("[" + repo_name + "] Processing image")
-        list_tags = self.client_hub.get_all_tags(repo_name)
         tag = "latest"
-        if tag in list_tags:
-            # TODO; is new must contains also the tag latest ...
-            if self.client_images.is_new(repo_name):  # the image is totally new
-                dict_image = self.scan(repo_name, tag)
-                self.client_images.post_image(dict_image)  # POST the description of the image
+        try:
+            if self.puller:
+                # the image has been pulled ahead (if it must be scanned)
+                with SCAN_PHASE_SECONDS.time(phase="wait_pull_ahead"):
+                    action = self.puller.wait(repo_name, tag)
+            else:
+                with SCAN_PHASE_SECONDS.time(phase="check"):
+                    action = self.scan_action(repo_name, tag)
+            IMAGES_PROCESSED.inc(action=action or "skip")
+            if action == "post":  # the image is totally new
+                dict_image = self.scan(repo_name, tag, pull=not self.puller)
+                with SCAN_PHASE_SECONDS.time(phase="write"):
+                    self.client_images.post_image(dict_image)  # POST the description of the image
                 self.logger.info("[" + repo_name + "]  uploaded the new image description")
-            elif self.client_images.must_scanned(repo_name):  # the image must be scan again
-                self.logger.debug("[" + repo_name + "] is present into images server but must be scan again")
-                dict_image = self.scan(repo_name, tag)
-                self.client_images.put_image(dict_image)  # PUT the new image description of the image
+            elif action == "put":  # the image must be scan again
+                previous = None
+                if self.incremental and self.backend == "daemon":
+                    with SCAN_PHASE_SECONDS.time(phase="check"):
+                        previous = self.client_images.get_scan_result(repo_name)
+                dict_image = self.scan(repo_name, tag, pull=not self.puller, previous=previous)
+                with SCAN_PHASE_SECONDS.time(phase="write"):
+                    self.client_images.put_image(dict_image)  # PUT the new image description of the image
                 self.logger.info("[" + repo_name + "] updated the image description")
+        finally:
+            if self.puller:
+                self.puller.release(repo_name, tag)
+
+    def scan_action(self, repo_name, tag="latest"):
+        """
+        Decide if the image must be scanned.
+        :return: "post" if the image is new, "put" if the image must be scanned again, None otherwise.
+        """
+        # a single HEAD of the manifest: the tag exists and its digest tells if the content is changed,
+        # without the digest (e.g. the registry is not reachable) the tag is looked for in the Docker Hub
+        digest = self.tag_digest(repo_name, tag)
+        if digest or tag in (self.client_hub.get_all_tags(repo_name) or []):
+            # TODO; is new must contains also the tag latest ...
+            # a single lookup of the image in the images service (often answered by the cache)
+            state = self.client_images.get_scan_state(repo_name)
+            if state is None:  # the image is totally new
+                self.logger.info("[" + repo_name + "] is new into IMAGES SERVER")
+                return "post"
+            elif self.client_images.must_scanned(repo_name, tag, digest=digest, state=state):  # must be scan again
+                self.logger.debug("[" + repo_name + "] is present into images server but must be scan again")
+                return "put"
             else:
                 self.logger.info("[" + repo_name + "] already up to date.")
+        return None
+
+    def tag_digest(self, repo_name, tag="latest"):
+        """
+        The digest of the tag (see ClientRegistry.get_digest).
+        :return: the digest, None if the tag is not found or the registry is not reachable
+        """
+        try:
+            return self.client_registry.get_digest(repo_name, tag)
+        except requests.exceptions.RequestException as e:
+            self.logger.warning("[{0}] digest of the tag not read: {1}".format(repo_name, e))
+            return None
+
+    def scan(self, repo_name, tag="latest", pull=True, previous=None):
+        """
+        :param previous: the result of the last scan of the image (see ClientImages.get_scan_result): only the
+                         probes of the software in the changed layers are run again (incremental scan)
+        """
+        with self.profiler.profile("image", repo_name):
+            return self._scan(repo_name, tag, pull, previous)
 
-    def scan(self, repo_name, tag="latest"):
+    def _scan(self, repo_name, tag="latest", pull=True, previous=None):
 
-        self.client_daemon.pull_image(repo_name, tag)
+        rescan = None
+        if previous is not None and self.backend == "daemon":
+            with SCAN_PHASE_SECONDS.time(phase="layer_diff"):
+                rescan = self.layer_rescan(repo_name, tag, previous)
+        # the image is not pulled if no probe must be run again (pull=False: the image has been pulled ahead)
+        pulled = not pull or rescan is None or rescan.probes
+
+        if self.backend == "daemon" and pull and pulled:
+            with SCAN_PHASE_SECONDS.time(phase="pull"):
+                self.client_daemon.pull_image(repo_name, tag)
         #self.client_daemon.pull(repo_name, tag)
 
+        if self.image_cache and pulled:
+            self.image_cache.acquire(repo_name, tag)
+        try:
+            return self.scan_image(repo_name, tag, rescan=rescan, pulled=pulled)
+        finally:
+            if self.image_cache and pulled:
+                self.image_cache.release(repo_name, tag)
+
+    def layer_rescan(self, repo_name, tag, previous):
+        """
+        Compare the layers of the image with the layers of its last scan: only the probes whose files (executables,
+        alternatives, release files) are in the changed layers must be run again (see changed_software). The changed
+        layers are read from the registry (see layer_facts), the layers of the common base are never read.
+        :param previous: the description of the last scan ('layers', 'catalog', 'distro', 'softwares')
+        :return: the Rescan, None if the image must be scanned from scratch
+        """
+        plan = self.client_software.get_probe_plan()
+        if plan is None or not plan.version or previous.get('catalog') != plan.version or not previous.get('layers'):
+            # the probes of the catalog are changed (or unknown) since the last scan
+            return None
+        digest, manifest = self.client_registry.get_manifest(repo_name, tag)
+        if manifest is None or 'layers' not in manifest:
+            return None
+        layers = [layer['digest'] for layer in manifest['layers']]
+        removed, added = diff_layers(previous['layers'], layers)
+        try:
+            removed_facts = [self.layer_facts(repo_name, layer) for layer in removed]
+            added_facts = [self.layer_facts(repo_name, layer) for layer in added]
+        except (requests.exceptions.RequestException, tarfile.TarError) as e:
+            self.logger.warning("[{0}] changed layers not read, scanning from scratch: {1}".format(repo_name, e))
+            return None
+        distro, software = changed_software(removed_facts, added_facts)
+        if software is None:
+            return None
+        rescan = Rescan(plan, previous, digest, layers, distro, software)
+        self.logger.info("[{0}] {1} layers removed, {2} added: running again {3} of {4} probes".format(
+            repo_name, len(removed), len(added), len(rescan.probe_plan().commands), len(plan.commands)))
+        return rescan
+
+    def scan_image(self, repo_name, tag="latest", rescan=None, pulled=True):
+        """
+        :param rescan: the Rescan of an incremental scan, None: all the probes are run
+        :param pulled: False if the image is not in the daemon (an incremental scan with no probe to run)
+        """
         dict_image = {}
         dict_image["repo_name"] = repo_name
         self.logger.info('[{0}] start scanning'.format(repo_name))
 
-        self.info_docker_hub(repo_name, dict_image, tag)
-        self.info_dofinder(repo_name, dict_image, tag)
+        # the digest of the manifest is used to know if the image is changed (see ClientImages.must_scanned),
+        # the layers are used by the next incremental scan
+        with SCAN_PHASE_SECONDS.time(phase="digest"):
+            if rescan:
+                digest, layers = rescan.digest, rescan.layers
+            elif self.incremental and self.backend == "daemon":
+                digest, manifest = self.client_registry.get_manifest(repo_name, tag)
+                layers = [layer['digest'] for layer in (manifest or {}).get('layers', [])]
+            else:
+                digest, layers = self.tag_digest(repo_name, tag), None
+        if digest:
+            dict_image['digest'] = digest
+        if layers:
+            dict_image['layers'] = layers
+
+        with SCAN_PHASE_SECONDS.time(phase="docker_hub"):
+            self.info_docker_hub(repo_name, dict_image, tag)
+        if self.backend == "registry":
+            with SCAN_PHASE_SECONDS.time(phase="registry"):
+                self.info_registry(repo_name, dict_image, tag)
+        else:
+            with SCAN_PHASE_SECONDS.time(phase="probes"):
+                self.info_dofinder(repo_name, dict_image, tag, rescan)
 
         self.logger.info('[{0}] finish scanning'.format(repo_name))
-        dict_image['last_scan'] = str(datetime.datetime.now())
+        # same format of the dates returned by the images service (see string_to_date)
+        dict_image['last_scan'] = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
 
-        if self.rmi:
+        if self.rmi and self.backend == "daemon" and pulled and not self.image_cache:
             try:
-                self.client_daemon.remove_image(repo_name, force=True)
+                with SCAN_PHASE_SECONDS.time(phase="remove_image"):
+                    self.client_daemon.remove_image(repo_name, force=True)
                 self.logger.info('[{0}] removed image'.format(repo_name))
             except docker.errors.NotFound as e:
                 self.logger.error(e)
@@ -154,63 +387,199 @@ class Scanner:
         if 'full_size' in json_response:
             dict_image['size'] = json_response['full_size']
 
-    def info_dofinder(self, image_name, dict_image, tag):
-
+    def info_dofinder(self, image_name, dict_image, tag, rescan=None):
+        """
+        Run the probes in containers of the image.
+        :param rescan: the Rescan of an incremental scan: only its probes are run, the other results are taken
+                       from the last scan
+        """
         repo_name_tag = image_name + ":" + tag
         self.logger.info('[{}] searching software ... '.format(repo_name_tag))
 
-        # with Container(repo_name) as c:
+        # the probes of the distribution Operating system and of the binary versions
+        plan = rescan.probe_plan() if rescan else self.client_software.get_probe_plan()
+        if plan is None:
+            self.logger.error('[{}] software catalog not available'.format(repo_name_tag))
+            return
+        if self.incremental:
+            # the results are valid as long as the probes of the catalog are the same
+            dict_image['catalog'] = plan.version
+
+        # the time budget of all the probes of the image
+        deadline = time.time() + self.image_timeout if self.image_timeout else None
+
+        outputs = None
+        if self.batch and plan.commands:
+            with SCAN_PHASE_SECONDS.time(phase="batch"):
+                outputs = self.run_batch(repo_name_tag, plan, deadline)
+        if outputs is not None:
+            system_outputs, software_outputs = outputs
+        else:
+            system_outputs = software_outputs = None
 
         # search distribution Operating system,
-        for cmd, regex in self.client_software.get_system():  # self._get_sys(self.versionCommands):
+        for index, probe in enumerate(plan.system):
             try:
-                distro = self.version_from_regex(repo_name_tag, cmd, regex)
+                if system_outputs is not None:
+                    distro = self.extract_version(repo_name_tag, probe, system_outputs[index])
+                else:
+                    distro = self.run_probe(repo_name_tag, probe, deadline)
                 if distro:
                     dict_image['distro'] = distro
-                # output = self.run_command(repo_name, cmd)
-                # p = re.compile(reg)
-                # match = p.search(output)
-                # if match:
-                #     # take the non-capturing group: only the matches, group[0] return all the match
-                #     dist = match.group(0)
-                #     dict_image['distro'] = dist
-                # else:
-                #     self.logger.debug("[{0}] not found {1}".format(repo_name, cmd))
             except docker.errors.NotFound as e:
                 self.logger.error(e)
-                #   with Container(repo_name) as c:
 
         # search binary versions
         softwares = []
-        for sw in self.client_software.get_software():  # self._get_bins(self.versionCommands):
+        for index, probe in enumerate(plan.software):
             try:
-                software = sw['name']
-                command = software+" " + sw['cmd']
-                #cmd = sw['cmd']
-                regex = sw['regex']
-                version = self.version_from_regex(repo_name_tag, command, regex)
+                if software_outputs is not None:
+                    version = self.extract_version(repo_name_tag, probe, software_outputs[index])
+                else:
+                    version = self.run_probe(repo_name_tag, probe, deadline)
                 if version:
-                    softwares.append({'software': software, 'ver': version})
+                    softwares.append({'software': probe.name, 'ver': version})
             except docker.errors.NotFound as e:
                 self.logger.error(e)
         dict_image['softwares'] = softwares
+        if rescan:
+            rescan.merge(dict_image)
+
+    def info_registry(self, image_name, dict_image, tag):
+        """
+        Search the distribution and the software reading the layers of the image from the registry.
+        The layers are decompressed as a stream and only the release files, the package databases and the
+        names of the executables are taken. The image is never pulled into the docker daemon.
+        """
+        repo_name_tag = image_name + ":" + tag
+        self.logger.info('[{}] searching software in the registry layers ... '.format(repo_name_tag))
+
+        digest, manifest = self.client_registry.get_manifest(image_name, tag)
+        if manifest is None:
+            return
+        layer_facts = [self.layer_facts(image_name, layer['digest']) for layer in manifest['layers']]
+        config = self.client_registry.get_config(image_name, manifest)
+        self.info_from_files(repo_name_tag, dict_image, compose_layers(layer_facts), config)
+
+    def layer_facts(self, image_name, digest):
+        """
+        Return the facts of a layer. Only the layers never seen before are downloaded and inspected.
+        """
+        if self.layer_cache:
+            facts = self.layer_cache.get(digest)
+            if facts is not None:
+                self.logger.debug("[{0}] layer {1} found in the cache".format(image_name, digest))
+                return facts
+        self.logger.debug("[{0}] reading layer {1}".format(image_name, digest))
+        res = self.client_registry.get_blob(image_name, digest, stream=True)
+        try:
+            facts = inspect_layer(res.raw)
+        finally:
+            res.close()
+        if self.layer_cache:
+            self.layer_cache.put(digest, facts)
+        return facts
+
+    def info_from_files(self, repo_name_tag, dict_image, image_files, config):
+        """
+        Apply the regex of the catalog to the files of the image.
+        The version of a software is taken from the package database (dpkg, apk) or, if the executable is in the
+        image, from the <NAME>_VERSION environment variable set by the official images.
+        """
+        plan = self.client_software.get_probe_plan()
+        if plan is None:
+            self.logger.error('[{}] software catalog not available'.format(repo_name_tag))
+            return
+
+        # the release files are the output of 'cat /etc/*release'
+        text = release_text(image_files)
+        for probe in plan.system:
+            distro = self.extract_version(repo_name_tag, probe, text)
+            if distro:
+                dict_image['distro'] = distro
+
+        packages = installed_packages(image_files)
+        executables = binaries(image_files)
+        env = dict(var.split("=", 1) for var in (config.get('config', {}).get('Env') or []) if "=" in var)
+        softwares = []
+        for probe in plan.software:
+            source = packages.get(probe.name)
+            if source is None and probe.name in executables:
+                source = env.get(probe.name.upper() + "_VERSION")
+            version = self.extract_version(repo_name_tag, probe, source)
+            if version:
+                softwares.append({'software': probe.name, 'ver': version})
+        dict_image['softwares'] = softwares
 
     def version_from_regex(self, repo_name, command, regex):
-        output = self.run_command(repo_name, command)
-        p = re.compile(regex)
-        match = p.search(output)
-        if match:
-            version = match.group(0)
-            self.logger.debug("[{0}] found in {1}".format(command, repo_name))
-            return version
-        else:
-            self.logger.debug("[{0}] NOT found in {1}".format(command, repo_name))
+        return self.run_probe(repo_name, Probe(None, command, regex))
+
+    def run_probe(self, repo_name, probe, deadline=None):
+        """
+        Run the command of the probe, the command is stopped as soon as its output matches the regex.
+        :param deadline: the time when the budget of the image ends, the probe is not run after it
+        """
+        timeout = self.time_budget(self.probe_timeout, deadline)
+        if timeout is not None and timeout <= 0:
+            self.logger.warning("[{0}] time budget of the image exhausted, {1} not run".format(repo_name, probe.command))
+            PROBE_SECONDS.observe(0, software=probe.name or "system", status="skipped")
             return None
+        start = time.monotonic()
+        output = self.run_command(repo_name, probe.command, timeout=timeout,
+                                  until=lambda output: probe.search(output) is not None)
+        version = self.extract_version(repo_name, probe, output)
+        PROBE_SECONDS.observe(time.monotonic() - start, software=probe.name or "system",
+                              status="found" if version else "not_found")
+        return version
+
+    @staticmethod
+    def time_budget(timeout, deadline):
+        """The seconds a command can run: timeout, or less if the deadline is closer. None: no limit"""
+        if deadline is None:
+            return timeout or None
+        remaining = deadline - time.time()
+        return min(timeout, remaining) if timeout else remaining
+
+    def extract_version(self, repo_name, probe, output):
+        """
+        Search the regex of the probe in the output of its command.
+        :return: the matched string, None if the regex does not match (or the output is None)
+        """
+        version = probe.search(output)
+        if version:
+            self.logger.debug("[{0}] found in {1}".format(probe.command, repo_name))
+        else:
+            self.logger.debug("[{0}] NOT found in {1}".format(probe.command, repo_name))
+        return version
 
+    def run_batch(self, repo_name, plan, deadline=None):
+        """
+        Run all the commands of the plan in a single container with a shell script, instead of one container
+        per command. The script is killed at the deadline of the image (the commands not executed get None).
+        :return: (system outputs, software outputs), None if the script cannot be executed (e.g. no /bin/sh)
+                 and the commands must be run one by one.
+        """
+        self.logger.info("[{0}] running {1} commands in a single container".format(repo_name, len(plan.commands)))
+        timeout = self.time_budget(self.probe_timeout * len(plan.commands) if self.probe_timeout else None, deadline)
+        try:
+            output, status = self.client_daemon.run_capture(
+                repo_name, ["/bin/sh", "-c", plan.script], timeout=timeout,
+                max_output=self.max_output * len(plan.commands) if self.max_output else None)
+        except docker.errors.NotFound:
+            raise
+        except docker.errors.APIError as e:
+            self.logger.warning("[{0}] batch script not executed, running the commands one by one: {1}".format(repo_name, e))
+            return None
+        if status != "exited":
+            self.logger.warning("[{0}] batch script stopped ({1}), the commands not executed are skipped".format(
+                repo_name, status))
+        return plan.split_output(output)
 
-    def run_command(self, repo_name, command):
+    def run_command(self, repo_name, command, timeout=None, until=None):
         """Just like 'docker run CMD'.
-        Return the output of the command.
+        Return the output of the command (at most max_output bytes).
+        :param timeout: the container is killed after timeout seconds (None: probe_timeout)
+        :param until: function(output), the container is killed as soon as it returns True
         """
         # Popen version: PROBLEM; the scanner is executed in a container and docker in not installed inside.
         # self.logger.debug("Executing in " + repo_name+": "+program +" "+option)
@@ -220,23 +589,21 @@ class Scanner:
 
         #ver_command = program + " " + option
         self.logger.info("[{0}] running command {1}".format(repo_name, command))
-        container_id = self.client_daemon.create_container(image=repo_name,
-                                                           entrypoint=command,
-                                                           tty=True,
-                                                           stdin_open=True,
-
-                                                         )['Id']
         try:
-            self.client_daemon.start(container=container_id)
+            output, status = self.client_daemon.run_capture(repo_name, command,
+                                                            timeout=timeout if timeout is not None else self.probe_timeout,
+                                                            max_output=self.max_output, until=until)
+        except docker.errors.NotFound:
+            raise
         except docker.errors.APIError as e:
             self.logger.error(e)
             return " "
         #self.logger.debug("Searching [{0}] in {1} ...".format(command, repo_name))
-        self.client_daemon.wait(container_id)
-        output = self.client_daemon.logs(container=container_id)
-        self.client_daemon.remove_container(container_id)
-        self.logger.debug("Removed container "+container_id)
-        return output.decode()
+        if status == "timeout":
+            self.logger.warning("[{0}] {1} killed after {2:.0f}s".format(repo_name, command, timeout or self.probe_timeout))
+        elif status == "truncated":
+            self.logger.debug("[{0}] output of {1} truncated at {2} bytes".format(repo_name, command, self.max_output))
+        return output
 
     # def pull_officials(self):
     #     # TODO excpetion raise for the connection to docker hub
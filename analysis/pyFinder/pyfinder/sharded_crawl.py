@@ -0,0 +1,102 @@
+import multiprocessing
+import logging
+from .crawler import Crawler
+from .crawl_checkpoint import CrawlCheckpoint
+from . import metrics
+from .utils import get_logger
+
+logger = get_logger(__name__, logging.INFO)
+
+
+class ImageBudget:
+    """
+    The number of images that the crawlers of a host can still send, shared by the worker processes.
+    """
+
+    def __init__(self, max_images):
+        """:param max_images: the images to send, None: no limit"""
+        self._value = multiprocessing.Value('q', max_images if max_images is not None else -1)
+
+    def take(self, num_images):
+        """:return: the number of images (<= num_images) that can be sent"""
+        with self._value.get_lock():
+            if self._value.value < 0:
+                return num_images
+            granted = min(num_images, self._value.value)
+            self._value.value -= granted
+            return granted
+
+    @property
+    def remaining(self):
+        return self._value.value if self._value.value >= 0 else None
+
+
+def parse_shard(shard):
+    """ "I/N" -> (I, N): the host I of N hosts (0 <= I < N)"""
+    index, num = (int(part) for part in shard.split("/"))
+    if not 0 <= index < num:
+        raise ValueError("shard must be I/N with 0 <= I < N: " + shard)
+    return index, num
+
+
+def shard_images(max_images, index, num):
+    """The images of the budget max_images assigned to the shard index of num (the first ones take the rest)."""
+    if max_images is None:
+        return None
+    return max_images // num + (1 if index < max_images % num else 0)
+
+
+def shard_name(index, num):
+    return "{0}-of-{1}".format(index, num)
+
+
+def run_sharded(crawler_args, from_page=1, page_size=10, max_images=100, workers=1, shard="0/1", resume=False,
+                metrics_port=None):
+    """
+    Crawl the pages of the Docker Hub with workers processes on this host, the host crawls the shard I/N.
+    The pages are striped among the workers*N crawlers: the crawler k crawls the pages from_page + k,
+    from_page + k + workers*N, ... Every host gets 1/N of max_images, shared by its workers.
+
+    :param crawler_args: the arguments of the Crawler of every worker (amqp_url, queue, checkpoint, ...)
+    :param shard: "I/N" this host is the I-th of N hosts (each one runs with the same workers)
+    :param metrics_port: the worker k of the host serves its metrics on metrics_port + k (None: no metrics)
+    """
+    host_index, num_hosts = parse_shard(shard)
+    num_shards = workers * num_hosts
+    shards = [host_index * workers + worker for worker in range(workers)]
+    host_images = shard_images(max_images, host_index, num_hosts)
+    if resume and host_images is not None and crawler_args.get('checkpoint'):
+        # the images already sent by the shards of the host are not in the budget anymore
+        for index in shards:
+            checkpoint = CrawlCheckpoint(path_db=crawler_args['checkpoint'], name="crawl-" + shard_name(index, num_shards))
+            state = checkpoint.load()
+            checkpoint.close()
+            if state is not None:
+                host_images -= state['sent_images']
+    budget = ImageBudget(max(host_images, 0) if host_images is not None else None)
+    logger.info("Crawling shards {0} of {1} with {2} workers, images: {3}".format(shards, num_shards, workers,
+                                                                                   budget.remaining))
+    processes = [multiprocessing.Process(target=_run_shard, name="crawler-" + shard_name(index, num_shards),
+                                         args=(crawler_args, index, num_shards, from_page, page_size, budget, resume,
+                                               metrics_port + worker if metrics_port else None))
+                 for worker, index in enumerate(shards)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+
+def _run_shard(crawler_args, index, num_shards, from_page, page_size, budget, resume, metrics_port=None):
+    if metrics_port:
+        metrics.start_server(metrics_port)
+    if crawler_args.get('profiler'):
+        # SIGUSR1 to the worker process profiles its next pages
+        crawler_args['profiler'].install_signal()
+    crawler = Crawler(shard=shard_name(index, num_shards), **crawler_args)
+    # the budget limits the images of the shard, max_images=None
+    crawler.run(from_page=from_page + index, page_size=page_size, max_images=None, resume=resume,
+                page_step=num_shards, budget=budget)
@@ -0,0 +1,248 @@
+import time
+import random
+import threading
+import logging
+from collections import deque
+from email.utils import parsedate_to_datetime
+import requests
+import requests.structures
+from .utils import get_logger
+from . import metrics
+
+
+class RateLimiter:
+    """
+    Token bucket: on average `rate` requests per second, with bursts of at most `burst` requests.
+    A request that finds the bucket empty takes a token in advance and waits for it, so the waiting
+    requests are served in order.
+    """
+
+    def __init__(self, rate=10.0, burst=10, clock=time.monotonic):
+        self.rate = float(rate)
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token.
+        :return: the seconds to wait before sending the request (0 if a token was available)
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+
+class Throttle:
+    """
+    The policy shared by all the clients of the Docker Hub: the rate of the requests (token bucket), the max number
+    of requests in flight and the retries of the throttled requests.
+
+    The rate and the concurrency are adapted to the responses (AIMD): a 429/5xx halves them (at most once every
+    `cooldown` seconds), every successful response increases the rate a little until `max_rate`.
+    A Retry-After received by any request pauses all the requests sharing the throttle.
+    The retries wait an exponential backoff with full jitter, so that many crawlers do not retry in lock-step.
+
+    It does not do any I/O: ThrottledSession and ClientHubAsync ask it how long to wait.
+    """
+
+    RETRY_STATUS = (429, 502, 503, 504)
+
+    def __init__(self, rate=10.0, burst=10, max_concurrency=20, max_retries=5, backoff_base=0.5, backoff_cap=60.0,
+                 min_rate=0.2, window=50, cooldown=1.0, clock=time.monotonic):
+        """
+        :param rate: the max number of requests per second
+        :param max_concurrency: the max number of requests in flight
+        :param max_retries: the number of retries of a throttled request, then its response is returned as it is
+        :param window: the number of the last responses used to compute the error rate
+        """
+        self.logger = get_logger(__name__, logging.INFO)
+        self.limiter = RateLimiter(rate, burst, clock=clock)
+        self.max_rate = float(rate)
+        self.min_rate = min_rate
+        self.max_concurrency = max_concurrency
+        self.concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)   # True: the response was an error
+        self._successes = 0
+        self._last_decrease = None
+        self._pause_until = 0
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+
+    @property
+    def rate(self):
+        """The current rate (requests per second)."""
+        return self.limiter.rate
+
+    @property
+    def error_rate(self):
+        with self._lock:
+            return sum(self._outcomes) / len(self._outcomes) if self._outcomes else 0.0
+
+    def stats(self):
+        return {'rate': round(self.rate, 3), 'concurrency': self.concurrency, 'error_rate': round(self.error_rate, 3),
+                'requests': self.requests, 'throttled': self.throttled, 'errors': self.errors}
+
+    def delay(self):
+        """Take a token: return the seconds to wait before sending the next request."""
+        wait = self.limiter.reserve()
+        with self._lock:
+            self.requests += 1
+            return max(wait, self._pause_until - self._clock())
+
+    def on_response(self, status_code, retry_after=None, attempt=0, elapsed=None):
+        """
+        Record the response of a request.
+        :param retry_after: the value of the Retry-After header
+        :param attempt: the number of retries already done
+        :param elapsed: the seconds of the request (for the metrics)
+        :return: the seconds to wait before retrying, None if the response must be returned
+        """
+        metrics.HUB_REQUESTS.inc(status=status_code)
+        if elapsed is not None:
+            metrics.HUB_REQUEST_SECONDS.observe(elapsed)
+        if status_code not in self.RETRY_STATUS:
+            self._record(error=False)
+            return None
+        self._record(error=True, throttled=status_code == 429)
+        if attempt >= self.max_retries:
+            return None
+        wait = self.backoff(attempt, parse_retry_after(retry_after))
+        if retry_after is not None:
+            with self._lock:
+                self._pause_until = max(self._pause_until, self._clock() + wait)
+        return wait
+
+    def on_error(self, attempt=0, elapsed=None):
+        """Record a connection error. :return: the seconds to wait before retrying, None if it must be raised."""
+        metrics.HUB_REQUESTS.inc(status="error")
+        if elapsed is not None:
+            metrics.HUB_REQUEST_SECONDS.observe(elapsed)
+        self._record(error=True)
+        if attempt >= self.max_retries:
+            return None
+        return self.backoff(attempt)
+
+    def backoff(self, attempt, retry_after=None):
+        """Exponential backoff with full jitter, or the Retry-After of the server (plus some jitter)."""
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff_base)
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def _record(self, error, throttled=False):
+        with self._lock:
+            self._outcomes.append(error)
+            now = self._clock()
+            if error:
+                self.errors += 1
+                self.throttled += throttled
+                self._successes = 0
+                if self._last_decrease is None or now - self._last_decrease >= self.cooldown:
+                    self._last_decrease = now
+                    self.limiter.rate = max(self.min_rate, self.limiter.rate / 2)
+                    self.concurrency = max(1, self.concurrency // 2)
+                    self.logger.warning("Docker Hub is throttling: rate {0:.2f} req/s, concurrency {1}".format(
+                        self.limiter.rate, self.concurrency))
+            else:
+                self._successes += 1
+                self.limiter.rate = min(self.max_rate, self.limiter.rate + self.max_rate / self._outcomes.maxlen)
+                if self._successes % self._outcomes.maxlen == 0:
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+            metrics.HUB_RATE.set(self.limiter.rate)
+            metrics.HUB_CONCURRENCY.set(self.concurrency)
+
+
+def parse_retry_after(value):
+    """The Retry-After header is either a number of seconds or an HTTP date. :return: seconds, None if missing"""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ThrottledSession(requests.Session):
+    """
+    requests.Session whose requests pass through a Throttle: they wait for the rate limiter, at most
+    throttle.concurrency of them are in flight, the 429/5xx responses, the connection errors and the timeouts
+    are retried.
+    With an HttpCache the GET are conditional requests and the cached 404 are not sent.
+    """
+
+    def __init__(self, throttle=None, cache=None):
+        super(ThrottledSession, self).__init__()
+        self.throttle = throttle if throttle else Throttle()
+        self.cache = cache
+        self.logger = self.throttle.logger
+        self._slots = threading.Condition()
+        self._in_flight = 0
+
+    def request(self, method, url, **kwargs):
+        if self.cache is None or method.upper() != 'GET' or kwargs.get('params') or kwargs.get('stream'):
+            return self._send(method, url, **kwargs)
+        entry = self.cache.get(url)
+        if self.cache.is_negative(entry):
+            return self._cached_response(url, 404, b'{"detail": "Not found (cached)"}')
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers.update(self.cache.validators(entry))
+        res = self._send(method, url, headers=headers, **kwargs)
+        if res.status_code == requests.codes.not_modified and entry is not None:
+            return self._cached_response(url, 200, self.cache.not_modified_body(entry), res.headers)
+        self.cache.update(url, res.status_code, res.headers, res.content)
+        return res
+
+    def _cached_response(self, url, status_code, body, headers=None):
+        res = requests.Response()
+        res.url = url
+        res.status_code = status_code
+        res.headers = requests.structures.CaseInsensitiveDict(headers or {})
+        res.encoding = 'utf-8'
+        res._content = body
+        return res
+
+    def _send(self, method, url, **kwargs):
+        attempt = 0
+        while True:
+            time.sleep(self.throttle.delay())
+            with self._slots:
+                self._slots.wait_for(lambda: self._in_flight < self.throttle.concurrency)
+                self._in_flight += 1
+            start = time.monotonic()
+            try:
+                res = super(ThrottledSession, self).request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                wait = self.throttle.on_error(attempt, elapsed=time.monotonic() - start)
+                if wait is None:
+                    raise
+            else:
+                wait = self.throttle.on_response(res.status_code, res.headers.get('Retry-After'), attempt,
+                                                 elapsed=time.monotonic() - start)
+                if wait is None:
+                    return res
+                res.close()
+            finally:
+                with self._slots:
+                    self._in_flight -= 1
+                    self._slots.notify_all()
+            attempt += 1
+            self.logger.warning("{0} {1}: retry {2} in {3:.1f}s".format(method, url, attempt, wait))
+            time.sleep(wait)
@@ -0,0 +1,49 @@
+import json
+import threading
+import http.server
+
+
+class Clock:
+    """Clock stand-in: the time is now, advanced by step at every call (0: only when now is set)."""
+
+    def __init__(self, now=0, step=0):
+        self.now = now
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+class JsonHandler(http.server.BaseHTTPRequestHandler):
+    """Base of the handlers of the local services: JSON bodies, no log lines."""
+
+    def read_json(self):
+        return json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode())
+
+    def send_json(self, body, status=200, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalServer:
+    """A service on a free port of 127.0.0.1, served by a daemon thread until close()."""
+
+    def __init__(self, handler):
+        self.server = http.server.HTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return "http://127.0.0.1:{0}{1}".format(self.server.server_port, path)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
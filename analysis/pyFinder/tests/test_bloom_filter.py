@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+from pyfinder.bloom_filter import BloomFilter, RotatingBloomFilter
+from .fakes import Clock
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_error_rate(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        names = ["user{0}/image".format(i) for i in range(1000)]
+        for name in names:
+            bloom.add(name)
+        self.assertTrue(all(name in bloom for name in names))
+        false_positives = sum("other{0}/image".format(i) in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class TestRotatingBloomFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.path = os.path.join(tempfile.mkdtemp(), "published.bloom")
+
+    def test_ttl(self):
+        recent = RotatingBloomFilter(ttl=10, capacity=100, clock=self.clock)
+        recent.add("library/nginx")
+        self.clock.now = 15
+        self.assertIn("library/nginx", recent)
+        self.clock.now = 25
+        self.assertNotIn("library/nginx", recent)
+
+    def test_persistent(self):
+        recent = RotatingBloomFilter(path_file=self.path, ttl=10, capacity=100, clock=self.clock)
+        recent.add("library/nginx")
+        recent.save()
+        self.assertIn("library/nginx", RotatingBloomFilter(path_file=self.path, ttl=10, capacity=100, clock=self.clock))
+        # a filter with a different size cannot be reused
+        self.assertNotIn("library/nginx", RotatingBloomFilter(path_file=self.path, ttl=10, capacity=50))
+
+
+if __name__ == '__main__':
+    unittest.main()
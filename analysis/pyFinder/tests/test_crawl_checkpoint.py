@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+from pyfinder import Crawler
+from pyfinder.crawl_checkpoint import CrawlCheckpoint
+
+
+class Hub:
+    """Docker Hub whose second search page is not available (the retries are exhausted)."""
+
+    def __init__(self, client_hub):
+        self.first_page = client_hub.build_search_url(page=1, page_size=2)
+
+    async def get_hub(self, url):
+        if url == self.first_page:
+            return 200, {'count': 6, 'next': "page2", 'results': [{'repo_name': "a"}, {'repo_name': "b"}]}
+        if "/tags/latest" in url:
+            return 200, {'name': "latest", 'full_size': 10}
+        return None, None
+
+
+class TestCrawlCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "crawl.db")
+
+    def test_persistent(self):
+        checkpoint = CrawlCheckpoint(path_db=self.path)
+        self.assertIsNone(checkpoint.load())
+        checkpoint.save(page=5, page_size=10, sent_images=31, max_images=100)
+        checkpoint.close()
+        self.assertEqual(CrawlCheckpoint(path_db=self.path).load(),
+                         {'page': 5, 'page_size': 10, 'sent_images': 31, 'max_images': 100, 'done': False})
+
+    def test_crawl_completed(self):
+        # all the images of the checkpoint are already sent: nothing is crawled and the crawl is done
+        crawler = Crawler(checkpoint=self.path)
+        self.assertEqual(list(crawler.crawl(from_page=11, page_size=10, max_images=100, sent_images=100)), [])
+        self.assertTrue(crawler.checkpoint.load()['done'])
+
+    def test_page_not_available(self):
+        # the crawl stops at the page not available, it is not done: --resume continues from there
+        crawler = Crawler(checkpoint=self.path)
+        crawler.client_hub_async.get_hub = Hub(crawler.client_hub_async).get_hub
+        self.assertEqual(len(list(crawler.crawl(from_page=1, page_size=2, max_images=6))), 2)
+        self.assertEqual(crawler.checkpoint.load(),
+                         {'page': 2, 'page_size': 2, 'sent_images': 2, 'max_images': 6, 'done': False})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import asyncio
+import unittest
+from pyfinder import ClientHubAsync
+from pyfinder.client_dockerhub_async import HubPageError
+
+
+class HubPages(ClientHubAsync):
+    """Docker Hub with two pages of search results, served from memory."""
+
+    def __init__(self):
+        super(HubPages, self).__init__(docker_hub_endpoint="http://hub")
+        self.requested = []
+        self.pages = {
+            self.build_search_url(page=1): {'count': 4, 'next': "http://hub/page2",
+                                            'results': [{'repo_name': "a"}, {'repo_name': "b"}]},
+            "http://hub/page2": {'count': 4, 'next': None, 'results': [{'repo_name': "c"}, {'repo_name': "d"}]},
+        }
+
+    async def get_hub(self, url):
+        self.requested.append(url)
+        if url not in self.pages:
+            return None, None    # the retries are exhausted
+        return 200, self.pages[url]
+
+
+class TestCrawlPages(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.hub = HubPages()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def crawl(self, **kwargs):
+        async def collect():
+            return [page async for page in self.hub.crawl_images(**kwargs)]
+        return self.loop.run_until_complete(collect())
+
+    def test_filter_annotates_images(self):
+        async def filter_images(image):
+            # the second page is already requested while the first one is filtered
+            await asyncio.sleep(0)
+            if image['repo_name'] in ("a", "b"):
+                self.assertIn("http://hub/page2", self.hub.requested)
+            image['full_size'] = 10
+            return image['repo_name'] != "b"
+
+        pages = self.crawl(max_images=4, filter_images=filter_images)
+        self.assertEqual([[image['repo_name'] for image in page] for page in pages], [["a"], ["c", "d"]])
+        self.assertEqual(pages[0][0]['full_size'], 10)
+
+    def test_page_step(self):
+        for page in (1, 2, 3):
+            self.hub.pages[self.hub.build_search_url(page=page, page_size=2)] = {
+                'count': 6, 'next': "next", 'results': [{'repo_name': str(page)}, {'repo_name': str(page) + "b"}]}
+        pages = self.crawl(page=1, page_size=2, max_images=6, page_step=2)
+        self.assertEqual([page[0]['repo_name'] for page in pages], ["1", "3"])
+
+    def test_max_images(self):
+        pages = self.crawl(max_images=3)
+        self.assertEqual([len(page) for page in pages], [2, 1])
+
+    def test_page_not_available(self):
+        del self.hub.pages["http://hub/page2"]
+        taken = []
+
+        async def collect():
+            async for page in self.hub.crawl_images(max_images=4):
+                taken.append(page)
+        with self.assertRaises(HubPageError):
+            self.loop.run_until_complete(collect())
+        self.assertEqual(len(taken), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import asyncio
+import unittest
+from pyfinder import ClientHubAsync
+
+
+class TestClientHubAsync(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.cHub = ClientHubAsync()
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.cHub.close())
+        self.loop.close()
+
+    def test_get_tags(self):
+        repo_name = "andoladockeradmin/ubuntu"
+        list_tags = self.loop.run_until_complete(self.cHub.get_all_tags(repo_name))
+        count_tags = self.loop.run_until_complete(self.cHub.get_num_tags(repo_name))
+        self.assertEqual(len(list_tags), count_tags)
+
+    def test_crawl_images(self):
+        max_images = 50
+
+        async def crawl():
+            num_images = 0
+            async for list_images in self.cHub.crawl_images(page=1, page_size=10, max_images=max_images):
+                num_images += len(list_images)
+            return num_images
+
+        self.assertEqual(max_images, self.loop.run_until_complete(crawl()))
+
+    def test_json_tag(self):
+        json_response = self.loop.run_until_complete(self.cHub.get_json_tag("library/nginx", tag="latest"))
+        self.assertEqual(json_response['name'], 'latest')
+
+    def test_get_repo(self):
+        json_image = self.loop.run_until_complete(self.cHub.get_json_repo("norepo/noimage"))
+        self.assertDictEqual(json_image, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
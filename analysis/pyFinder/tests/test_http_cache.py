@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from pyfinder import ClientHub
+from pyfinder.http_cache import HttpCache
+from .fakes import JsonHandler, LocalServer
+
+
+class HubHandler(JsonHandler):
+    """The tag latest of x/y has an ETag, every other repository is not found."""
+
+    requests = []
+
+    def do_GET(self):
+        HubHandler.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.path != "/v2/repositories/x/y/tags/latest":
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+        else:
+            self.send_json({'name': "latest", 'full_size': 42}, headers={'ETag': '"v1"'})
+
+
+class TestHttpCache(unittest.TestCase):
+
+    def setUp(self):
+        HubHandler.requests = []
+        self.server = LocalServer(HubHandler)
+        self.hub_url = self.server.url("")
+        self.path = os.path.join(tempfile.mkdtemp(), "hub.db")
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_conditional_request(self):
+        cache = HttpCache(self.path)
+        ClientHub(self.hub_url, cache=cache).get_json_tag("x/y")
+        cache.close()
+        cache = HttpCache(self.path)    # a new crawl
+        self.assertEqual(ClientHub(self.hub_url, cache=cache).get_json_tag("x/y")['full_size'], 42)
+        self.assertEqual(HubHandler.requests[1], ("/v2/repositories/x/y/tags/latest", '"v1"'))
+        self.assertEqual(cache.stats()['not_modified'], 1)
+
+    def test_negative_cache(self):
+        cache = HttpCache(self.path)
+        client_hub = ClientHub(self.hub_url, cache=cache)
+        self.assertEqual(client_hub.get_json_tag("x/z"), {})
+        self.assertEqual(client_hub.get_json_tag("x/z"), {})
+        self.assertEqual(len(HubHandler.requests), 1)
+        cache.flush()
+        expired = ClientHub(self.hub_url, cache=HttpCache(self.path, negative_ttl=-1))
+        expired.get_json_tag("x/z")
+        self.assertEqual(len(HubHandler.requests), 2)
+
+    def test_commit_batch(self):
+        cache = HttpCache(self.path, commit_batch=2)
+        client_hub = ClientHub(self.hub_url, cache=cache)
+        client_hub.get_json_tag("x/z")
+        self.assertIsNone(HttpCache(self.path).get(client_hub.docker_hub + "/v2/repositories/x/z/tags/latest"))   # not committed yet
+        client_hub.get_json_tag("x/w")
+        self.assertEqual(HttpCache(self.path).get(client_hub.docker_hub + "/v2/repositories/x/z/tags/latest")['status'], 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+from pyfinder import ClientHubAsync
+from pyfinder.transport import Throttle
+
+
+class Response:
+
+    status = 200
+    headers = {}
+
+    async def json(self):
+        return {'name': "latest"}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+
+class Session:
+    """aiohttp session stand-in: the first requests raise the given errors, then the responses are 200."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.requests = 0
+
+    def get(self, url, headers=None):
+        self.requests += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return Response()
+
+    async def close(self):
+        pass
+
+
+class TestHubRetries(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.client_hub = ClientHubAsync(docker_hub_endpoint="http://hub",
+                                         throttle=Throttle(rate=1000, burst=1000, max_retries=2, backoff_base=0.001))
+
+    def tearDown(self):
+        self.loop.close()
+
+    def get(self, errors):
+        async def get():
+            await self.client_hub.open()
+            await self.client_hub.session.close()
+            self.client_hub.session = Session(errors)
+            return await self.client_hub.get_hub("http://hub/v2/repositories/a/tags/latest")
+        return self.loop.run_until_complete(get())
+
+    def test_read_timeout_retried(self):
+        self.assertEqual(self.get([asyncio.TimeoutError()]), (200, {'name': "latest"}))
+        self.assertEqual(self.client_hub.session.requests, 2)
+
+    def test_retries_exhausted(self):
+        self.assertEqual(self.get([asyncio.TimeoutError()] * 3), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
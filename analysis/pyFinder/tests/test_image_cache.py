@@ -0,0 +1,82 @@
+import unittest
+from pyfinder.image_cache import ImageCache
+from .fakes import Clock
+
+
+class Daemon:
+    """Docker daemon stand-in: the images are (layers, size)."""
+
+    def __init__(self, images):
+        self.images = images
+        self.removed = []
+        self.pulled = []
+
+    def pull_image(self, repo_name, tag="latest"):
+        self.pulled.append(repo_name + ":" + tag)
+
+    def inspect_image(self, name):
+        layers, size = self.images[name]
+        return {'Id': name, 'Size': size, 'RootFS': {'Type': "layers", 'Layers': layers}}
+
+    def remove_image(self, name):
+        self.removed.append(name)
+
+
+class TestImageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = Daemon({
+            "alpine:latest": (["base"], 100),
+            "a:latest": (["base", "a"], 130),
+            "b:latest": (["base", "b"], 150),
+            "c:latest": (["base", "c"], 120),
+            "big:latest": (["big"], 1000),
+            "d:latest": (["base", "empty", "d", "empty"], 160),
+        })
+
+    def scan(self, cache, repo_name):
+        cache.acquire(repo_name)
+        cache.release(repo_name)
+
+    def test_shared_layers(self):
+        cache = ImageCache(self.daemon, budget=10000, clock=Clock(step=1))
+        for repo_name in ("alpine", "a", "b"):
+            self.scan(cache, repo_name)
+        # the layer base is counted once
+        self.assertEqual(cache.usage(), 100 + 30 + 50)
+        self.assertEqual((cache.layer_hits, cache.layer_misses), (2, 3))
+
+    def test_lru_eviction(self):
+        cache = ImageCache(self.daemon, budget=190, clock=Clock(step=1))
+        for repo_name in ("alpine", "a", "b"):
+            self.scan(cache, repo_name)
+        self.scan(cache, "a")   # a is used again: b is the least recently used
+        self.scan(cache, "c")
+        # the base alpine is evicted after the others
+        self.assertEqual(self.daemon.removed, ["b:latest"])
+        self.assertEqual(cache.usage(), 100 + 30 + 20)
+
+    def test_pinned_and_in_use(self):
+        cache = ImageCache(self.daemon, budget=500, pinned=["alpine"], clock=Clock(step=1))
+        cache.pull_pinned()
+        self.assertEqual(self.daemon.pulled, ["alpine:latest"])
+        cache.acquire("a")
+        self.scan(cache, "big")   # bigger than the budget: it is removed after its scan
+        self.assertEqual(self.daemon.removed, ["big:latest"])
+        cache.release("a")
+        self.assertEqual(self.daemon.removed, ["big:latest"])
+        self.assertEqual(cache.stats()['images'], 2)
+
+    def test_unique_bytes_freed(self):
+        cache = ImageCache(self.daemon, budget=10000, clock=Clock(step=1))
+        for repo_name in ("alpine", "d", "a"):
+            self.scan(cache, repo_name)
+        self.assertEqual(cache.usage(), 100 + 30 + 60)   # the empty layer is counted once
+        cache.budget = 140
+        self.scan(cache, "alpine")   # d is the least recently used, its layers are not in a
+        self.assertEqual(self.daemon.removed, ["d:latest"])
+        self.assertEqual(cache.usage(), 100 + 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from pyfinder import ClientImages
+from .fakes import JsonHandler, LocalServer
+
+
+class ImagesHandler(JsonHandler):
+    """Images service that records the bulk requests, answered with status."""
+
+    bulks = []
+    status = 200
+
+    def do_POST(self):
+        body = self.read_json()
+        ImagesHandler.bulks.append((self.path, [image['repo_name'] for image in body['images']]))
+        self.send_json({'count': len(body['images'])}, status=ImagesHandler.status)
+
+
+class TestImagesBuffer(unittest.TestCase):
+
+    def setUp(self):
+        ImagesHandler.bulks = []
+        ImagesHandler.status = 200
+        self.server = LocalServer(ImagesHandler)
+        self.client_images = ClientImages(images_url=self.server.url("/api/images"), batch_size=3, flush_interval=60)
+
+    def tearDown(self):
+        self.client_images.close()
+        self.server.close()
+
+    def test_bulk_when_full(self):
+        self.client_images.post_image({'repo_name': "a", 'digest': "sha256:1"})
+        self.client_images.put_image({'repo_name': "b"})
+        self.client_images.put_image({'repo_name': "a", 'digest': "sha256:2"})   # coalesced
+        self.assertEqual(ImagesHandler.bulks, [])
+        self.assertFalse(self.client_images.is_new("a"))
+        self.assertFalse(self.client_images.must_scanned("a", digest="sha256:2"))
+        self.client_images.post_image({'repo_name': "c"})
+        self.assertEqual(ImagesHandler.bulks, [("/api/images/bulk", ["b", "a", "c"])])
+
+    def test_flush_on_close(self):
+        self.client_images.post_image({'repo_name': "a"})
+        self.client_images.close()
+        self.assertEqual(ImagesHandler.bulks, [("/api/images/bulk", ["a"])])
+
+    def test_rejected_kept(self):
+        ImagesHandler.status = 500
+        for name in ["a", "b", "c"]:
+            self.client_images.post_image({'repo_name': name})
+        self.assertEqual(self.client_images.buffered_image("a"), {'repo_name': "a"})
+        ImagesHandler.status = 200
+        self.client_images.close()
+        self.assertEqual(ImagesHandler.bulks[-1], ("/api/images/bulk", ["a", "b", "c"]))
+
+    def test_service_down_kept(self):
+        self.server.close()
+        for name in ["a", "b", "c"]:
+            self.client_images.post_image({'repo_name': name})
+        self.assertEqual(self.client_images.buffered_image("c"), {'repo_name': "c"})
+
+    def test_buffer_bounded(self):
+        ImagesHandler.status = 413
+        self.client_images.max_buffered = 4
+        for name in ["a", "b", "c", "d", "e", "f"]:
+            self.client_images.post_image({'repo_name': name})
+        self.assertIsNone(self.client_images.buffered_image("a"))   # the oldest are dropped
+        self.assertIsNone(self.client_images.buffered_image("b"))
+        self.assertEqual(self.client_images.buffered_image("f"), {'repo_name': "f"})
+        ImagesHandler.status = 200
+
+
+if __name__ == '__main__':
+    unittest.main()
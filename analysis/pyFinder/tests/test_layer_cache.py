@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+from pyfinder.layer_cache import LayerCache
+
+
+class TestLayerCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "layers.db")
+        self.facts = {'files': {'usr/bin/curl': {'binary': True}}, 'opaque': []}
+
+    def test_persistent(self):
+        cache = LayerCache(path_db=self.path)
+        self.assertIsNone(cache.get("sha256:aaa"))
+        cache.put("sha256:aaa", self.facts)
+        cache.close()
+        cache = LayerCache(path_db=self.path)
+        self.assertEqual(cache.get("sha256:aaa"), self.facts)
+        self.assertEqual(cache.hits, 1)
+
+    def test_prune(self):
+        cache = LayerCache(path_db=self.path, max_layers=2)
+        for digest in ["sha256:a", "sha256:b", "sha256:c"]:
+            cache.put(digest, self.facts)
+        self.assertIsNone(cache.get("sha256:a"))
+        self.assertEqual(cache.get("sha256:c"), self.facts)
+
+    def test_prune_recently_used(self):
+        cache = LayerCache(path_db=self.path, max_layers=2)
+        cache.put("sha256:a", self.facts)
+        cache.put("sha256:b", self.facts)
+        cache.get("sha256:a")    # the last use is kept in memory, written before the prune
+        cache.put("sha256:c", self.facts)
+        self.assertIsNone(cache.get("sha256:b"))
+        self.assertEqual(cache.get("sha256:a"), self.facts)
+
+    def test_touch_batch(self):
+        cache = LayerCache(path_db=self.path, touch_batch=2)
+        cache.put("sha256:a", self.facts)
+        cache.get("sha256:a")
+        self.assertEqual(len(cache._touched), 1)
+        cache.get("sha256:a")    # the same layer: a single pending update
+        cache.put("sha256:b", self.facts)
+        self.assertEqual(cache._touched, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
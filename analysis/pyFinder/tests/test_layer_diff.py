@@ -0,0 +1,207 @@
+import unittest
+from pyfinder import Scanner, ClientImages, ClientRegistry
+from pyfinder.layer_diff import diff_layers, changed_software, runs_changed, Rescan
+from pyfinder.probe import ProbePlan
+from .fakes import JsonHandler, LocalServer
+
+SYSTEM = [('bash -c "cat /etc/*release"', '(?<=PRETTY_NAME=")[^"]*')]
+SOFTWARE = [{'name': name, 'cmd': "--version", 'regex': "[0-9.]+"} for name in ("python", "node", "curl")]
+
+
+def layer(files=None, opaque=(), executables=()):
+    return {'files': files or {}, 'opaque': list(opaque), 'executables': list(executables)}
+
+
+class Software:
+
+    def __init__(self, plan):
+        self.plan = plan
+
+    def get_probe_plan(self):
+        return self.plan
+
+
+class Registry:
+    """Registry stand-in: the manifest of the image and the facts of its layers."""
+
+    def __init__(self, layers, facts):
+        self.layers = layers
+        self.facts = facts
+
+    def get_manifest(self, repo_name, tag="latest"):
+        return "sha256:new", {'layers': [{'digest': digest} for digest in self.layers]}
+
+
+class ManifestListHandler(JsonHandler):
+    """Registry whose tag latest of app is a multi-platform image (manifest list)."""
+
+    MANIFESTS = {
+        'latest': ("sha256:list", {'mediaType': ClientRegistry.MANIFEST_LIST, 'manifests': [
+            {'digest': "sha256:arm64", 'platform': {'os': "linux", 'architecture': "arm64"}},
+            {'digest': "sha256:amd64", 'platform': {'os': "linux", 'architecture': "amd64"}}]}),
+        'sha256:amd64': ("sha256:amd64", {'mediaType': ClientRegistry.MANIFEST_V2,
+                                          'layers': [{'digest': "base"}, {'digest': "app-1"}]}),
+    }
+
+    def do_GET(self):
+        digest, manifest = self.MANIFESTS[self.path.rsplit("/", 1)[1]]
+        self.send_json(manifest, headers={'Docker-Content-Digest': digest})
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Docker-Content-Digest', self.MANIFESTS[self.path.rsplit("/", 1)[1]][0])
+        self.end_headers()
+
+
+class Daemon:
+
+    def __init__(self):
+        self.pulled = []
+        self.commands = []
+
+    def pull_image(self, repo_name, tag="latest"):
+        self.pulled.append(repo_name)
+
+    def run_capture(self, image, entrypoint, timeout=None, max_output=None, until=None):
+        self.commands.append(entrypoint)
+        return "7.1\n", "exited"
+
+
+class TestLayerDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.plan = ProbePlan(SYSTEM, SOFTWARE, version='"v1"')
+        self.previous = {'repo_name': "app", 'layers': ["base", "app-1"], 'catalog': '"v1"', 'distro': "Debian 8",
+                         'softwares': [{'software': "python", 'ver': "2.7"}, {'software': "curl", 'ver': "7.0"}]}
+
+    def test_diff_layers(self):
+        self.assertEqual(diff_layers(["base", "app-1"], ["base", "app-2"]), (["app-1"], ["app-2"]))
+        self.assertEqual(diff_layers(["base"], ["base", "app"]), ([], ["app"]))
+        self.assertEqual(diff_layers(["a", "b"], ["c", "b"]), (["a", "b"], ["c", "b"]))
+
+    def test_changed_binaries(self):
+        added = layer({'usr/local/bin/node': {'binary': True}, 'usr/bin/curl': None, 'app/main.py': None})
+        self.assertEqual(changed_software([], [added]), (False, {"node", "curl", "main.py"}))
+
+    def test_changed_release(self):
+        self.assertEqual(changed_software([], [layer({'etc/os-release': {'release': "x"}})]), (True, set()))
+        self.assertEqual(changed_software([], [layer(opaque=["usr/lib"])]), (True, set()))
+        self.assertEqual(changed_software([], [layer(opaque=["etc"])]), (True, None))   # etc/alternatives
+
+    def test_removed_bin_dir(self):
+        self.assertEqual(changed_software([layer(opaque=["usr/local"])], []), (False, None))
+
+    def test_changed_packages(self):
+        # openjdk-8-jre-headless installs java in usr/lib/jvm: the executables of the layer, not its packages
+        new = layer({'var/lib/dpkg/status': {'packages': {'openjdk-8-jre-headless': "8u111"}}},
+                    executables=["java", "libjli.so"])
+        self.assertEqual(changed_software([], [new]), (False, {"java", "libjli.so"}))
+        # a security update of a library: no probe is run again
+        new = layer({'var/lib/dpkg/status': {'packages': {'libssl1.0.0': "1.0.1t-1"}}},
+                    executables=["libssl.so.1.0.0"])
+        rescan = Rescan(self.plan, self.previous, "sha256:new", ["base", "app-2"], False,
+                        changed_software([], [new])[1])
+        self.assertFalse(rescan.probes)
+
+    def test_facts_without_executables(self):
+        # the facts cached before the executables outside the bin directories were recorded
+        self.assertEqual(changed_software([], [{'files': {}, 'opaque': []}]), (False, None))
+
+    def test_changed_symlink(self):
+        # python -> python3: the link is changed, its target is not
+        added = layer({'usr/bin/python': {'binary': True}})
+        rescan = Rescan(self.plan, self.previous, "sha256:new", ["base", "app-2"], False,
+                        changed_software([], [added])[1])
+        self.assertEqual(rescan.software, {"python"})
+        # the alternative of java (usr/bin/java -> etc/alternatives/java) is changed by update-alternatives
+        self.assertEqual(changed_software([], [layer({'etc/alternatives/java': {'alternative': True}})]),
+                         (False, {"java"}))
+        self.assertEqual(changed_software([layer(opaque=["etc/alternatives"])], []), (False, None))
+
+    def test_changed_versioned_binary(self):
+        # python is a link of the common base to python2.7
+        added = layer({'usr/bin/python2.7': {'binary': True}, 'usr/bin/python-config': {'binary': True},
+                       'usr/bin/curl-config': {'binary': True}})
+        rescan = Rescan(self.plan, self.previous, "sha256:new", ["base", "app-2"], False,
+                        changed_software([], [added])[1])
+        self.assertEqual(rescan.software, {"python"})
+        self.assertTrue(runs_changed("python", {"python3"}))
+        self.assertTrue(runs_changed("gcc", {"gcc-6"}))
+        self.assertFalse(runs_changed("node", {"nodejs"}))
+
+    def test_merge(self):
+        rescan = Rescan(self.plan, self.previous, "sha256:new", ["base", "app-2"], False, {"curl", "gcc"})
+        self.assertEqual(rescan.software, {"curl"})
+        self.assertEqual(rescan.probe_plan().commands, ["curl --version"])
+        dict_image = {'softwares': [{'software': "curl", 'ver': "7.1"}]}
+        rescan.merge(dict_image)
+        self.assertEqual(dict_image, {'distro': "Debian 8", 'softwares': [{'software': "python", 'ver': "2.7"},
+                                                                          {'software': "curl", 'ver': "7.1"}]})
+
+    def scanner(self, layers, facts):
+        scanner = Scanner(incremental=True, rmi=False, probe_timeout=0, image_timeout=0)
+        scanner.client_software = Software(self.plan)
+        scanner.client_registry = Registry(layers, facts)
+        scanner.client_daemon = Daemon()
+        scanner.client_hub.get_json_repo = lambda repo_name: {}
+        scanner.client_hub.get_json_tag = lambda repo_name, tag: {}
+        scanner.layer_facts = lambda image_name, digest: facts[digest]
+        return scanner
+
+    def test_scan_changed_probes(self):
+        scanner = self.scanner(["base", "app-2"],
+                               {'app-1': layer(), 'app-2': layer({'usr/bin/curl': {'binary': True}})})
+        dict_image = scanner.scan("app", previous=self.previous)
+        self.assertEqual(scanner.client_daemon.pulled, ["app"])
+        self.assertEqual(scanner.client_daemon.commands, ["curl --version"])
+        self.assertEqual(dict_image['softwares'], [{'software': "python", 'ver': "2.7"},
+                                                   {'software': "curl", 'ver': "7.1"}])
+        self.assertEqual(dict_image['layers'], ["base", "app-2"])
+        self.assertEqual(dict_image['catalog'], '"v1"')
+
+    def test_scan_packages_upgraded(self):
+        # apt-get upgrade of curl and of a library: only the probe of curl is run again
+        upgrade = layer({'var/lib/dpkg/status': {'packages': {'curl': "7.1", 'libssl1.0.0': "1.0.1t-1"}},
+                         'usr/bin/curl': {'binary': True}}, executables=["libssl.so.1.0.0", "libcurl.so.4.4.0"])
+        scanner = self.scanner(["base", "app-2"], {'app-1': layer(), 'app-2': upgrade})
+        scanner.scan("app", previous=self.previous)
+        self.assertEqual(scanner.client_daemon.commands, ["curl --version"])
+
+    def test_scan_nothing_changed(self):
+        scanner = self.scanner(["base", "app-2"], {'app-1': layer(), 'app-2': layer({'app/main.py': {}})})
+        dict_image = scanner.scan("app", previous=self.previous)
+        self.assertEqual(scanner.client_daemon.pulled, [])   # no probe to run: the image is not pulled
+        self.assertEqual(dict_image['softwares'], self.previous['softwares'])
+        self.assertEqual(dict_image['distro'], "Debian 8")
+
+    def test_scan_catalog_changed(self):
+        self.previous['catalog'] = '"v0"'
+        scanner = self.scanner(["base", "app-2"], {'app-1': layer(), 'app-2': layer()})
+        scanner.scan("app", previous=self.previous)
+        self.assertEqual(len(scanner.client_daemon.commands), 4)   # every probe
+
+    def test_scan_manifest_list(self):
+        server = LocalServer(ManifestListHandler)
+        self.addCleanup(server.close)
+        scanner = self.scanner([], {})
+        scanner.client_registry = ClientRegistry(registry_url=server.url(""))
+        dict_image = scanner.scan("app")
+        self.assertEqual(dict_image['digest'], "sha256:list")   # the digest of the tag, not of linux/amd64
+        self.assertEqual(dict_image['layers'], ["base", "app-1"])
+        scanner.client_images = ClientImages()
+        scanner.client_images.get_scan_state = lambda repo_name: dict_image
+        self.assertIsNone(scanner.scan_action("app"))          # not scanned again
+
+    def test_scan_action_registry_down(self):
+        server = LocalServer(ManifestListHandler)
+        server.close()
+        scanner = self.scanner([], {})
+        scanner.client_registry = ClientRegistry(registry_url=server.url(""))
+        scanner.client_hub.get_all_tags = lambda repo_name: ["latest"]
+        scanner.client_images = ClientImages()
+        scanner.client_images.get_scan_state = lambda repo_name: None
+        self.assertEqual(scanner.scan_action("app"), "post")
+
+
+if __name__ == '__main__':
+    unittest.main()
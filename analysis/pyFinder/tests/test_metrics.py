@@ -0,0 +1,51 @@
+import unittest
+import urllib.request
+from pyfinder import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_counter(self):
+        requests = metrics.Counter("hub_requests_total", "Requests", ["status"], registry=self.registry)
+        requests.inc(status=200)
+        requests.inc(2, status=429)
+        self.assertEqual(requests.value(status=200), 1)
+        self.assertRaises(ValueError, requests.inc, code=200)
+        self.assertEqual(self.registry.render(),
+                         "# HELP hub_requests_total Requests\n"
+                         "# TYPE hub_requests_total counter\n"
+                         'hub_requests_total{status="200"} 1.0\n'
+                         'hub_requests_total{status="429"} 2.0\n')
+
+    def test_histogram(self):
+        seconds = metrics.Histogram("phase_seconds", "Seconds", ["phase"], buckets=(0.1, 1), registry=self.registry)
+        seconds.observe(0.05, phase="pull")
+        seconds.observe(0.5, phase="pull")
+        seconds.observe(5, phase="pull")
+        with seconds.time(phase="write"):
+            pass
+        self.assertEqual(seconds.count(phase="write"), 1)
+        lines = self.registry.render().splitlines()
+        self.assertIn('phase_seconds_bucket{phase="pull",le="0.1"} 1', lines)
+        self.assertIn('phase_seconds_bucket{phase="pull",le="1.0"} 2', lines)
+        self.assertIn('phase_seconds_bucket{phase="pull",le="+Inf"} 3', lines)
+        self.assertIn('phase_seconds_sum{phase="pull"} 5.55', lines)
+        self.assertIn('phase_seconds_count{phase="pull"} 3', lines)
+
+    def test_server(self):
+        metrics.Gauge("hub_rate", "Rate", registry=self.registry).set(2.5)
+        server = metrics.start_server(0, host="127.0.0.1", registry=self.registry)
+        try:
+            url = "http://127.0.0.1:{0}/metrics".format(server.server_address[1])
+            body = urllib.request.urlopen(url).read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn("# TYPE hub_rate gauge\nhub_rate 2.5\n", body)
+
+
+if __name__ == '__main__':
+    unittest.main()
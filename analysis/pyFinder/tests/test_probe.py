@@ -0,0 +1,68 @@
+import subprocess
+import time
+import unittest
+from pyfinder.probe import new_marker, build_probe_script, split_probe_output, ProbePlan
+
+
+class TestProbe(unittest.TestCase):
+
+    def setUp(self):
+        self.marker = new_marker()
+        self.commands = ['python --version', 'bash -c "cat /etc/*release"', 'java -version']
+
+    def test_build_script(self):
+        script = build_probe_script(self.commands, self.marker)
+        self.assertIn("echo '" + self.marker + " 1'", script)
+        self.assertIn('python --version 2>&1', script)
+
+    def test_command_timeout(self):
+        # an interactive binary reads /dev/null, a hanging one is killed: the next commands are run
+        script = build_probe_script(['cat', 'sleep 30', 'echo 2.7.12'], self.marker, timeout=1)
+        start = time.time()
+        output = subprocess.check_output(["/bin/sh", "-c", script], stderr=subprocess.STDOUT, timeout=20).decode()
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual(split_probe_output(output, self.marker, 3), ["", "", "2.7.12\n"])
+
+    def test_split_output(self):
+        # output of a container with tty=True: \r\n line endings, java not installed
+        output = self.marker + " 0\r\nPython 3.5.2\r\n" + \
+                 self.marker + " 1\r\nPRETTY_NAME=\"Debian GNU/Linux 8 (jessie)\"\r\n" + \
+                 self.marker + " 2\r\n/bin/sh: java: not found\r\n"
+        sections = split_probe_output(output, self.marker, len(self.commands))
+        self.assertEqual(sections[0], "Python 3.5.2\n")
+        self.assertIn("jessie", sections[1])
+        self.assertIn("not found", sections[2])
+
+    def test_split_truncated_output(self):
+        output = self.marker + " 0\nPython 2.7.12\n"
+        sections = split_probe_output(output, self.marker, len(self.commands))
+        self.assertEqual(sections[0], "Python 2.7.12\n")
+        self.assertIsNone(sections[1])
+        self.assertIsNone(sections[2])
+
+
+class TestProbePlan(unittest.TestCase):
+
+    def setUp(self):
+        system = [('bash -c "cat /etc/*release"', '(?<=PRETTY_NAME=")[^"]*')]
+        software = [{'name': 'python', 'cmd': '--version', 'regex': '[0-9]*\\.[0-9]*[a-zA-Z0-9_\\.-]*'},
+                    {'name': 'node', 'cmd': '--version', 'regex': '[0-9]\\.[0-9](\\.[0-9])*[^\\s]*'}]
+        self.plan = ProbePlan(system, software, version='W/"2a-abc"')
+
+    def test_commands(self):
+        self.assertEqual(self.plan.commands, ['bash -c "cat /etc/*release"', 'python --version', 'node --version'])
+        self.assertIn('node --version 2>&1', self.plan.script)
+
+    def test_split_output(self):
+        output = self.plan.marker + " 0\nPRETTY_NAME=\"Alpine Linux v3.4\"\n" + \
+                 self.plan.marker + " 1\nPython 2.7.12\n" + \
+                 self.plan.marker + " 2\nsh: node: not found\n"
+        system_outputs, software_outputs = self.plan.split_output(output)
+        self.assertEqual(self.plan.system[0].search(system_outputs[0]), "Alpine Linux v3.4")
+        self.assertEqual(self.plan.software[0].search(software_outputs[0]), "2.7.12")
+        self.assertIsNone(self.plan.software[1].search(software_outputs[1]))
+        self.assertIsNone(self.plan.software[1].search(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
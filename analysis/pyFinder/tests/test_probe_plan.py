@@ -0,0 +1,57 @@
+import unittest
+import requests
+from pyfinder import ClientSoftware
+from .fakes import JsonHandler, LocalServer
+
+
+class SoftwareHandler(JsonHandler):
+    """Software service with a catalog of two software, version "v1"."""
+
+    requests = []
+    catalog = {'count': 2, 'software': [{'name': "python", 'cmd': "--version", 'regex': "[0-9.]+"},
+                                        {'name': "curl", 'cmd': "--version", 'regex': "[0-9.]+"}]}
+
+    def do_GET(self):
+        SoftwareHandler.requests.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+        else:
+            self.send_json(self.catalog, headers={'ETag': '"v1"'})
+
+
+class TestProbePlan(unittest.TestCase):
+
+    def setUp(self):
+        SoftwareHandler.requests = []
+        self.server = LocalServer(SoftwareHandler)
+        self.url = self.server.url("/api/software")
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_ttl(self):
+        client = ClientSoftware(api_url=self.url, plan_ttl=60)
+        plan = client.get_probe_plan()
+        self.assertEqual(plan.version, '"v1"')
+        self.assertEqual([probe.name for probe in plan.software], ["python", "curl"])
+        self.assertIs(client.get_probe_plan(), plan)
+        self.assertEqual(SoftwareHandler.requests, [None])   # revalidated only after the ttl
+
+    def test_not_modified(self):
+        client = ClientSoftware(api_url=self.url, plan_ttl=0)   # the ttl is always expired
+        plan = client.get_probe_plan()
+        self.assertIs(client.get_probe_plan(), plan)          # 304: the plan is not built again
+        self.assertEqual(SoftwareHandler.requests, [None, '"v1"'])
+
+    def test_service_down(self):
+        client = ClientSoftware(api_url=self.url, plan_ttl=0)
+        plan = client.get_probe_plan()
+        self.server.close()
+        self.assertIs(client.get_probe_plan(), plan)          # the last plan is used
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            ClientSoftware(api_url=self.url).get_probe_plan()   # no plan yet
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import pickle
+import pstats
+import shutil
+import tempfile
+import unittest
+from pyfinder.profiler import Profiler
+from .fakes import Clock
+
+
+def work():
+    return sum(i * i for i in range(1000))
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def files(self):
+        return sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else []
+
+    def test_disabled(self):
+        profiler = Profiler(directory=self.directory)
+        with profiler.profile("image", "nginx"):
+            work()
+        self.assertEqual(self.files(), [])
+
+    def test_enabled(self):
+        profiler = Profiler(directory=self.directory, enabled=True)
+        with profiler.profile("image", "library/nginx"):
+            work()
+        files = self.files()
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].startswith("image-library_nginx-"))
+        self.assertTrue(files[0].endswith(".prof"))
+        stats = pstats.Stats(os.path.join(self.directory, files[0]))
+        self.assertTrue(any(function[2] == "work" for function in stats.stats))
+
+    def test_nested(self):
+        profiler = Profiler(directory=self.directory, enabled=True)
+        with profiler.profile("image", "a"):
+            with profiler.profile("image", "a"):
+                work()
+        self.assertEqual(len(self.files()), 1)
+
+    def test_rotate(self):
+        profiler = Profiler(directory=self.directory, enabled=True, keep=3)
+        for page in range(5):
+            with profiler.profile("page", page):
+                work()
+        self.assertEqual(len(self.files()), 3)
+
+    def test_enable_for(self):
+        clock = Clock()
+        profiler = Profiler(directory=self.directory, clock=clock)
+        self.assertFalse(profiler.enabled)
+        profiler.enable_for(60)
+        clock.now = 59
+        self.assertTrue(profiler.enabled)
+        clock.now = 60
+        self.assertFalse(profiler.enabled)
+
+    def test_pickle(self):
+        profiler = pickle.loads(pickle.dumps(Profiler(directory=self.directory, enabled=True)))
+        with profiler.profile("page", 1):
+            work()
+        self.assertEqual(len(self.files()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
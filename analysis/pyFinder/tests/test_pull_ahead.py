@@ -0,0 +1,94 @@
+import threading
+import unittest
+from pyfinder.pull_ahead import PullAhead
+
+
+class DaemonStandIn:
+
+    def __init__(self):
+        self.pulled = []
+        self.started = 0
+        self.barrier = None    # the first barrier.parties pulls wait for each other (they are concurrent)
+        self._condition = threading.Condition()
+
+    def pull_image(self, repo_name, tag="latest", cancel_event=None):
+        with self._condition:
+            started = self.started
+            self.started += 1
+        if self.barrier is not None and started < self.barrier.parties:
+            self.barrier.wait()
+        with self._condition:
+            self.pulled.append(repo_name)
+            self._condition.notify_all()
+        return True
+
+    def inspect_image(self, image):
+        return {'Size': 100}
+
+    def wait_pulled(self, count, timeout=5):
+        """Wait until count images have been pulled."""
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.pulled) >= count, timeout)
+
+
+class HubStandIn:
+
+    def get_json_tag(self, repo_name, tag="latest"):
+        return {'full_size': 60}
+
+
+class WatchedCondition(threading.Condition):
+    """The condition of the puller: waiting is set as soon as a pull waits for the disk budget."""
+
+    def __init__(self):
+        super(WatchedCondition, self).__init__()
+        self.waiting = threading.Event()
+
+    def wait(self, timeout=None):
+        self.waiting.set()
+        return super(WatchedCondition, self).wait(timeout)
+
+
+class TestPullAhead(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = DaemonStandIn()
+        self.puller = PullAhead(self.daemon, HubStandIn(), workers=3, disk_budget=150,
+                                should_pull=lambda repo_name, tag: repo_name != "uptodate")
+        self.puller._condition = self.condition = WatchedCondition()
+
+    def tearDown(self):
+        self.puller.cancel_all()
+
+    def test_disk_budget(self):
+        self.daemon.barrier = threading.Barrier(2, timeout=5)
+        for repo_name in ["a", "b", "c"]:
+            self.puller.schedule(repo_name)
+        self.assertTrue(self.daemon.wait_pulled(2))
+        self.assertTrue(self.condition.waiting.wait(5))
+        self.assertEqual(len(self.daemon.pulled), 2)    # the third image waits for the budget
+        waiting = ({"a", "b", "c"} - set(self.daemon.pulled)).pop()
+        self.assertTrue(self.puller.wait(waiting))
+        self.assertEqual(len(self.daemon.pulled), 3)
+
+    def test_not_pulled(self):
+        self.puller.schedule("uptodate")
+        self.assertFalse(self.puller.wait("uptodate"))
+        self.assertEqual(self.daemon.pulled, [])
+
+    def test_cancel(self):
+        self.puller.disk_budget = 1
+        self.puller.schedule("a")
+        self.puller.schedule("b")
+        futures = [pull['future'] for pull in self.puller._pulls.values()]
+        self.assertTrue(self.daemon.wait_pulled(1))
+        self.assertTrue(self.condition.waiting.wait(5))   # the second pull waits for the budget
+        self.puller.cancel_all()
+        for future in futures:
+            future.result(5)
+        self.assertEqual(len(self.daemon.pulled), 1)      # the second pull never started
+        self.assertEqual(self.puller._reserved, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
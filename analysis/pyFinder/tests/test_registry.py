@@ -0,0 +1,89 @@
+import io
+import tarfile
+import unittest
+from pyfinder import ClientRegistry
+from pyfinder.inspector import inspect_layer, compose_layers, release_text, installed_packages, binaries
+
+
+def build_layer(files, symlinks=(), executables=()):
+    """Gzipped tarball of a layer with the files {path: content}, the paths in executables have mode 755."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        for path, content in files.items():
+            info = tarfile.TarInfo(path)
+            info.size = len(content)
+            info.mode = 0o755 if path in executables else 0o644
+            tar.addfile(info, io.BytesIO(content))
+        for path, target in symlinks:
+            info = tarfile.TarInfo(path)
+            info.type = tarfile.SYMTYPE
+            info.linkname = target
+            tar.addfile(info)
+    buffer.seek(0)
+    return buffer
+
+
+class TestInspector(unittest.TestCase):
+
+    def setUp(self):
+        self.base = inspect_layer(build_layer({
+            './etc/os-release': b'PRETTY_NAME="Debian GNU/Linux 8 (jessie)"\n',
+            './var/lib/dpkg/status': b'Package: curl\nStatus: install ok installed\nVersion: 7.38.0-4\n\n'
+                                     b'Package: nano\nStatus: deinstall ok config-files\nVersion: 2.2.6-3\n',
+            './usr/bin/curl': b'ELF',
+            './usr/share/doc/curl/README': b'not taken',
+        }))
+
+    def test_inspect_layer(self):
+        self.assertEqual(set(self.base['files'].keys()), {'etc/os-release', 'var/lib/dpkg/status', 'usr/bin/curl'})
+        self.assertEqual(self.base['files']['var/lib/dpkg/status']['packages'], {'curl': '7.38.0-4'})
+        self.assertEqual(self.base['executables'], [])
+
+    def test_alternatives(self):
+        layer = inspect_layer(build_layer({'usr/lib/jvm/java-8-openjdk-amd64/jre/bin/java': b'ELF'},
+                                          symlinks=[('etc/alternatives/java',
+                                                     '/usr/lib/jvm/java-8-openjdk-amd64/jre/bin/java'),
+                                                    ('usr/bin/java', '/etc/alternatives/java')],
+                                          executables=['usr/lib/jvm/java-8-openjdk-amd64/jre/bin/java']))
+        self.assertEqual(layer['files'], {'etc/alternatives/java': {'alternative': True},
+                                          'usr/bin/java': {'binary': True}})
+        self.assertEqual(layer['executables'], ['java'])
+        self.assertEqual(binaries(compose_layers([layer])), {'java'})
+
+    def test_compose_layers(self):
+        top = inspect_layer(build_layer({'usr/bin/.wh.curl': b'', 'usr/local/bin/python3.5': b'ELF'},
+                                        symlinks=[('usr/local/bin/python', 'python3.5')]))
+        image_files = compose_layers([self.base, top])
+        self.assertIn('jessie', release_text(image_files))
+        self.assertEqual(binaries(image_files), {'python', 'python3.5'})
+        self.assertEqual(installed_packages(image_files), {'curl': '7.38.0-4'})
+
+    def test_opaque_directory(self):
+        top = inspect_layer(build_layer({'var/lib/dpkg/.wh..wh..opq': b''}))
+        self.assertEqual(installed_packages(compose_layers([self.base, top])), {})
+
+    def test_apk_database(self):
+        layer = inspect_layer(build_layer({'lib/apk/db/installed': b'C:Q1\nP:musl\nV:1.1.14-r11\n\nP:curl\nV:7.50.1-r0\n'}))
+        self.assertEqual(installed_packages(compose_layers([layer])), {'musl': '1.1.14-r11', 'curl': '7.50.1-r0'})
+
+
+class TestClientRegistry(unittest.TestCase):
+    """Requires a local registry (docker run -d -p 5000:5000 registry:2) with the image alpine:latest pushed."""
+
+    def setUp(self):
+        self.client = ClientRegistry(registry_url="http://127.0.0.1:5000")
+
+    def test_manifest(self):
+        digest, manifest = self.client.get_manifest("alpine", "latest")
+        self.assertTrue(digest.startswith("sha256:"))
+        self.assertGreater(len(manifest['layers']), 0)
+
+    def test_inspect_alpine(self):
+        digest, manifest = self.client.get_manifest("alpine", "latest")
+        res = self.client.get_blob("alpine", manifest['layers'][0]['digest'], stream=True)
+        image_files = compose_layers([inspect_layer(res.raw)])
+        self.assertIn('Alpine', release_text(image_files))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import threading
+import unittest
+from pyfinder import ClientDaemon
+
+
+class FakeDaemon(ClientDaemon):
+    """The containers print the chunks of output, then they hang until killed if hang is True."""
+
+    def __init__(self, chunks, hang=False):
+        super(FakeDaemon, self).__init__(base_url='unix://var/run/docker.sock')
+        self.chunks = chunks
+        self.hang = hang
+        self.killed = threading.Event()
+        self.read = 0
+        self.removed = []
+
+    def create_container(self, image, entrypoint, tty=False, stdin_open=False):
+        return {'Id': "c1"}
+
+    def start(self, container):
+        pass
+
+    def logs(self, container, stream=False, follow=False):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+        if self.hang:
+            self.killed.wait(5)
+
+    def kill(self, container):
+        self.killed.set()
+
+    def remove_container(self, container, force=False):
+        self.removed.append(container)
+
+
+class TestRunCapture(unittest.TestCase):
+
+    def test_exited(self):
+        daemon = FakeDaemon([b"Python 3.", b"6.1\n"])
+        self.assertEqual(daemon.run_capture("python", "python --version"), ("Python 3.6.1\n", "exited"))
+        self.assertEqual(daemon.removed, ["c1"])
+
+    def test_timeout(self):
+        daemon = FakeDaemon([b">>> "], hang=True)
+        output, status = daemon.run_capture("python", "python", timeout=0.1)
+        self.assertEqual((output, status), (">>> ", "timeout"))
+        self.assertTrue(daemon.killed.is_set())
+        self.assertEqual(daemon.removed, ["c1"])
+
+    def test_truncated(self):
+        daemon = FakeDaemon([b"y\n" * 10] * 100, hang=True)
+        output, status = daemon.run_capture("busybox", "yes", max_output=25)
+        self.assertEqual((len(output), status), (25, "truncated"))
+        self.assertEqual(daemon.read, 2)
+
+    def test_matched(self):
+        # the regex is searched in the complete lines only: the version is not cut between two chunks
+        daemon = FakeDaemon([b"nano version 2.", b"5.3\n", b"more output\n"], hang=True)
+        output, status = daemon.run_capture("nano", "nano --version",
+                                            until=lambda output: "version 2.5.3" in output)
+        self.assertEqual((output, status), ("nano version 2.5.3\n", "matched"))
+        self.assertEqual(daemon.read, 2)
+        self.assertFalse(daemon.killed.is_set())   # removed with force
+
+
+if __name__ == '__main__':
+    unittest.main()
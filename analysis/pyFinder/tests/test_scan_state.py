@@ -0,0 +1,51 @@
+import unittest
+import urllib.parse
+from pyfinder import ClientImages
+from .fakes import JsonHandler, LocalServer
+
+
+class ImagesHandler(JsonHandler):
+    """Images service with three images, it supports the repo_name, limit and skip parameters."""
+
+    images = [{'_id': str(i), 'repo_name': name, 'last_scan': "2016-08-13T10:31:11.270Z",
+               'last_updated': "2016-07-01T14:56:07.236Z", 'digest': "sha256:" + name}
+              for i, name in enumerate(["a", "b", "c"])]
+    requests = []
+
+    def do_GET(self):
+        ImagesHandler.requests.append(self.path)
+        query = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+        images = [image for image in self.images if query.get('repo_name', image['repo_name']) == image['repo_name']]
+        skip = int(query.get('skip', 0))
+        images = images[skip:skip + int(query.get('limit', len(images)))]
+        self.send_json({'count': len(images), 'images': images})
+
+
+class TestScanState(unittest.TestCase):
+
+    def setUp(self):
+        ImagesHandler.requests = []
+        self.server = LocalServer(ImagesHandler)
+        self.client_images = ClientImages(images_url=self.server.url("/api/images/"), max_states=2)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_single_request(self):
+        self.assertTrue(self.client_images.is_new("d"))
+        self.assertFalse(self.client_images.must_scanned("a", digest="sha256:a"))
+        self.assertTrue(self.client_images.must_scanned("a", digest="sha256:new"))
+        self.assertEqual(self.client_images.get_id_image("a"), "0")
+        self.assertEqual(len(ImagesHandler.requests), 2)   # "d" and "a"
+
+    def test_warm_lru(self):
+        self.client_images.warm_scan_states(page_size=2)
+        self.assertEqual(len(ImagesHandler.requests), 1)   # max_states reached
+        self.assertEqual(self.client_images.get_scan_state("b")['digest'], "sha256:b")
+        self.client_images.get_scan_state("c")    # "a" is the least recently used
+        self.assertEqual(list(self.client_images._states), ["b", "c"])
+        self.assertEqual(self.client_images.state_hits, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+from pyfinder.sharded_crawl import ImageBudget, parse_shard, shard_images
+
+
+class TestShardedCrawl(unittest.TestCase):
+
+    def test_budget(self):
+        budget = ImageBudget(25)
+        self.assertEqual(budget.take(10), 10)
+        self.assertEqual(budget.take(10), 10)
+        self.assertEqual(budget.take(10), 5)
+        self.assertEqual(budget.take(10), 0)
+        self.assertEqual(ImageBudget(None).take(10), 10)
+
+    def test_shard_images(self):
+        self.assertEqual([shard_images(100, index, 3) for index in range(3)], [34, 33, 33])
+        self.assertIsNone(shard_images(None, 0, 3))
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("2/4"), (2, 4))
+        self.assertRaises(ValueError, parse_shard, "4/4")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+import requests
+from requests.adapters import BaseAdapter
+from pyfinder.transport import RateLimiter, Throttle, ThrottledSession, parse_retry_after
+from .fakes import Clock
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_burst_then_rate(self):
+        clock = Clock()
+        limiter = RateLimiter(rate=2, burst=2, clock=clock)
+        self.assertEqual([limiter.reserve() for _ in range(2)], [0, 0])
+        self.assertAlmostEqual(limiter.reserve(), 0.5)
+        self.assertAlmostEqual(limiter.reserve(), 1.0)
+        clock.now = 1.0
+        self.assertAlmostEqual(limiter.reserve(), 0.5)
+
+
+class TestThrottle(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.throttle = Throttle(rate=8, max_concurrency=8, max_retries=2, window=4, clock=self.clock)
+
+    def test_decrease_on_429(self):
+        wait = self.throttle.on_response(429, retry_after="3")
+        self.assertGreaterEqual(wait, 3)
+        self.assertEqual(self.throttle.rate, 4)
+        self.assertEqual(self.throttle.concurrency, 4)
+        # all the requests wait the Retry-After
+        self.assertGreaterEqual(self.throttle.delay(), 3)
+        # a burst of errors decreases the rate once per cooldown
+        self.throttle.on_response(503)
+        self.assertEqual(self.throttle.rate, 4)
+        self.assertEqual(self.throttle.stats()['throttled'], 1)
+
+    def test_increase_on_success(self):
+        self.throttle.on_response(429)
+        for _ in range(4):
+            self.assertIsNone(self.throttle.on_response(200))
+        self.assertEqual(self.throttle.rate, 8)
+        self.assertEqual(self.throttle.concurrency, 5)
+
+    def test_max_retries(self):
+        self.assertIsNotNone(self.throttle.on_error(attempt=1))
+        self.assertIsNone(self.throttle.on_response(429, attempt=2))
+        self.assertIsNone(self.throttle.on_response(404))
+
+    def test_backoff_jitter(self):
+        for attempt in range(10):
+            self.assertLessEqual(self.throttle.backoff(attempt), min(60.0, 0.5 * 2 ** attempt))
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("120"), 120)
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0)
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertIsNone(parse_retry_after(None))
+
+
+class Adapter(BaseAdapter):
+    """Transport stand-in: the first requests raise the given errors, then the responses are 200."""
+
+    def __init__(self, errors):
+        super(Adapter, self).__init__()
+        self.errors = list(errors)
+        self.requests = 0
+
+    def send(self, request, **kwargs):
+        self.requests += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        res = requests.Response()
+        res.status_code = 200
+        res.url = request.url
+        res._content = b'{}'
+        return res
+
+    def close(self):
+        pass
+
+
+class TestThrottledSession(unittest.TestCase):
+
+    def session(self, errors):
+        session = ThrottledSession(Throttle(rate=1000, burst=1000, max_retries=2, backoff_base=0.001))
+        session.mount("http://hub/", Adapter(errors))
+        return session
+
+    def test_timeout_retried(self):
+        session = self.session([requests.exceptions.ReadTimeout(), requests.exceptions.ConnectionError()])
+        self.assertEqual(session.get("http://hub/v2/repositories/a").status_code, 200)
+        self.assertEqual(session.get_adapter("http://hub/").requests, 3)
+
+    def test_retries_exhausted(self):
+        with self.assertRaises(requests.exceptions.Timeout):
+            self.session([requests.exceptions.ConnectTimeout()] * 3).get("http://hub/v2/repositories/a")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,7 +14,7 @@ app.set('port', process.env.PORT || 3000);
 app.set('env',process.env.NODE_ENV || 'production');
 
 app.use(bodyParser.urlencoded({extended: true}));
-app.use(bodyParser.json());
+app.use(bodyParser.json({limit: '10mb'}));   // the bulk requests carry many images
 app.use(bodyParser.json({type:'application/vnd.api+json'}));
 
 ///var env = process.env.NODE_ENV || 'development';
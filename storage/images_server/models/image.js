@@ -13,6 +13,9 @@ var imageSchema =  new mongoose.Schema({
     tag : String,
     last_scan:      Date,
     last_updated:   Date,  // time of the last updated of the repo in the docker hub
+    digest:         String, // digest of the manifest of the tag: it changes only if the content of the image changes
+    layers:         [String], // digests of the layers at the last scan (incremental scan)
+    catalog:        String, // version of the software catalog of the last scan (incremental scan)
     size:      Number,
     stars:     {
         type:       Number,
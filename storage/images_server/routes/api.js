@@ -7,6 +7,26 @@ var Image = require('../models/image')
 // record all the methods
 Image.methods(['get','put','post','delete']).updateOptions({ new: true });
 
+// POST /api/images/bulk  {"images": [...]}
+// insert or update a list of images in a single request, the images are matched by repo_name
+router.post('/images/bulk', function(req, res, next) {
+    var images = req.body.images;
+    if (!Array.isArray(images)) {
+        return res.status(400).json({"message": "images must be a list of images"});
+    }
+    var operations = images.map(function(image) {
+        delete image._id;
+        return {updateOne: {filter: {repo_name: image.repo_name}, update: {$set: image}, upsert: true}};
+    });
+    Image.bulkWrite(operations, {ordered: false}, function(err, result) {
+        if (err) {
+            return next(err);
+        }
+        res.json({"count": images.length, "inserted": result.upsertedCount, "updated": result.modifiedCount});
+        console.log("Bulk " + images.length + " images");
+    });
+});
+
 // GET /api/images
 Image.after('get', function(req, res, next) {
   //var tmp = res.locals.bundle.title; // Lets swap the title and year fields because we're funny!